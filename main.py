@@ -1,1240 +1,4842 @@
-"""
-AutoKaraoke v0.1
-功能：Whisper 自动歌词生成、双语对齐、自定义 Prompt、歌词打轴
-"""
-import sys
-import os
-import re
-import traceback
-import gc
-import time
-import torch
-import stable_whisper
-from multiprocessing import Process, Queue, Event
-from queue import Empty
-from PyQt6.QtWidgets import  QDoubleSpinBox # 记得添加这个
-
-# 镜像源配置
-os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
-
-try:
-    from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                                 QHBoxLayout, QPushButton, QLabel, QFileDialog,
-                                 QTextEdit, QProgressBar, QMessageBox, QComboBox,
-                                 QSplitter, QSpinBox, QDialog, QTableWidget, 
-                                 QTableWidgetItem, QHeaderView, QAbstractItemView,
-                                 QSlider, QStyle, QLineEdit)
-    from PyQt6.QtCore import Qt, QTimer, QUrl
-    from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-except ImportError:
-    print("错误: 缺少 PyQt6 库。请运行: pip install PyQt6")
-    sys.exit(1)
-
-try:
-    import faster_whisper
-    HAS_FASTER_WHISPER = True
-except ImportError:
-    HAS_FASTER_WHISPER = False
-
-# ================= 常量配置 =================
-MIN_DURATION = 0.06
-SEARCH_WINDOW = 8
-TIMEOUT_CHECK_INTERVAL = 0.5
-
-# ================= 歌词解析类 =================
-class LrcParser:
-    def __init__(self):
-        self.headers = []
-        self.lines_text = []
-        self.translations = {}
-        # 匹配制作人信息等非歌词行
-        self.credits_pattern = re.compile(
-            r"^(作|编|词|曲|演|唱|混|录|母|制|监|统|出|绘|调|和|吉|贝|鼓|弦|管|Lyr|Com|Arr|Sin|Voc|Mix|Mas|Pro|Art|Cov|Gui|Bas|Dru|Str)"
-            r".{0,40}"
-            r"([:：]|\s|-)", re.IGNORECASE
-        )
-        self.time_tag_pattern = re.compile(r'^\[\d{2}:\d{2}')
-        self.tag_content_pattern = re.compile(r'^(\[\d{2}:\d{2}.*?\])(.*)')
-        self.remove_tags_pattern = re.compile(r'\[.*?\]')
-        self.remove_html_pattern = re.compile(r'<.*?>')
-
-    def parse(self, content: str, ext: str) -> str:
-        self.headers = []
-        self.lines_text = []
-        self.translations = {}
-        
-        content = content.lstrip('\ufeff')
-        lines = content.splitlines()
-        
-        last_time_tag = None
-        current_index = -1
-        
-        for line in lines:
-            line = line.strip()
-            if not line: continue
-            
-            if line.startswith('[') and not self.time_tag_pattern.match(line):
-                self.headers.append(line)
-                continue
-            
-            match = self.tag_content_pattern.match(line)
-            text_only = ""
-            time_tag = ""
-            
-            if match:
-                time_tag = match.group(1)
-                text_content = match.group(2).strip()
-                text_only = self.remove_tags_pattern.sub('', text_content)
-                text_only = self.remove_html_pattern.sub('', text_only).strip()
-            else:
-                text_only = self.remove_tags_pattern.sub('', line).strip()
-            
-            if not text_only: continue
-            
-            if self.credits_pattern.match(text_only):
-                self.headers.append(line)
-                continue
-            
-            if time_tag and time_tag == last_time_tag and current_index >= 0:
-                if current_index not in self.translations:
-                    self.translations[current_index] = []
-                self.translations[current_index].append(text_only)
-            else:
-                self.lines_text.append(text_only)
-                current_index += 1
-                last_time_tag = time_tag
-        
-        return "\n".join(self.lines_text)
-
-class WordLevelEditor(QDialog):
-    """
-    字级精细校对窗口 (支持区间播放与自动暂停)
-    """
-    # 1. 修改初始化函数，增加 end_time_ms 参数
-    def __init__(self, audio_path, line_text, start_time_ms, end_time_ms, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("逐字精细打轴 (Enter: 打点 | Space: 播放 | ←/→: 移动)")
-        self.resize(1000, 450)
-        self.audio_path = audio_path
-        self.line_text = line_text
-        self.base_time = start_time_ms
-        self.end_time_ms = end_time_ms  # 记录本句结束时间
-        self.result_text = None
-        
-        self.tokens = self.parse_line(line_text, start_time_ms)
-        self.last_active_idx = -1
-        
-        self.player = QMediaPlayer()
-        self.audio_output = QAudioOutput()
-        self.player.setAudioOutput(self.audio_output)
-        self.player.mediaStatusChanged.connect(self.on_media_status_changed)
-        self.player.setSource(QUrl.fromLocalFile(audio_path))
-        
-        # 初始定位到该句开始前 1秒 (稍微留点预卷时间)
-        self.start_pos = max(0, self.tokens[0]['time'] - 1000 if self.tokens else start_time_ms - 1000)
-        
-        self.setup_ui()
-        
-        self.timer = QTimer(self)
-        self.timer.setInterval(50)
-        self.timer.timeout.connect(self.sync_highlight)
-        self.timer.start()
-
-    def on_media_status_changed(self, status):
-        if status == QMediaPlayer.MediaStatus.LoadedMedia or status == QMediaPlayer.MediaStatus.BufferedMedia:
-            self.player.setPosition(self.start_pos)
-
-    def parse_line(self, text, default_start):
-        clean_text = re.sub(r'^\[\d{2}:\d{2}\.\d{2,3}\]', '', text)
-        parts = re.split(r'(\[\d{2}:\d{2}\.\d{2,3}\])', clean_text)
-        tokens = []
-        current_time = default_start
-        for part in parts:
-            if not part: continue
-            if re.match(r'^\[\d{2}:\d{2}\.\d{2,3}\]$', part):
-                current_time = self.parse_time_tag(part)
-            else:
-                chars = list(part)
-                for char in chars:
-                    tokens.append({'char': char, 'time': current_time, 'edited': False})
-        return tokens
-
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-        
-        # 顶部信息栏
-        info_lay = QHBoxLayout()
-        # 显示当前校对的区间
-        range_str = f"当前区间: {self.format_ms(self.base_time)} -> {self.format_ms(self.end_time_ms)}"
-        info_lay.addWidget(QLabel(f"<b>{range_str}</b>"))
-        layout.addLayout(info_lay)
-
-        # 控制栏
-        top_lay = QHBoxLayout()
-        self.btn_play = QPushButton("播放/暂停 (Space)")
-        self.btn_play.clicked.connect(self.toggle_play)
-        
-        self.lbl_speed = QLabel("倍速:")
-        self.spin_speed = QDoubleSpinBox()
-        self.spin_speed.setRange(0.25, 2.0)
-        self.spin_speed.setSingleStep(0.1)
-        self.spin_speed.setValue(1.0)
-        self.spin_speed.setSuffix(" x")
-        self.spin_speed.valueChanged.connect(self.change_speed)
-        
-        self.lbl_time = QLabel("00:00.000")
-        self.lbl_time.setStyleSheet("font-size: 16px; font-weight: bold; color: #409eff;")
-        
-        top_lay.addWidget(self.btn_play)
-        top_lay.addWidget(self.lbl_speed)
-        top_lay.addWidget(self.spin_speed)
-        top_lay.addStretch()
-        top_lay.addWidget(self.lbl_time)
-        layout.addLayout(top_lay)
-        
-        # 表格控件
-        self.table = QTableWidget()
-        self.table.setRowCount(2)
-        self.table.setVerticalHeaderLabels(["歌词", "时间"])
-        self.table.setColumnCount(len(self.tokens))
-        self.table.horizontalHeader().setVisible(False)
-        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectColumns)
-        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
-        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
-        
-        for col, token in enumerate(self.tokens):
-            item_char = QTableWidgetItem(token['char'])
-            item_char.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            font = item_char.font()
-            font.setPointSize(20)
-            item_char.setFont(font)
-            self.table.setItem(0, col, item_char)
-            
-            time_str = self.format_ms(token['time'])
-            item_time = QTableWidgetItem(time_str)
-            item_time.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.table.setItem(1, col, item_time)
-            
-        self.table.resizeRowsToContents()
-        for i in range(self.table.columnCount()):
-            self.table.setColumnWidth(i, 60)
-            
-        self.table.cellClicked.connect(self.on_cell_clicked)
-        layout.addWidget(self.table)
-        
-        # 底部按钮
-        btn_box = QHBoxLayout()
-        btn_replay = QPushButton("⏪ 重播本句")
-        btn_replay.clicked.connect(lambda: self.player.setPosition(self.start_pos))
-        
-        btn_save = QPushButton("💾 确认并保存")
-        btn_save.setStyleSheet("background: #67c23a; color: white; font-weight: bold; padding: 10px;")
-        btn_save.clicked.connect(self.save_and_close)
-        
-        btn_cancel = QPushButton("取消")
-        btn_cancel.clicked.connect(self.reject)
-        
-        btn_box.addWidget(btn_replay)
-        btn_box.addStretch()
-        btn_box.addWidget(btn_save)
-        btn_box.addWidget(btn_cancel)
-        layout.addLayout(btn_box)
-        
-        if self.table.columnCount() > 0:
-            self.table.selectColumn(0)
-
-    def toggle_play(self):
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            self.player.pause()
-        else:
-            # 如果当前已经播放到了结束时间后面，重新从头播放
-            if self.player.position() >= self.end_time_ms:
-                self.player.setPosition(self.start_pos)
-            self.player.play()
-
-    def change_speed(self, val):
-        self.player.setPlaybackRate(val)
-
-    def keyPressEvent(self, event):
-        if event.key() == Qt.Key.Key_Space:
-            self.toggle_play()
-        elif event.key() == Qt.Key.Key_Return or event.key() == Qt.Key.Key_Enter:
-            self.stamp_current_char()
-        elif event.key() == Qt.Key.Key_Left:
-            curr = self.table.currentColumn()
-            if curr > 0: self.table.selectColumn(curr - 1)
-        elif event.key() == Qt.Key.Key_Right:
-            curr = self.table.currentColumn()
-            if curr < self.table.columnCount() - 1: self.table.selectColumn(curr + 1)
-        else:
-            super().keyPressEvent(event)
-
-    def stamp_current_char(self):
-        curr_col = self.table.currentColumn()
-        if curr_col < 0: return
-        
-        current_pos = self.player.position()
-        self.tokens[curr_col]['time'] = current_pos
-        self.tokens[curr_col]['edited'] = True
-        
-        self.table.item(1, curr_col).setText(self.format_ms(current_pos))
-        self.update_cell_color(curr_col, is_active=True)
-        
-        if curr_col < self.table.columnCount() - 1:
-            self.table.selectColumn(curr_col + 1)
-
-    def sync_highlight(self):
-        if self.player.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
-            return
-            
-        pos = self.player.position()
-        self.lbl_time.setText(self.format_ms(pos))
-        
-        # === 核心逻辑：超过本句结束时间自动暂停 ===
-        # 允许超过 200ms 的缓冲，避免听到下一句的头
-        if pos >= self.end_time_ms + 200:
-            self.player.pause()
-            self.update_play_icon()
-            return
-        # ======================================
-        
-        active_idx = -1
-        for i, token in enumerate(self.tokens):
-            if pos >= token['time']:
-                active_idx = i
-            else:
-                break
-        
-        if active_idx != self.last_active_idx:
-            if self.last_active_idx >= 0 and self.last_active_idx < self.table.columnCount():
-                self.update_cell_color(self.last_active_idx, is_active=False)
-            
-            if active_idx >= 0 and active_idx < self.table.columnCount():
-                self.update_cell_color(active_idx, is_active=True)
-                self.table.scrollToItem(self.table.item(0, active_idx))
-            
-            self.last_active_idx = active_idx
-
-    def update_cell_color(self, col, is_active):
-        token = self.tokens[col]
-        item = self.table.item(0, col)
-        if not item: return
-
-        if is_active: bg = Qt.GlobalColor.cyan
-        elif token['edited']: bg = Qt.GlobalColor.yellow
-        else: bg = Qt.GlobalColor.white
-            
-        if item.background().color() != bg:
-            item.setBackground(bg)
-
-    def update_play_icon(self):
-        # 简单的图标更新
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            self.btn_play.setText("暂停 (Space)")
-        else:
-            self.btn_play.setText("播放 (Space)")
-
-    def on_cell_clicked(self, row, col):
-        time_ms = self.tokens[col]['time']
-        self.player.setPosition(time_ms)
-        if self.player.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
-            self.player.play()
-
-    def save_and_close(self):
-        content_str = ""
-        first_time_str = f"[{self.format_ms(self.tokens[0]['time'])}]"
-        for i, token in enumerate(self.tokens):
-            t_str = f"[{self.format_ms(token['time'])}]"
-            if i == 0: content_str += token['char']
-            else: content_str += f"{t_str}{token['char']}"
-        
-        self.result_lrc_content = content_str
-        self.result_start_time = first_time_str
-        self.player.stop()
-        self.accept()
-
-    def format_ms(self, ms):
-        seconds = ms / 1000
-        return f"{int(seconds//60):02d}:{int(seconds%60):02d}.{int((seconds%1)*1000):03d}"
-
-    def parse_time_tag(self, tag):
-        try:
-            parts = tag.strip("[]").split(':')
-            return int((int(parts[0]) * 60 + float(parts[1])) * 1000)
-        except: return 0
-
-# ================= 歌词编辑器窗口 =================
-class LrcEditorDialog(QDialog):
-    def __init__(self, audio_path, lrc_content, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("歌词精细校准 - AutoKaraoke Editor")
-        self.resize(1000, 750) 
-        self.audio_path = audio_path
-        self.lrc_content = lrc_content
-        self.result_lrc = None
-        
-        self.player = QMediaPlayer()
-        self.audio_output = QAudioOutput()
-        self.player.setAudioOutput(self.audio_output)
-        
-        self.setup_ui()
-        self.load_lrc_data()
-        self.load_audio()
-        
-        self.timer = QTimer(self)
-        self.timer.setInterval(100)
-        self.timer.timeout.connect(self.update_progress)
-        self.timer.start()
-
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-        
-        help_lbl = QLabel(
-            "💡 <b>操作：</b>单击暂停选中 | 双击跳转 | Enter键同步当前行 | 空格播放/暂停"
-        )
-        help_lbl.setStyleSheet("background: #e6f7ff; padding: 10px; border: 1px solid #91d5ff;")
-        layout.addWidget(help_lbl)
-
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setHorizontalHeaderLabels(["时间戳", "歌词内容"])
-        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
-        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.table.setAlternatingRowColors(True)
-        
-        self.table.cellDoubleClicked.connect(self.seek_to_row)
-        self.table.cellPressed.connect(self.pause_on_click)
-        layout.addWidget(self.table)
-        
-        ctrl_box = QHBoxLayout()
-        self.btn_play = QPushButton()
-        self.update_play_icon()
-        self.btn_play.clicked.connect(self.toggle_play)
-        
-        self.lbl_curr = QLabel("00:00.000")
-        self.lbl_curr.setMinimumWidth(80)
-        self.slider = QSlider(Qt.Orientation.Horizontal)
-        self.slider.sliderMoved.connect(self.set_position)
-        self.slider.sliderPressed.connect(self.pause_for_seek)
-        self.slider.sliderReleased.connect(self.resume_after_seek)
-        self.lbl_total = QLabel("00:00.000")
-        
-        ctrl_box.addWidget(self.btn_play)
-        ctrl_box.addWidget(self.lbl_curr)
-        ctrl_box.addWidget(self.slider)
-        ctrl_box.addWidget(self.lbl_total)
-        layout.addLayout(ctrl_box)
-        
-        btn_box = QHBoxLayout()
-        btn_stamp = QPushButton("⏱️ 智能同步写入 (Enter)")
-        btn_stamp.setStyleSheet("background: #e6a23c; color: white; font-weight: bold;")
-        btn_stamp.clicked.connect(self.stamp_current_time)
-        
-        btn_save = QPushButton("💾 保存并关闭")
-        btn_save.setStyleSheet("background: #67c23a; color: white; font-weight: bold;")
-        btn_save.clicked.connect(self.save_lrc) 
-        
-        btn_cancel = QPushButton("取消")
-        btn_cancel.clicked.connect(self.reject) 
-        
-        btn_box.addWidget(btn_stamp)
-        btn_box.addStretch()
-        btn_box.addWidget(btn_save)
-        btn_box.addWidget(btn_cancel)
-        layout.addLayout(btn_box)
-        
-        self.table.keyPressEvent = self.table_key_event
-
-    def load_audio(self):
-        if self.audio_path and os.path.exists(self.audio_path):
-            self.player.setSource(QUrl.fromLocalFile(self.audio_path))
-            self.player.mediaStatusChanged.connect(self.on_media_status)
-    
-    def on_media_status(self, status):
-        if status == QMediaPlayer.MediaStatus.LoadedMedia:
-            duration = self.player.duration()
-            self.slider.setRange(0, duration)
-            self.lbl_total.setText(self.format_ms(duration))
-
-    def load_lrc_data(self):
-        lines = self.lrc_content.splitlines()
-        self.table.setRowCount(0)
-        pattern = re.compile(r'^(\[\d{2}:\d{2}\.\d{2,3}\])(.*)')
-        row = 0
-        for line in lines:
-            line = line.strip()
-            if not line: continue
-            match = pattern.match(line)
-            if match:
-                self.table.insertRow(row)
-                self.table.setItem(row, 0, QTableWidgetItem(match.group(1)))
-                self.table.setItem(row, 1, QTableWidgetItem(match.group(2)))
-                row += 1
-            else:
-                self.table.insertRow(row)
-                self.table.setItem(row, 0, QTableWidgetItem(""))
-                self.table.setItem(row, 1, QTableWidgetItem(line))
-                row += 1
-
-    def table_key_event(self, event):
-        if event.key() == Qt.Key.Key_Space:
-            self.toggle_play()
-        elif event.key() == Qt.Key.Key_Return or event.key() == Qt.Key.Key_Enter:
-            self.stamp_current_time()
-        else:
-            QTableWidget.keyPressEvent(self.table, event)
-
-    def toggle_play(self):
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            self.player.pause()
-        else:
-            self.player.play()
-        self.update_play_icon()
-
-    def update_play_icon(self):
-        style = self.style()
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            icon = style.standardIcon(QStyle.StandardPixmap.SP_MediaPause)
-        else:
-            icon = style.standardIcon(QStyle.StandardPixmap.SP_MediaPlay)
-        self.btn_play.setIcon(icon)
-
-    def update_progress(self):
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            pos = self.player.position()
-            self.slider.setValue(pos)
-            self.lbl_curr.setText(self.format_ms(pos))
-
-    def set_position(self, pos):
-        self.player.setPosition(pos)
-        self.lbl_curr.setText(self.format_ms(pos))
-
-    def pause_for_seek(self):
-        self.was_playing = (self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState)
-        self.player.pause()
-
-    def resume_after_seek(self):
-        if hasattr(self, 'was_playing') and self.was_playing:
-            self.player.play()
-            self.update_play_icon()
-    
-    def seek_to_row(self, row, col):
-        """
-        双击进入逐字编辑模式
-        """
-        # 获取当前行的时间和文本
-        time_item = self.table.item(row, 0)
-        text_item = self.table.item(row, 1)
-        
-        if not time_item or not text_item: return
-        
-        time_str = time_item.text()
-        text_content = text_item.text()
-        start_ms = self.parse_time_tag(time_str)
-        
-        # === 关键：计算本句的结束时间 (下一句的开始时间) ===
-        end_ms = self.player.duration() # 默认为歌曲总时长
-        next_row = row + 1
-        
-        # 寻找下一个有效的时间戳作为结束时间
-        while next_row < self.table.rowCount():
-            next_time_item = self.table.item(next_row, 0)
-            if next_time_item:
-                next_start_ms = self.parse_time_tag(next_time_item.text())
-                if next_start_ms > start_ms: # 确保下一句时间确实比这句晚
-                    end_ms = next_start_ms
-                    break
-            next_row += 1
-        # =================================================
-        
-        # 暂停主播放器
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            self.player.pause()
-            self.update_play_icon()
-            
-        # 打开逐字编辑器，传入结束时间
-        editor = WordLevelEditor(self.audio_path, text_content, start_ms, end_ms, self)
-        
-        if editor.exec():
-            # 保存逻辑 (保持不变)
-            if hasattr(editor, 'result_start_time'):
-                self.table.setItem(row, 0, QTableWidgetItem(editor.result_start_time))
-            if hasattr(editor, 'result_lrc_content'):
-                self.table.setItem(row, 1, QTableWidgetItem(editor.result_lrc_content))
-    
-    def pause_on_click(self, row, col):
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            self.player.pause()
-            self.update_play_icon()
-
-    def stamp_current_time(self):
-        current_rows = self.table.selectedItems()
-        if not current_rows: return
-        
-        row = current_rows[0].row()
-        current_pos_ms = self.player.position()
-        new_time_str = f"[{self.format_ms(current_pos_ms)}]"
-        
-        old_time_item = self.table.item(row, 0)
-        old_time_str = old_time_item.text()
-        old_start_ms = self.parse_time_tag(old_time_str)
-        
-        lyric_item = self.table.item(row, 1)
-        original_text = lyric_item.text()
-        
-        delta_ms = 0
-        if old_start_ms >= 0:
-            delta_ms = current_pos_ms - old_start_ms
-
-        # 修复首字异常空隙
-        extra_fix_ms = 0
-        first_inner_match = re.search(r'\[(\d{2}:\d{2}\.\d{2,3})\]', original_text)
-        if first_inner_match and old_start_ms >= 0:
-            old_first_inner_ms = self.parse_time_tag(f"[{first_inner_match.group(1)}]")
-            original_gap = old_first_inner_ms - old_start_ms
-            if original_gap > 1200:
-                target_gap = 300 
-                extra_fix_ms = -(original_gap - target_gap)
-
-        self.table.setItem(row, 0, QTableWidgetItem(new_time_str))
-        
-        total_shift_ms = delta_ms + extra_fix_ms
-        shifted_text = self.shift_timestamps_in_string(original_text, total_shift_ms)
-        self.table.setItem(row, 1, QTableWidgetItem(shifted_text))
-        
-        # 同步更新后续翻译行
-        next_row = row + 1
-        while next_row < self.table.rowCount():
-            next_time_item = self.table.item(next_row, 0)
-            if not next_time_item: break
-            if next_time_item.text() == old_time_str:
-                self.table.setItem(next_row, 0, QTableWidgetItem(new_time_str))
-                next_row += 1
-            else:
-                break
-        
-        if row < self.table.rowCount() - 1:
-            self.table.selectRow(row + 1)
-            self.table.scrollToItem(self.table.item(row + 1, 0))
-
-    def shift_timestamps_in_string(self, text, delta_ms):
-        def replace_func(match):
-            full_tag = match.group(0)
-            ms = self.parse_time_tag(full_tag)
-            if ms < 0: return full_tag
-            new_ms = max(0, ms + delta_ms)
-            return f"[{self.format_ms(new_ms)}]"
-        
-        pattern = re.compile(r'\[\d{2}:\d{2}\.\d{2,3}\]')
-        return pattern.sub(replace_func, text)
-
-    def save_lrc(self):
-        lines = []
-        for r in range(self.table.rowCount()):
-            t = self.table.item(r, 0).text()
-            c = self.table.item(r, 1).text()
-            lines.append(f"{t}{c}")
-        self.result_lrc = "\n".join(lines)
-        self.accept()
-    
-    def format_ms(self, ms):
-        seconds = ms / 1000
-        m = int(seconds // 60)
-        s = int(seconds % 60)
-        rem = int((seconds % 1) * 1000)
-        return f"{m:02d}:{s:02d}.{rem:03d}"
-        
-    def parse_time_tag(self, tag):
-        try:
-            clean = tag.strip("[]")
-            parts = clean.split(':')
-            return int((int(parts[0]) * 60 + float(parts[1])) * 1000)
-        except:
-            return -1
-
-    def stop_and_release(self):
-        if self.player.playbackState() != QMediaPlayer.PlaybackState.StoppedState:
-            self.player.stop()
-
-    def accept(self):
-        self.stop_and_release()
-        super().accept()
-        
-    def reject(self):
-        self.stop_and_release()
-        super().reject()
-
-    def closeEvent(self, event):
-        self.stop_and_release()
-        event.accept()
-
-# ================= 后台处理进程 =================
-def worker_process(audio_path, model_size, language, ref_text,
-                   lrc_parser_data, time_offset, initial_prompt_input, 
-                   result_queue, progress_queue, stop_event):
-    try:
-        parser = LrcParser()
-        parser.headers = lrc_parser_data.get('headers', [])
-        parser.lines_text = lrc_parser_data.get('lines_text', [])
-        parser.translations = lrc_parser_data.get('translations', {})
-        
-        def get_attr(obj, key, default=None):
-            if isinstance(obj, dict): return obj.get(key, default)
-            return getattr(obj, key, default)
-        
-        def format_time(seconds):
-            final_sec = max(0, float(seconds) + time_offset)
-            m = int(final_sec // 60)
-            s = int(final_sec % 60)
-            ms = int((final_sec % 1) * 1000)
-            return f"{m:02d}:{s:02d}.{ms:03d}"
-        
-        def clean_token(text):
-            return re.sub(r'[^\w\u4e00-\u9fa5\u3040-\u309f\u30a0-\u30ff]', '', text).lower()
-        
-        def preprocess_cjk_spaces(text):
-            if not text: return text
-            pattern = r'([\u4e00-\u9fa5\u3040-\u309f\u30a0-\u30ff])'
-            spaced = re.sub(pattern, r' \1 ', text)
-            return re.sub(r'\s+', ' ', spaced).strip()
-        
-        def reconstruct_lrc_smart(result):
-            output_lines = []
-            for h in parser.headers: output_lines.append(h)
-            if parser.headers: output_lines.append("")
-            
-            # 无参考文本：直接转录
-            if not parser.lines_text:
-                segments = get_attr(result, 'segments', [])
-                if not segments:
-                    try: segments = list(result)
-                    except: pass
-                for seg in segments:
-                    if stop_event.is_set(): return ""
-                    start = get_attr(seg, 'start', 0)
-                    text = get_attr(seg, 'text', '').strip()
-                    if text: output_lines.append(f"[{format_time(start)}]{text}")
-                return "\n".join(output_lines)
-            
-            # 有参考文本：双语对齐逻辑
-            progress_queue.put("正在执行双语防撞对齐...")
-            ai_words_pool = []
-            segments = get_attr(result, 'segments', [])
-            if not segments:
-                try: segments = list(result)
-                except: pass
-            
-            for seg in segments:
-                words = get_attr(seg, 'words', [])
-                if words: ai_words_pool.extend(words)
-            
-            pool_cursor = 0
-            total_ai_words = len(ai_words_pool)
-            last_valid_time = 0.0
-            
-            for i, target_line in enumerate(parser.lines_text):
-                if stop_event.is_set(): return ""
-                
-                line_tokens = []
-                token_iter = re.finditer(r'([a-zA-Z0-9\']+|[\u4e00-\u9fa5\u3040-\u309f\u30a0-\u30ff])', target_line)
-                last_end_idx = 0
-                
-                for match in token_iter:
-                    pre_text = target_line[last_end_idx:match.start()].replace("\n", "")
-                    token_text = match.group()
-                    last_end_idx = match.end()
-                    
-                    matched_time = None
-                    user_clean = clean_token(token_text)
-                    
-                    for offset in range(SEARCH_WINDOW):
-                        if pool_cursor + offset >= total_ai_words: break
-                        ai_w_obj = ai_words_pool[pool_cursor + offset]
-                        ai_text = get_attr(ai_w_obj, 'word', "")
-                        ai_clean = clean_token(ai_text)
-                        
-                        if user_clean and ai_clean and (user_clean in ai_clean or ai_clean in user_clean):
-                            w_start = get_attr(ai_w_obj, 'start', 0.0)
-                            if w_start >= last_valid_time:
-                                matched_time = w_start
-                                pool_cursor = pool_cursor + offset + 1
-                            break
-                    
-                    line_tokens.append({"text": token_text, "pre": pre_text, "time": matched_time})
-                
-                count = len(line_tokens)
-                if count == 0:
-                    output_lines.append(target_line)
-                    continue
-                
-                # 插值补全
-                for k in range(count):
-                    if line_tokens[k]["time"] is None:
-                        prev_time = last_valid_time
-                        for j in range(k - 1, -1, -1):
-                            if line_tokens[j]["time"] is not None:
-                                prev_time = line_tokens[j]["time"]
-                                break
-                        next_time = None
-                        steps = 1
-                        for j in range(k + 1, count):
-                            steps += 1
-                            if line_tokens[j]["time"] is not None:
-                                next_time = line_tokens[j]["time"]
-                                break
-                        
-                        if next_time is not None:
-                            gap = (next_time - prev_time) / steps
-                            gap = max(MIN_DURATION, min(gap, 0.15))
-                            line_tokens[k]["time"] = prev_time + gap
-                        else:
-                            line_tokens[k]["time"] = prev_time + 0.15
-                
-                line_str = ""
-                effective_start_time = None
-                
-                for k, item in enumerate(line_tokens):
-                    t = item["time"]
-                    if t < last_valid_time + MIN_DURATION: t = last_valid_time + MIN_DURATION
-                    last_valid_time = t
-                    if k == 0: effective_start_time = t
-                    
-                    if k == 0 and item["pre"].strip():
-                        line_str += f"[{format_time(t)}]{item['pre']}{item['text']}"
-                    else:
-                        line_str += f"{item['pre']}[{format_time(t)}]{item['text']}"
-                
-                line_str += target_line[last_end_idx:]
-                output_lines.append(line_str)
-                
-                # 挂载翻译
-                if i in parser.translations:
-                    final_time = effective_start_time if effective_start_time is not None else last_valid_time
-                    for trans_text in parser.translations[i]:
-                        output_lines.append(f"[{format_time(final_time)}]{trans_text}")
-            
-            return "\n".join(output_lines)
-        
-        def clear_vram(model):
-            try:
-                if model:
-                    if hasattr(model, 'to'): model.to("cpu")
-                    del model
-            except: pass
-            gc.collect()
-            if torch.cuda.is_available(): torch.cuda.empty_cache()
-        
-        # --- 进程主逻辑 ---
-        current_dir = os.getcwd()
-        local_model_path = os.path.join(current_dir, "models")
-        os.makedirs(local_model_path, exist_ok=True)
-        
-        is_cuda = torch.cuda.is_available()
-        device = "cuda" if is_cuda else "cpu"
-        progress_queue.put(f"⚙️ 运行设备: {device.upper()}")
-
-        model = None
-        try:
-            use_faster = False
-            # 优先加载 Faster-Whisper
-            if HAS_FASTER_WHISPER and not stop_event.is_set():
-                progress_queue.put(f"🚀 加载 Faster-Whisper ({model_size})...")
-                try:
-                    model = stable_whisper.load_faster_whisper(
-                        model_size, download_root=local_model_path, device=device,
-                        compute_type="float16" if device=="cuda" else "int8"
-                    )
-                    use_faster = True
-                except Exception as fw_error:
-                    print(f"Faster-Whisper 加载失败: {fw_error}")
-                    model = None
-            
-            # 回退标准模型
-            if not model and not stop_event.is_set():
-                progress_queue.put(f"加载标准模型 ({model_size})...")
-                model = stable_whisper.load_model(model_size, download_root=local_model_path, device=device)
-            
-            lang_param = language if language != "Auto (混合)" else None
-            
-            # 自动检测语言
-            if ref_text and not lang_param and not stop_event.is_set():
-                progress_queue.put("正在检测语言...")
-                try:
-                    if use_faster:
-                        lang_param = "ja" 
-                    else:
-                        import whisper
-                        audio = whisper.load_audio(audio_path)
-                        audio = whisper.pad_or_trim(audio)
-                        mel = whisper.log_mel_spectrogram(audio).to(model.device)
-                        _, probs = model.detect_language(mel)
-                        lang_param = max(probs, key=probs.get)
-                except:
-                    lang_param = "ja"
-            
-            if lang_param is None and ref_text: lang_param = "ja"
-            
-            result = None
-            if stop_event.is_set():
-                result_queue.put(("aborted", None))
-                return
-            
-            if ref_text and ref_text.strip():
-                progress_queue.put("正在进行【结构化强制对齐】...")
-                spaced_ref_text = preprocess_cjk_spaces(ref_text)
-                result = model.align(audio_path, spaced_ref_text, language=lang_param, regroup=False)
-            else:
-                progress_queue.put("正在进行语音识别...")
-                transcribe_args = {"language": lang_param, "word_timestamps": True, "vad": True, "regroup": False}
-                if initial_prompt_input and initial_prompt_input.strip():
-                    transcribe_args["initial_prompt"] = initial_prompt_input.strip()
-                if use_faster:
-                    transcribe_args["beam_size"] = 5
-                
-                result = model.transcribe(audio_path, **transcribe_args)
-            
-            if stop_event.is_set():
-                result_queue.put(("aborted", None))
-                return
-            
-            progress_queue.put("正在合成结果...")
-            lrc_content = reconstruct_lrc_smart(result)
-            
-            if stop_event.is_set():
-                result_queue.put(("aborted", None))
-            else:
-                result_queue.put(("success", lrc_content))
-        
-        except torch.cuda.OutOfMemoryError:
-            result_queue.put(("error", "❌ 显存不足！请尝试更小的模型"))
-        except Exception as e:
-            if not stop_event.is_set():
-                traceback.print_exc()
-                result_queue.put(("error", f"错误: {str(e)}"))
-        finally:
-            clear_vram(model)
-            
-    except Exception as e:
-        result_queue.put(("error", f"进程错误: {str(e)}"))
-
-# ================= 主程序界面 =================
-class LyricsGenApp(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("AutoKaraoke 0.1")
-        self.resize(1100, 900)
-        self.lrc_parser = LrcParser()
-        self.audio_path = None
-        self.worker_process = None
-        self.result_queue = None
-        self.progress_queue = None
-        self.stop_event = None
-        self.check_timer = None
-        self.setup_ui()
-    
-    def setup_ui(self):
-        self.setStyleSheet("""
-            QMainWindow { background-color: #f5f7fa; }
-            QLabel { font-family: 'Microsoft YaHei'; color: #333; font-size: 13px; }
-            QTextEdit { background: white; border: 1px solid #dcdfe6; border-radius: 6px; padding: 10px; font-family: Consolas; font-size: 14px; }
-            QLineEdit { background: white; border: 1px solid #dcdfe6; border-radius: 4px; padding: 5px; }
-            QPushButton { background-color: #409eff; color: white; border-radius: 6px; padding: 8px 15px; font-weight: bold; }
-            QPushButton:hover { background-color: #66b1ff; }
-            QPushButton:disabled { background-color: #c0c4cc; color: #909399; }
-            QComboBox, QSpinBox { padding: 5px; border: 1px solid #dcdfe6; background: white; border-radius: 4px; }
-            QProgressBar { border: 1px solid #dcdfe6; border-radius: 4px; text-align: center; }
-            QProgressBar::chunk { background-color: #409eff; width: 20px; }
-        """)
-        
-        central = QWidget()
-        self.setCentralWidget(central)
-        layout = QVBoxLayout(central)
-        layout.setSpacing(10)
-        
-        status_text = "<span style='color:green'>⚡ 加速模式</span>" if HAS_FASTER_WHISPER else "<span>标准模式</span>"
-        layout.addWidget(QLabel(f"<h2>AutoKaraoke 0.1 {status_text}</h2>"), alignment=Qt.AlignmentFlag.AlignCenter)
-        
-        # 文件选择
-        file_box = QHBoxLayout()
-        self.path_lbl = QLabel("🚫 尚未选择音频文件")
-        self.path_lbl.setStyleSheet("background: white; padding: 8px; border: 1px dashed #ccc; border-radius: 4px;")
-        btn_aud = QPushButton("📂 选择歌曲")
-        btn_aud.clicked.connect(self.select_audio)
-        file_box.addWidget(self.path_lbl, 4)
-        file_box.addWidget(btn_aud, 1)
-        layout.addLayout(file_box)
-        
-        # 设置区域
-        set_box = QHBoxLayout()
-        self.model_combo = QComboBox()
-        self.model_combo.addItems(["tiny", "base", "small", "medium", "large-v2", "large-v3"])
-        self.model_combo.setCurrentText("large-v2")
-        self.lang_combo = QComboBox()
-        self.lang_combo.addItems(["Auto (混合)", "zh", "en", "ja", "ko", "yue"])
-        self.lang_combo.setCurrentText("ja")
-        self.lang_combo.currentTextChanged.connect(self.update_prompt_defaults)
-        
-        set_box.addWidget(QLabel("AI模型:"))
-        set_box.addWidget(self.model_combo)
-        set_box.addWidget(QLabel("语言:"))
-        set_box.addWidget(self.lang_combo)
-        set_box.addWidget(QLabel("⏱️ 整体偏移:"))
-        self.offset_spin = QSpinBox()
-        self.offset_spin.setRange(-10000, 10000)
-        self.offset_spin.setSuffix(" ms")
-        self.offset_spin.setValue(0)
-        set_box.addWidget(self.offset_spin)
-        set_box.addStretch()
-        layout.addLayout(set_box)
-        
-        # Prompt区域
-        prompt_box = QHBoxLayout()
-        prompt_box.addWidget(QLabel("提示词 (Prompt):"))
-        self.prompt_input = QLineEdit()
-        self.prompt_input.setPlaceholderText("可引导模型生成风格 (留空则使用默认)")
-        self.update_prompt_defaults(self.lang_combo.currentText())
-        prompt_box.addWidget(self.prompt_input)
-        layout.addLayout(prompt_box)
-        
-        # 分割区域
-        splitter = QSplitter(Qt.Orientation.Horizontal)
-        
-        # 左侧输入
-        left = QWidget()
-        l_lay = QVBoxLayout(left)
-        h_lay = QHBoxLayout()
-        h_lay.addWidget(QLabel("<b>📝 歌词底稿</b>"))
-        btn_imp = QPushButton("📂 导入 LRC/TXT")
-        btn_imp.setStyleSheet("background:#e6a23c; color: white;")
-        btn_imp.clicked.connect(self.import_lrc)
-        btn_clr = QPushButton("🗑️ 清空")
-        btn_clr.setStyleSheet("background:#f56c6c; color: white;")
-        btn_clr.clicked.connect(lambda: self.input_txt.clear())
-        h_lay.addWidget(btn_imp)
-        h_lay.addWidget(btn_clr)
-        h_lay.addStretch()
-        l_lay.addLayout(h_lay)
-        self.input_txt = QTextEdit()
-        self.input_txt.setPlaceholderText("在此粘贴包含时间戳的LRC...\n第一行为原文，后续相同时间戳的行为翻译。")
-        l_lay.addWidget(self.input_txt)
-        splitter.addWidget(left)
-        
-        # 右侧输出
-        right = QWidget()
-        r_lay = QVBoxLayout(right)
-        r_head_lay = QHBoxLayout()
-        r_head_lay.addWidget(QLabel("<b>✅ 生成结果</b>"))
-        self.btn_cali = QPushButton("🛠️ 手动校准/编辑")
-        self.btn_cali.setStyleSheet("background: #909399; color: white;")
-        self.btn_cali.clicked.connect(self.open_calibration)
-        self.btn_cali.setEnabled(False)
-        r_head_lay.addStretch()
-        r_head_lay.addWidget(self.btn_cali)
-        r_lay.addLayout(r_head_lay)
-        self.out_txt = QTextEdit()
-        self.out_txt.setStyleSheet("background:#f0f9eb; color: #333;")
-        self.out_txt.setReadOnly(True)
-        r_lay.addWidget(self.out_txt)
-        splitter.addWidget(right)
-        layout.addWidget(splitter, 1)
-        
-        # 底部控制
-        btm = QHBoxLayout()
-        self.btn_run = QPushButton("🚀 开始生成")
-        self.btn_run.clicked.connect(self.start)
-        self.btn_run.setMinimumHeight(35)
-        self.btn_stop = QPushButton("⏹️ 停止")
-        self.btn_stop.setStyleSheet("background:#f56c6c; color: white;")
-        self.btn_stop.clicked.connect(self.stop)
-        self.btn_stop.setEnabled(False)
-        self.btn_stop.setMinimumHeight(35)
-        btm.addWidget(self.btn_run, 2)
-        btm.addWidget(self.btn_stop, 1)
-        layout.addLayout(btm)
-        
-        # 状态栏
-        stat = QHBoxLayout()
-        self.status = QLabel("就绪")
-        self.pbar = QProgressBar()
-        self.pbar.setTextVisible(False)
-        self.pbar.setMaximumHeight(10)
-        self.pbar.hide()
-        stat.addWidget(self.status)
-        stat.addWidget(self.pbar)
-        stat.addStretch()
-        stat.addWidget(QLabel("保存编码:"))
-        self.enc_combo = QComboBox()
-        self.enc_combo.addItems(["utf-8", "gbk", "utf-8-sig"])
-        stat.addWidget(self.enc_combo)
-        btn_save = QPushButton("💾 保存结果")
-        btn_save.clicked.connect(self.save)
-        stat.addWidget(btn_save)
-        layout.addLayout(stat)
-
-    def update_prompt_defaults(self, lang_text):
-        defaults = {
-            "zh": "这是一首语速很快的Vocaloid中文歌曲。",
-            "ja": "这是一首日语歌曲。",
-            "en": "This is a pop song.",
-            "yue": "这是一首粤语歌曲。",
-            "ko": "This is a Korean song."
-        }
-        self.prompt_input.setText(defaults.get(lang_text, ""))
-
-    def check_queue(self):
-        if self.worker_process and not self.worker_process.is_alive():
-            self.on_aborted()
-            self.cleanup_worker()
-            return
-        while True:
-            try:
-                progress_msg = self.progress_queue.get_nowait()
-                self.status.setText(progress_msg)
-            except Empty: break
-        try:
-            result_type, result_data = self.result_queue.get_nowait()
-            if result_type == "success": self.on_done(result_data)
-            elif result_type == "error": self.on_error(result_data)
-            elif result_type == "aborted": self.on_aborted()
-            self.cleanup_worker()
-        except Empty: pass
-
-    def select_audio(self):
-        f, _ = QFileDialog.getOpenFileName(self, "选择音频", "", "Audio Files (*.mp3 *.wav *.flac *.m4a *.ogg)")
-        if f:
-            self.audio_path = f
-            self.path_lbl.setText(f"🎵 {os.path.basename(f)}")
-            self.status.setText("音频已加载")
-            if self.out_txt.toPlainText().strip(): self.btn_cali.setEnabled(True)
-
-    def import_lrc(self):
-        f, _ = QFileDialog.getOpenFileName(self, "导入歌词", "", "Lrc/Txt/Srt (*.lrc *.txt *.srt)")
-        if not f: return
-        try:
-            raw = ""
-            for enc in ['utf-8', 'gbk', 'utf-8-sig', 'big5']:
-                try:
-                    with open(f, 'r', encoding=enc) as file: raw = file.read(); break
-                except: continue
-            
-            ext = os.path.splitext(f)[1].lower()
-            clean_text = self.lrc_parser.parse(raw, ext)
-            self.input_txt.setText(clean_text)
-            self.status.setText(f"导入成功: {os.path.basename(f)}")
-        except Exception as e:
-            QMessageBox.warning(self, "导入错误", str(e))
-
-    def start(self):
-        if not self.audio_path: return QMessageBox.warning(self, "提示", "请先选择音频文件")
-        self.btn_run.setEnabled(False)
-        self.btn_stop.setEnabled(True)
-        self.model_combo.setEnabled(False)
-        self.btn_cali.setEnabled(False)
-        self.pbar.show()
-        self.pbar.setRange(0, 0)
-        
-        txt = self.input_txt.toPlainText()
-        prompt_text = self.prompt_input.text()
-        
-        lrc_parser_data = {'headers': self.lrc_parser.headers, 'lines_text': self.lrc_parser.lines_text, 'translations': self.lrc_parser.translations}
-        
-        self.result_queue = Queue()
-        self.progress_queue = Queue()
-        self.stop_event = Event()
-        
-        self.worker_process = Process(
-            target=worker_process,
-            args=(self.audio_path, self.model_combo.currentText(), self.lang_combo.currentText(),
-                  txt, lrc_parser_data, self.offset_spin.value()/1000.0,
-                  prompt_text,
-                  self.result_queue, self.progress_queue, self.stop_event)
-        )
-        self.worker_process.start()
-        self.check_timer = QTimer()
-        self.check_timer.timeout.connect(self.check_queue)
-        self.check_timer.start(int(TIMEOUT_CHECK_INTERVAL * 1000))
-
-    def stop(self):
-        if self.worker_process and self.worker_process.is_alive():
-            self.status.setText("正在请求停止...")
-            self.stop_event.set()
-            self.worker_process.terminate()
-
-    def cleanup_worker(self):
-        if self.check_timer: self.check_timer.stop(); self.check_timer = None
-        if self.worker_process:
-            if self.worker_process.is_alive(): self.worker_process.terminate()
-            self.worker_process.join(timeout=1)
-            self.worker_process = None
-        self.result_queue = None
-        self.progress_queue = None
-        self.stop_event = None
-
-    def on_done(self, lrc: str):
-        self.btn_run.setEnabled(True)
-        self.btn_stop.setEnabled(False)
-        self.model_combo.setEnabled(True)
-        self.btn_cali.setEnabled(True)
-        self.pbar.hide()
-        self.out_txt.setText(lrc)
-        self.status.setText("✅ 任务完成")
-
-    def on_aborted(self):
-        self.btn_run.setEnabled(True)
-        self.btn_stop.setEnabled(False)
-        self.model_combo.setEnabled(True)
-        self.pbar.hide()
-        self.status.setText("🛑 任务已停止")
-
-    def on_error(self, error_msg: str):
-        self.btn_run.setEnabled(True)
-        self.btn_stop.setEnabled(False)
-        self.model_combo.setEnabled(True)
-        self.pbar.hide()
-        self.status.setText("❌ 任务失败")
-        QMessageBox.critical(self, "错误", error_msg)
-
-    def open_calibration(self):
-        if not self.audio_path: return QMessageBox.warning(self, "提示", "没有加载音频文件")
-        content = self.out_txt.toPlainText()
-        if not content: return QMessageBox.warning(self, "提示", "没有歌词内容")
-        
-        dialog = LrcEditorDialog(self.audio_path, content, self)
-        if dialog.exec():
-            if dialog.result_lrc:
-                self.out_txt.setText(dialog.result_lrc)
-                self.status.setText("✅ 校准已应用")
-
-    def save(self):
-        txt = self.out_txt.toPlainText()
-        if not txt: return
-        default = os.path.splitext(os.path.basename(self.audio_path))[0] + ".lrc" if self.audio_path else "out.lrc"
-        f, _ = QFileDialog.getSaveFileName(self, "保存歌词", default, "LRC (*.lrc)")
-        if f:
-            try:
-                with open(f, 'w', encoding=self.enc_combo.currentText()) as file: file.write(txt)
-                self.status.setText(f"💾 已保存: {os.path.basename(f)}")
-            except Exception as e:
-                QMessageBox.critical(self, "保存失败", str(e))
-
-    def closeEvent(self, event):
-        if self.worker_process and self.worker_process.is_alive():
-            reply = QMessageBox.question(self, '确认退出', '后台任务正在运行，确定要退出吗？', 
-                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, 
-                                         QMessageBox.StandardButton.No)
-            if reply == QMessageBox.StandardButton.Yes:
-                self.stop()
-                time.sleep(0.5)
-                self.cleanup_worker()
-                event.accept()
-            else: event.ignore()
-        else: event.accept()
-
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    try: app.setAttribute(Qt.ApplicationAttribute.AA_UseHighDpiPixmaps)
-    except: pass
-    window = LyricsGenApp()
-    window.show()
+"""
+AutoKaraoke v0.1
+功能：Whisper 自动歌词生成、双语对齐、自定义 Prompt、歌词打轴
+"""
+import sys
+import os
+import re
+import traceback
+import gc
+import time
+import json
+from contextlib import contextmanager
+import hashlib
+import bisect
+import io
+import wave
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import subprocess
+import difflib
+import platform
+import importlib
+import importlib.util
+import threading
+import psutil
+from collections import OrderedDict
+import numpy as np
+from multiprocessing import Process, Queue, Event, Pipe, Pool, shared_memory, resource_tracker
+from PyQt6.QtWidgets import  QDoubleSpinBox # 记得添加这个
+
+# 镜像源配置
+os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
+
+try:
+    from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
+                                 QHBoxLayout, QPushButton, QLabel, QFileDialog,
+                                 QTextEdit, QProgressBar, QMessageBox, QComboBox,
+                                 QSplitter, QSpinBox, QDialog, QTableWidget, 
+                                 QTableWidgetItem, QHeaderView, QAbstractItemView,
+                                 QSlider, QStyle, QLineEdit, QCheckBox, QTableView)
+    from PyQt6.QtCore import (Qt, QTimer, QUrl, QThread, pyqtSignal,
+                              QAbstractTableModel, QModelIndex, QLineF, QBuffer, QByteArray)
+    from PyQt6.QtGui import QColor, QPainter, QPen
+    from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+except ImportError:
+    print("错误: 缺少 PyQt6 库。请运行: pip install PyQt6")
+    sys.exit(1)
+
+# torch / stable-ts / faster-whisper 导入需要数秒，界面进程不导入，只在工作进程中由 load_ml_stack 加载
+torch = None
+stable_whisper = None
+faster_whisper = None
+HAS_FASTER_WHISPER = importlib.util.find_spec("faster_whisper") is not None
+ML_IMPORT_SECONDS = None
+
+def load_ml_stack():
+    """在工作进程中导入机器学习依赖 (每个进程只导入一次)，返回导入耗时 (秒)"""
+    global torch, stable_whisper, faster_whisper, HAS_FASTER_WHISPER, ML_IMPORT_SECONDS
+    if ML_IMPORT_SECONDS is not None: return ML_IMPORT_SECONDS
+    started = time.perf_counter()
+    torch = importlib.import_module("torch")
+    stable_whisper = importlib.import_module("stable_whisper")
+    try:
+        faster_whisper = importlib.import_module("faster_whisper")
+        HAS_FASTER_WHISPER = True
+    except ImportError:
+        HAS_FASTER_WHISPER = False
+    ML_IMPORT_SECONDS = time.perf_counter() - started
+    return ML_IMPORT_SECONDS
+
+# ================= 常量配置 =================
+MIN_DURATION = 0.06
+MAX_INTERP_GAP = 0.15         # 插值补全时相邻两字的最大间隔 (秒)
+SAMPLE_RATE = 16000
+CHUNK_MAX_SEC = 60.0          # 分块模式下单块最长时长
+CHUNK_MIN_SEC = 15.0          # 分块模式下单块最短时长
+LANG_DETECT_WINDOWS = 5       # 语言检测时采样的 30 秒窗口数
+WAVEFORM_BLOCK = 64           # 波形金字塔最精细一层每个峰值覆盖的采样数 (16kHz 下 4ms)
+WAVEFORM_MIN_PEAKS = 256      # 波形金字塔最粗一层保留的峰值数下限
+VOCAL_METHODS = ('off', 'center', 'hpss')
+VOCAL_N_FFT = 1024            # 人声分离的 STFT 窗长 (16kHz 下 64ms)
+VOCAL_HOP = 256
+VOCAL_MEDIAN = 17             # HPSS 中值滤波的长度 (帧/频点)
+VOCAL_CHUNK = SAMPLE_RATE * 10    # 流式处理每块的采样数，内存占用与歌曲长度无关
+VOCAL_MARGIN = 4096           # 每块两侧额外读取的上下文采样数 (>= 中值滤波半径 * hop + 窗长)
+LINE_CLIP_PREROLL_MS = 1000   # 逐字编辑片段在行首之前预留的时间
+LINE_CLIP_TAIL_MS = 600       # 逐字编辑片段在行尾之后多截取的时间 (需大于自动暂停的 200ms 缓冲)
+LINE_CLIP_CACHE_SIZE = 8      # 内存中保留的逐字编辑片段数
+ALIGN_BAND = 64               # 全局对齐带宽：每个参考词允许偏离对角线的 AI 词数
+ALIGN_MATCH_SCORE = 2.0
+ALIGN_MISMATCH_SCORE = -1.0
+ALIGN_GAP_SCORE = -1.0
+ALIGN_ANCHOR_NGRAM = 3        # 对齐锚点：参考与识别结果中都只出现一次的连续词数
+INCREMENTAL_MAX_RATIO = 0.5   # 改动行超过该比例时不做增量，整首重新对齐
+INCREMENTAL_MIN_SEC = 0.2     # 短于该时长的改动区间不送入模型，直接插值
+STREAM_WINDOW_SEC = 240       # 流式模式每个窗口负责的时长
+STREAM_OVERLAP_SEC = 10       # 相邻窗口的重叠时长，交接点取重叠区中线
+MODEL_CACHE_SIZE = 2          # 常驻进程中最多保留的模型数量
+HOST_STOP_GRACE_MS = 3000     # 请求停止后等待任务自行退出的时间
+HOST_RELEASE = "release"      # 发给常驻进程的指令：清空模型缓存，释放内存 / 显存
+
+# ================= 歌词解析类 =================
+class LrcParser:
+    def __init__(self):
+        self.headers = []
+        self.lines_text = []
+        self.translations = {}
+        # 匹配制作人信息等非歌词行
+        self.credits_pattern = re.compile(
+            r"^(作|编|词|曲|演|唱|混|录|母|制|监|统|出|绘|调|和|吉|贝|鼓|弦|管|Lyr|Com|Arr|Sin|Voc|Mix|Mas|Pro|Art|Cov|Gui|Bas|Dru|Str)"
+            r".{0,40}"
+            r"([:：]|\s|-)", re.IGNORECASE
+        )
+        self.time_tag_pattern = re.compile(r'^\[\d{2}:\d{2}')
+        self.tag_content_pattern = re.compile(r'^(\[\d{2}:\d{2}.*?\])(.*)')
+        self.remove_tags_pattern = re.compile(r'\[.*?\]')
+        self.remove_html_pattern = re.compile(r'<.*?>')
+
+    def parse(self, content: str, ext: str) -> str:
+        self.headers = []
+        self.lines_text = []
+        self.translations = {}
+        
+        content = content.lstrip('\ufeff')
+        lines = content.splitlines()
+        
+        last_time_tag = None
+        current_index = -1
+        
+        for line in lines:
+            line = line.strip()
+            if not line: continue
+            
+            if line.startswith('[') and not self.time_tag_pattern.match(line):
+                self.headers.append(line)
+                continue
+            
+            match = self.tag_content_pattern.match(line)
+            text_only = ""
+            time_tag = ""
+            
+            if match:
+                time_tag = match.group(1)
+                text_content = match.group(2).strip()
+                text_only = self.remove_tags_pattern.sub('', text_content)
+                text_only = self.remove_html_pattern.sub('', text_only).strip()
+            else:
+                text_only = self.remove_tags_pattern.sub('', line).strip()
+            
+            if not text_only: continue
+            
+            if self.credits_pattern.match(text_only):
+                self.headers.append(line)
+                continue
+            
+            if time_tag and time_tag == last_time_tag and current_index >= 0:
+                if current_index not in self.translations:
+                    self.translations[current_index] = []
+                self.translations[current_index].append(text_only)
+            else:
+                self.lines_text.append(text_only)
+                current_index += 1
+                last_time_tag = time_tag
+        
+        return "\n".join(self.lines_text)
+
+    def update_lines(self, text):
+        """导入后在输入框中手动修改了歌词：同步 lines_text，未改动/等行数替换的行保留翻译"""
+        lines = [l.strip() for l in text.splitlines() if l.strip()]
+        if not self.lines_text or lines == self.lines_text: return
+        translations = {}
+        matcher = difflib.SequenceMatcher(None, self.lines_text, lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal' or (tag == 'replace' and i2 - i1 == j2 - j1):
+                for k in range(i2 - i1):
+                    if i1 + k in self.translations: translations[j1 + k] = self.translations[i1 + k]
+        self.lines_text = lines
+        self.translations = translations
+
+def read_text_file(path):
+    """依次尝试常见编码读取歌词文件"""
+    for enc in ['utf-8', 'gbk', 'utf-8-sig', 'big5']:
+        try:
+            with open(path, 'r', encoding=enc) as file: return file.read()
+        except: continue
+    return ""
+
+class WordLevelEditor(QDialog):
+    """
+    字级精细校对窗口 (支持区间播放与自动暂停)
+    """
+    # 1. 修改初始化函数，增加 end_time_ms 参数
+    def __init__(self, audio_path, row_tokens, start_time_ms, end_time_ms, parent=None,
+                 player=None, clip=None):
+        super().__init__(parent)
+        self.setWindowTitle("逐字精细打轴 (Enter: 打点 | Space: 播放 | ←/→: 移动)")
+        self.resize(1000, 450)
+        self.audio_path = audio_path
+        self.base_time = start_time_ms
+        self.end_time_ms = end_time_ms  # 记录本句结束时间
+        
+        self.tokens = self.parse_line(*row_tokens, start_time_ms)
+        self.time_index = TimeIndex([t['time'] for t in self.tokens])
+        self.last_active_idx = -1
+        
+        # player: 调用方共享的播放器；clip: (wav 字节, 片段起点 ms)，提供时只播放这段内存片段
+        self.owns_player = player is None
+        if self.owns_player:
+            player = QMediaPlayer()
+            self.audio_output = QAudioOutput()
+            player.setAudioOutput(self.audio_output)
+        self.player = player
+        self.player.setPlaybackRate(1.0)
+        self.player.mediaStatusChanged.connect(self.on_media_status_changed)
+        self.clip_offset = 0
+        if clip is not None:
+            data, self.clip_offset = clip
+            self.clip_buffer = QBuffer(self)
+            self.clip_buffer.setData(QByteArray(data))
+            self.clip_buffer.open(QBuffer.OpenModeFlag.ReadOnly)
+            self.player.setSourceDevice(self.clip_buffer, QUrl("clip.wav"))
+        else:
+            self.player.setSource(QUrl.fromLocalFile(audio_path))
+        
+        # 初始定位到该句开始前 1秒 (稍微留点预卷时间)
+        self.start_pos = max(0, self.tokens[0]['time'] - 1000 if self.tokens else start_time_ms - 1000)
+        
+        self.setup_ui()
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.sync_highlight)
+        self.timer.start()
+
+    def on_media_status_changed(self, status):
+        if status == QMediaPlayer.MediaStatus.LoadedMedia or status == QMediaPlayer.MediaStatus.BufferedMedia:
+            self.seek(self.start_pos)
+
+    def position(self):
+        """当前播放位置 (整首歌的时间轴，已加上片段起点)"""
+        return self.player.position() + self.clip_offset
+
+    def seek(self, ms):
+        self.player.setPosition(max(0, ms - self.clip_offset))
+
+    def done(self, result):
+        self.player.stop()
+        self.player.mediaStatusChanged.disconnect(self.on_media_status_changed)
+        if not self.owns_player: self.player.setSource(QUrl())
+        super().done(result)
+
+    def parse_line(self, times, texts, default_start):
+        """表格行的逐字时间与文本片段 -> 逐字列表；第一个时间标签之前的片段使用行首时间"""
+        tokens = []
+        for current_time, part in zip([default_start] + times.tolist(), texts):
+            for char in part:
+                tokens.append({'char': char, 'time': current_time, 'edited': False})
+        return tokens
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        
+        # 顶部信息栏
+        info_lay = QHBoxLayout()
+        # 显示当前校对的区间
+        range_str = f"当前区间: {format_ms(self.base_time)} -> {format_ms(self.end_time_ms)}"
+        info_lay.addWidget(QLabel(f"<b>{range_str}</b>"))
+        layout.addLayout(info_lay)
+
+        # 控制栏
+        top_lay = QHBoxLayout()
+        self.btn_play = QPushButton("播放/暂停 (Space)")
+        self.btn_play.clicked.connect(self.toggle_play)
+        
+        self.lbl_speed = QLabel("倍速:")
+        self.spin_speed = QDoubleSpinBox()
+        self.spin_speed.setRange(0.25, 2.0)
+        self.spin_speed.setSingleStep(0.1)
+        self.spin_speed.setValue(1.0)
+        self.spin_speed.setSuffix(" x")
+        self.spin_speed.valueChanged.connect(self.change_speed)
+        
+        self.lbl_time = QLabel("00:00.000")
+        self.lbl_time.setStyleSheet("font-size: 16px; font-weight: bold; color: #409eff;")
+        
+        top_lay.addWidget(self.btn_play)
+        top_lay.addWidget(self.lbl_speed)
+        top_lay.addWidget(self.spin_speed)
+        top_lay.addStretch()
+        top_lay.addWidget(self.lbl_time)
+        layout.addLayout(top_lay)
+        
+        # 表格控件
+        self.table = QTableWidget()
+        self.table.setRowCount(2)
+        self.table.setVerticalHeaderLabels(["歌词", "时间"])
+        self.table.setColumnCount(len(self.tokens))
+        self.table.horizontalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectColumns)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        
+        for col, token in enumerate(self.tokens):
+            item_char = QTableWidgetItem(token['char'])
+            item_char.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+            font = item_char.font()
+            font.setPointSize(20)
+            item_char.setFont(font)
+            self.table.setItem(0, col, item_char)
+            
+            time_str = format_ms(token['time'])
+            item_time = QTableWidgetItem(time_str)
+            item_time.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+            self.table.setItem(1, col, item_time)
+            
+        self.table.resizeRowsToContents()
+        for i in range(self.table.columnCount()):
+            self.table.setColumnWidth(i, 60)
+            
+        self.table.cellClicked.connect(self.on_cell_clicked)
+        layout.addWidget(self.table)
+        
+        # 底部按钮
+        btn_box = QHBoxLayout()
+        btn_replay = QPushButton("⏪ 重播本句")
+        btn_replay.clicked.connect(lambda: self.seek(self.start_pos))
+        
+        btn_save = QPushButton("💾 确认并保存")
+        btn_save.setStyleSheet("background: #67c23a; color: white; font-weight: bold; padding: 10px;")
+        btn_save.clicked.connect(self.save_and_close)
+        
+        btn_cancel = QPushButton("取消")
+        btn_cancel.clicked.connect(self.reject)
+        
+        btn_box.addWidget(btn_replay)
+        btn_box.addStretch()
+        btn_box.addWidget(btn_save)
+        btn_box.addWidget(btn_cancel)
+        layout.addLayout(btn_box)
+        
+        if self.table.columnCount() > 0:
+            self.table.selectColumn(0)
+
+    def toggle_play(self):
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.pause()
+        else:
+            # 如果当前已经播放到了结束时间后面，重新从头播放
+            if self.position() >= self.end_time_ms:
+                self.seek(self.start_pos)
+            self.player.play()
+
+    def change_speed(self, val):
+        self.player.setPlaybackRate(val)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_Space:
+            self.toggle_play()
+        elif event.key() == Qt.Key.Key_Return or event.key() == Qt.Key.Key_Enter:
+            self.stamp_current_char()
+        elif event.key() == Qt.Key.Key_Left:
+            curr = self.table.currentColumn()
+            if curr > 0: self.table.selectColumn(curr - 1)
+        elif event.key() == Qt.Key.Key_Right:
+            curr = self.table.currentColumn()
+            if curr < self.table.columnCount() - 1: self.table.selectColumn(curr + 1)
+        else:
+            super().keyPressEvent(event)
+
+    def stamp_current_char(self):
+        curr_col = self.table.currentColumn()
+        if curr_col < 0: return
+        
+        current_pos = self.position()
+        self.tokens[curr_col]['time'] = current_pos
+        self.tokens[curr_col]['edited'] = True
+        self.time_index = TimeIndex([t['time'] for t in self.tokens])
+        
+        self.table.item(1, curr_col).setText(format_ms(current_pos))
+        self.update_cell_color(curr_col, is_active=True)
+        
+        if curr_col < self.table.columnCount() - 1:
+            self.table.selectColumn(curr_col + 1)
+
+    def sync_highlight(self):
+        if self.player.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
+            return
+            
+        pos = self.position()
+        self.lbl_time.setText(format_ms(pos))
+        
+        # === 核心逻辑：超过本句结束时间自动暂停 ===
+        # 允许超过 200ms 的缓冲，避免听到下一句的头
+        if pos >= self.end_time_ms + 200:
+            self.player.pause()
+            self.update_play_icon()
+            return
+        # ======================================
+        
+        active_idx = self.time_index.active(pos)
+        
+        if active_idx != self.last_active_idx:
+            if self.last_active_idx >= 0 and self.last_active_idx < self.table.columnCount():
+                self.update_cell_color(self.last_active_idx, is_active=False)
+            
+            if active_idx >= 0 and active_idx < self.table.columnCount():
+                self.update_cell_color(active_idx, is_active=True)
+                self.table.scrollToItem(self.table.item(0, active_idx))
+            
+            self.last_active_idx = active_idx
+
+    def update_cell_color(self, col, is_active):
+        token = self.tokens[col]
+        item = self.table.item(0, col)
+        if not item: return
+
+        if is_active: bg = Qt.GlobalColor.cyan
+        elif token['edited']: bg = Qt.GlobalColor.yellow
+        else: bg = Qt.GlobalColor.white
+            
+        if item.background().color() != bg:
+            item.setBackground(bg)
+
+    def update_play_icon(self):
+        # 简单的图标更新
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.btn_play.setText("暂停 (Space)")
+        else:
+            self.btn_play.setText("播放 (Space)")
+
+    def on_cell_clicked(self, row, col):
+        time_ms = self.tokens[col]['time']
+        self.seek(time_ms)
+        if self.player.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
+            self.player.play()
+
+    def save_and_close(self):
+        # 第一个字的时间作为行首，其余每个字带自己的时间 (与表格行的结构相同)
+        self.result_start_time = self.tokens[0]['time']
+        self.result_times = np.asarray([token['time'] for token in self.tokens[1:]], dtype=np.int64)
+        self.result_texts = [token['char'] for token in self.tokens]
+        self.player.stop()
+        self.accept()
+
+# ================= 校准表格数据模型 =================
+LRC_TAG_PATTERN = re.compile(r'\[(\d{2}):(\d{2})\.(\d{2,3})\]')
+
+def tag_to_ms(match):
+    """LRC_TAG_PATTERN 的匹配结果 -> 整数毫秒"""
+    frac = match.group(3)
+    return int(match.group(1)) * 60000 + int(match.group(2)) * 1000 + int(frac) * (10 if len(frac) == 2 else 1)
+
+def parse_time_tag(tag):
+    """'[mm:ss.xx]' / '[mm:ss.xxx]' -> 毫秒，无法解析时返回 -1"""
+    match = LRC_TAG_PATTERN.fullmatch(tag.strip())
+    return tag_to_ms(match) if match else -1
+
+def format_ms(ms):
+    ms = max(0, int(ms))
+    return f"{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+def parse_lrc_row(text):
+    """行内容 -> (逐字时间数组 ms, 文本片段列表)；片段数比时间数多一，第一个片段是首个标签前的文本"""
+    times, texts, last = [], [], 0
+    for match in LRC_TAG_PATTERN.finditer(text):
+        texts.append(text[last:match.start()])
+        times.append(tag_to_ms(match))
+        last = match.end()
+    texts.append(text[last:])
+    return np.asarray(times, dtype=np.int64), texts
+
+def parse_lrc_line(line):
+    """一行逐字 LRC -> (行首时间 ms, (逐字时间数组, 文本片段列表))；没有行首标签时行首时间为 -1"""
+    match = LRC_TAG_PATTERN.match(line)
+    if not match: return -1, parse_lrc_row(line)
+    return tag_to_ms(match), parse_lrc_row(line[match.end():])
+
+def parse_lrc_rows(content):
+    """整段逐字 LRC -> (各行行首时间, 各行逐字数据)，跳过空行"""
+    starts, rows = [], []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line: continue
+        start, row = parse_lrc_line(line)
+        starts.append(start)
+        rows.append(row)
+    return starts, rows
+
+def render_lrc_row(times, texts):
+    parts = [texts[0]]
+    for t, text in zip(times.tolist(), texts[1:]):
+        parts.append(f"[{format_ms(t)}]")
+        parts.append(text)
+    return "".join(parts)
+
+class TimeIndex:
+    """
+    按开始时间排序的索引，二分查找播放位置对应的行/字。
+    条目本身不必有序；时间为负 (无时间戳) 的条目不参与查找。
+    """
+    def __init__(self, times):
+        times = np.asarray(times, dtype=np.int64)
+        valid = np.flatnonzero(times >= 0)
+        order = valid[np.argsort(times[valid], kind='stable')]
+        self.times = times[order].tolist()
+        self.rows = order.tolist()
+
+    def active(self, pos):
+        """pos 时刻正在进行的条目 (开始时间不晚于 pos 的最后一个)；时间相同时取靠前的一个"""
+        i = bisect.bisect_right(self.times, pos) - 1
+        if i < 0: return -1
+        return self.rows[bisect.bisect_left(self.times, self.times[i])]
+
+    def next_after(self, ms):
+        """晚于 ms 的最近一个开始时间，没有则返回 -1"""
+        i = bisect.bisect_right(self.times, ms)
+        return self.times[i] if i < len(self.times) else -1
+
+class LrcTableModel(QAbstractTableModel):
+    """
+    校准表格的数据模型：行首时间为整数毫秒数组 (-1 表示无时间戳)，
+    每行的逐字时间为整数数组；单元格文本只在视图请求可见行时才生成。
+    """
+    HEADERS = ("时间戳", "歌词内容")
+    PLAYING_COLOR = QColor("#fff1b8")
+
+    def __init__(self, content="", parent=None):
+        super().__init__(parent)
+        self.playing_row = -1
+        self.load(content)
+
+    def load(self, content):
+        self.set_rows(*parse_lrc_rows(content))
+
+    def load_timed(self, timed):
+        """
+        直接从时间轴中间表示载入，表格内容与 load(对应的逐字 LRC) 相同，但不再解析文本；
+        保留原时间轴，to_timed 时未修改的行原样还原
+        """
+        self.set_rows(*rows_from_timed(timed), base=timed)
+
+    def set_rows(self, starts, tokens, lines=None, base=None):
+        self.beginResetModel()
+        self.base = base
+        self.lines = lines
+        self.tokens = tokens
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.index_cache = None
+        self.stamped_cache = None
+        self.marker_cache = None
+        self.playing_row = -1
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tokens)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def time_text(self, row):
+        return f"[{format_ms(self.starts[row])}]" if self.starts[row] >= 0 else ""
+
+    def row_text(self, row):
+        return render_lrc_row(*self.tokens[row])
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return self.PLAYING_COLOR if index.row() == self.playing_row else None
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole): return None
+        return self.time_text(index.row()) if index.column() == 0 else self.row_text(index.row())
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole: return None
+        if orientation == Qt.Orientation.Horizontal: return self.HEADERS[section]
+        return str(section + 1)
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemFlag.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole: return False
+        value = str(value).strip()
+        if index.column() == 0:
+            ms = parse_time_tag(value) if value else -1
+            if value and ms < 0: return False
+            self.set_start(index.row(), ms)
+        else:
+            self.set_text(index.row(), value)
+        return True
+
+    def row_changed(self, row, first_col=0, last_col=1, roles=None):
+        if not roles: self.marker_cache = None
+        if 0 <= row < len(self.tokens):
+            self.dataChanged.emit(self.index(row, first_col), self.index(row, last_col), roles or [])
+
+    def set_start(self, row, ms):
+        self.starts[row] = ms
+        self.index_cache = None
+        self.stamped_cache = None
+        self.row_changed(row, 0, 0)
+
+    def time_index(self):
+        if self.index_cache is None: self.index_cache = TimeIndex(self.starts)
+        return self.index_cache
+
+    def stamped_row(self, row):
+        """row 或其上方最近一个有时间戳的行，没有则为 -1 (在有时间戳的行号数组中二分查找)"""
+        if self.stamped_cache is None: self.stamped_cache = np.flatnonzero(self.starts >= 0)
+        i = int(np.searchsorted(self.stamped_cache, row, side='right')) - 1
+        return int(self.stamped_cache[i]) if i >= 0 else -1
+
+    def marker_times(self):
+        """波形标记用的 (行首时间, 逐字时间)，均为升序整数毫秒数组"""
+        if self.marker_cache is None:
+            words = [times for times, _ in self.tokens if len(times)]
+            self.marker_cache = (np.sort(self.starts[self.starts >= 0]),
+                                 np.sort(np.concatenate(words)) if words else np.zeros(0, dtype=np.int64))
+        return self.marker_cache
+
+    def set_playing_row(self, row):
+        """切换播放高亮行，只通知新旧两行重绘背景"""
+        if row == self.playing_row: return
+        old, self.playing_row = self.playing_row, row
+        self.row_changed(old, roles=[Qt.ItemDataRole.BackgroundRole])
+        self.row_changed(row, roles=[Qt.ItemDataRole.BackgroundRole])
+
+    def set_text(self, row, text):
+        self.set_tokens(row, *parse_lrc_row(text))
+
+    def set_tokens(self, row, times, texts):
+        self.tokens[row] = (np.asarray(times, dtype=np.int64), texts)
+        self.row_changed(row, 1, 1)
+
+    def shift_row(self, row, delta_ms):
+        """行内逐字时间整体平移 (不早于 0)"""
+        times, texts = self.tokens[row]
+        self.tokens[row] = (np.maximum(times + delta_ms, 0), texts)
+        self.row_changed(row, 1, 1)
+
+    def repair_row(self, row, line_start_ms):
+        """打轴后修复行内逐字时间：保证单调递增且不早于行首"""
+        times, texts = self.tokens[row]
+        if not len(times): return
+        repaired = repair_timestamps(times / 1000.0, start_floor=line_start_ms / 1000.0 - MIN_DURATION)
+        self.tokens[row] = (np.rint(repaired * 1000).astype(np.int64), texts)
+        self.row_changed(row, 1, 1)
+
+    def translation_rows(self, row):
+        """紧跟在 row 之后、时间戳与其相同的翻译行"""
+        end = row + 1
+        while end < len(self.starts) and self.starts[row] >= 0 and self.starts[end] == self.starts[row]:
+            end += 1
+        return range(row + 1, end)
+
+    def to_lrc(self):
+        return "\n".join(f"{self.time_text(r)}{self.row_text(r)}" for r in range(len(self.tokens)))
+
+    def to_timed(self):
+        return timed_from_rows(self.starts, self.tokens, self.base, self.lines)
+
+# ================= 波形预览 =================
+class PeakLoader(QThread):
+    """后台解码音频并计算/读取波形金字塔"""
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    running = set()     # 保持引用直到线程结束，窗口提前关闭也不会销毁运行中的线程
+
+    def __init__(self, audio_path):
+        super().__init__()
+        self.audio_path = audio_path
+        PeakLoader.running.add(self)
+        self.finished.connect(lambda: PeakLoader.running.discard(self))
+
+    def run(self):
+        try: self.loaded.emit(load_peak_pyramid(self.audio_path))
+        except Exception as e: self.failed.emit(str(e))
+
+class WaveformView(QWidget):
+    """
+    波形条：从峰值金字塔中按缩放比例取层级绘制，并标出行首/逐字时间与播放位置。
+    滚轮左右滚动，Ctrl+滚轮缩放，单击跳转。
+    """
+    seekRequested = pyqtSignal(int)
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.pyramid = None
+        self.message = "波形加载中..."
+        self.view_start = 0.0       # 左边缘对应的时间 (ms)
+        self.ms_per_px = 20.0
+        self.playhead = 0
+        self.setMinimumHeight(90)
+        model.dataChanged.connect(lambda *args: self.update())
+        model.modelReset.connect(self.update)
+
+    def set_pyramid(self, pyramid):
+        self.pyramid = pyramid
+        self.update()
+
+    def set_message(self, text):
+        self.message = text
+        self.update()
+
+    def set_playhead(self, ms):
+        self.playhead = ms
+        view_ms = self.width() * self.ms_per_px
+        # 播放位置移出可视范围时翻页
+        if not self.view_start <= ms < self.view_start + view_ms:
+            self.view_start = max(0.0, ms - view_ms * 0.1)
+        self.update()
+
+    def x_to_ms(self, x):
+        return self.view_start + x * self.ms_per_px
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        w, h = self.width(), self.height()
+        mid = h / 2
+        painter.fillRect(0, 0, w, h, QColor("#1f2329"))
+        if self.pyramid is None:
+            painter.setPen(QColor("#909399"))
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.message)
+            return
+        
+        col_min, col_max = self.pyramid.columns(self.view_start, self.ms_per_px, w)
+        painter.setPen(QColor("#5cadff"))
+        painter.drawLines([QLineF(x, mid - hi * mid, x, mid - lo * mid)
+                           for x, lo, hi in zip(range(w), col_min.tolist(), col_max.tolist()) if lo == lo])
+        
+        view_end = self.view_start + w * self.ms_per_px
+        line_times, word_times = self.model.marker_times()
+        lo, hi = np.searchsorted(word_times, [self.view_start, view_end])
+        if hi - lo < w // 3:    # 缩得太小时逐字标记挤成一片，不再绘制
+            painter.setPen(QColor("#67c23a"))
+            painter.drawLines([QLineF(x, h - 10, x, h) for x in ((word_times[lo:hi] - self.view_start) / self.ms_per_px).tolist()])
+        lo, hi = np.searchsorted(line_times, [self.view_start, view_end])
+        painter.setPen(QColor("#e6a23c"))
+        painter.drawLines([QLineF(x, 0, x, h) for x in ((line_times[lo:hi] - self.view_start) / self.ms_per_px).tolist()])
+        
+        painter.setPen(QPen(QColor("#f56c6c"), 2))
+        x = (self.playhead - self.view_start) / self.ms_per_px
+        painter.drawLine(QLineF(x, 0, x, h))
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            anchor_x = event.position().x()
+            anchor_ms = self.x_to_ms(anchor_x)
+            max_ms_per_px = max(self.pyramid.duration_ms / max(1, self.width()), 1.0) if self.pyramid else 1000.0
+            self.ms_per_px = float(np.clip(self.ms_per_px * 0.8 ** steps, 1.0, max_ms_per_px))
+            self.view_start = max(0.0, anchor_ms - anchor_x * self.ms_per_px)
+        else:
+            self.view_start = max(0.0, self.view_start - steps * self.width() * self.ms_per_px * 0.1)
+        self.update()
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.seekRequested.emit(int(max(0, self.x_to_ms(event.position().x()))))
+
+# ================= 逐字编辑片段缓存 =================
+def clip_wav(pcm, start_ms, end_ms, sr=SAMPLE_RATE):
+    """从解码缓存 (float32 单声道 PCM) 中切出 [start_ms, end_ms) 并编码为内存中的 16 位 WAV 字节"""
+    lo, hi = start_ms * sr // 1000, min(len(pcm), end_ms * sr // 1000)
+    samples = np.clip(np.asarray(pcm[lo:max(lo, hi)]) * 32767.0, -32768, 32767).astype('<i2')
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+class LineClipCache:
+    """
+    逐字编辑用的行片段缓存：后台线程从内存映射的解码缓存 (load_audio_cached) 中切出片段 (含预卷)
+    并保存在内存中，打开编辑器时直接播放片段，不再加载和定位整首歌，也不再逐句调用 FFmpeg。
+    按 LRU 保留最近几句。
+    """
+    def __init__(self, audio_path, capacity=LINE_CLIP_CACHE_SIZE):
+        self.audio_path = audio_path
+        self.capacity = capacity
+        self.clips = OrderedDict()      # (片段起点, 片段终点) -> Future[wav 字节]
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pcm = None
+
+    def cut(self, start_ms, end_ms):
+        # 只在后台线程中访问：首次使用时打开 (必要时生成) 解码缓存
+        if self.pcm is None: self.pcm = load_audio_cached(self.audio_path)
+        return clip_wav(self.pcm, start_ms, end_ms)
+
+    @staticmethod
+    def clip_range(start_ms, end_ms):
+        return max(0, start_ms - LINE_CLIP_PREROLL_MS), end_ms + LINE_CLIP_TAIL_MS
+
+    def request(self, start_ms, end_ms):
+        key = self.clip_range(start_ms, end_ms)
+        if key in self.clips:
+            self.clips.move_to_end(key)
+        else:
+            self.clips[key] = self.executor.submit(self.cut, *key)
+            while len(self.clips) > self.capacity:
+                self.clips.popitem(last=False)[1].cancel()
+        return key, self.clips[key]
+
+    def get(self, start_ms, end_ms, timeout=5.0):
+        """返回 (wav 字节, 片段起点 ms)；截取失败或超时返回 None，由调用方回退到整首播放"""
+        key, future = self.request(start_ms, end_ms)
+        try: return future.result(timeout=timeout), key[0]
+        except Exception: return None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# ================= 歌词编辑器窗口 =================
+class LrcEditorDialog(QDialog):
+    def __init__(self, audio_path, lrc_content, parent=None, timed=None):
+        super().__init__(parent)
+        self.setWindowTitle("歌词精细校准 - AutoKaraoke Editor")
+        self.resize(1000, 750) 
+        self.audio_path = audio_path
+        self.lrc_content = lrc_content
+        # timed: 与 lrc_content 对应的时间轴中间表示，提供时直接载入数组，不再解析文本
+        self.timed = timed
+        self.result_lrc = None
+        self.result_timed = None
+        
+        self.player = QMediaPlayer()
+        self.audio_output = QAudioOutput()
+        self.player.setAudioOutput(self.audio_output)
+        # 逐字编辑器共用的片段播放器，只创建一次
+        self.clip_player = None
+        self.clip_cache = LineClipCache(audio_path) if audio_path and os.path.exists(audio_path) else None
+        
+        self.setup_ui()
+        self.load_lrc_data()
+        self.load_audio()
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(100)
+        self.timer.timeout.connect(self.update_progress)
+        self.timer.start()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        
+        help_lbl = QLabel(
+            "💡 <b>操作：</b>单击暂停选中 | 双击逐字编辑 | F2 直接修改 | Enter键同步当前行 | 空格播放/暂停"
+        )
+        help_lbl.setStyleSheet("background: #e6f7ff; padding: 10px; border: 1px solid #91d5ff;")
+        layout.addWidget(help_lbl)
+
+        self.model = LrcTableModel(parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        # 固定时间列宽度，避免按内容自适应时遍历所有行
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Fixed)
+        self.table.setColumnWidth(0, self.table.fontMetrics().horizontalAdvance("[00:00.000]") + 24)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.EditKeyPressed)
+        self.table.setWordWrap(False)
+        self.table.setAlternatingRowColors(True)
+        
+        self.table.doubleClicked.connect(lambda index: self.seek_to_row(index.row(), index.column()))
+        self.table.pressed.connect(lambda index: self.pause_on_click(index.row(), index.column()))
+        layout.addWidget(self.table)
+        
+        self.waveform = WaveformView(self.model)
+        self.waveform.setToolTip("滚轮: 左右移动 | Ctrl+滚轮: 缩放 | 单击: 跳转")
+        self.waveform.seekRequested.connect(self.seek_from_waveform)
+        layout.addWidget(self.waveform)
+        
+        ctrl_box = QHBoxLayout()
+        self.btn_play = QPushButton()
+        self.update_play_icon()
+        self.btn_play.clicked.connect(self.toggle_play)
+        
+        self.lbl_curr = QLabel("00:00.000")
+        self.lbl_curr.setMinimumWidth(80)
+        self.slider = QSlider(Qt.Orientation.Horizontal)
+        self.slider.sliderMoved.connect(self.set_position)
+        self.slider.sliderPressed.connect(self.pause_for_seek)
+        self.slider.sliderReleased.connect(self.resume_after_seek)
+        self.lbl_total = QLabel("00:00.000")
+        self.follow_check = QCheckBox("🎯 跟随播放")
+        self.follow_check.setToolTip("播放时高亮当前演唱的行并自动滚动")
+        self.follow_check.setChecked(True)
+        self.follow_check.toggled.connect(self.on_follow_toggled)
+        
+        ctrl_box.addWidget(self.btn_play)
+        ctrl_box.addWidget(self.lbl_curr)
+        ctrl_box.addWidget(self.slider)
+        ctrl_box.addWidget(self.lbl_total)
+        ctrl_box.addWidget(self.follow_check)
+        layout.addLayout(ctrl_box)
+        
+        btn_box = QHBoxLayout()
+        btn_stamp = QPushButton("⏱️ 智能同步写入 (Enter)")
+        btn_stamp.setStyleSheet("background: #e6a23c; color: white; font-weight: bold;")
+        btn_stamp.clicked.connect(self.stamp_current_time)
+        
+        btn_save = QPushButton("💾 保存并关闭")
+        btn_save.setStyleSheet("background: #67c23a; color: white; font-weight: bold;")
+        btn_save.clicked.connect(self.save_lrc) 
+        
+        btn_cancel = QPushButton("取消")
+        btn_cancel.clicked.connect(self.reject) 
+        
+        btn_box.addWidget(btn_stamp)
+        btn_box.addStretch()
+        btn_box.addWidget(btn_save)
+        btn_box.addWidget(btn_cancel)
+        layout.addLayout(btn_box)
+        
+        self.table.keyPressEvent = self.table_key_event
+
+    def load_audio(self):
+        if self.audio_path and os.path.exists(self.audio_path):
+            self.player.setSource(QUrl.fromLocalFile(self.audio_path))
+            self.player.mediaStatusChanged.connect(self.on_media_status)
+            loader = PeakLoader(self.audio_path)
+            loader.loaded.connect(self.waveform.set_pyramid)
+            loader.failed.connect(lambda e: self.waveform.set_message(f"波形加载失败: {e}"))
+            loader.start()
+        else:
+            self.waveform.set_message("没有音频")
+    
+    def on_media_status(self, status):
+        if status == QMediaPlayer.MediaStatus.LoadedMedia:
+            duration = self.player.duration()
+            self.slider.setRange(0, duration)
+            self.lbl_total.setText(format_ms(duration))
+
+    def load_lrc_data(self):
+        if self.timed is not None: self.model.load_timed(self.timed)
+        else: self.model.load(self.lrc_content)
+
+    def current_row(self):
+        index = self.table.currentIndex()
+        return index.row() if index.isValid() else -1
+
+    def table_key_event(self, event):
+        if self.table.state() == QAbstractItemView.State.EditingState:
+            QTableView.keyPressEvent(self.table, event)
+        elif event.key() == Qt.Key.Key_Space:
+            self.toggle_play()
+        elif event.key() == Qt.Key.Key_Return or event.key() == Qt.Key.Key_Enter:
+            self.stamp_current_time()
+        else:
+            QTableView.keyPressEvent(self.table, event)
+
+    def toggle_play(self):
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.pause()
+        else:
+            self.player.play()
+        self.update_play_icon()
+
+    def update_play_icon(self):
+        style = self.style()
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            icon = style.standardIcon(QStyle.StandardPixmap.SP_MediaPause)
+        else:
+            icon = style.standardIcon(QStyle.StandardPixmap.SP_MediaPlay)
+        self.btn_play.setIcon(icon)
+
+    def update_progress(self):
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            pos = self.player.position()
+            self.slider.setValue(pos)
+            self.lbl_curr.setText(format_ms(pos))
+            self.waveform.set_playhead(pos)
+            self.follow_playback(pos)
+
+    def follow_playback(self, pos):
+        """高亮 pos 时刻所在的行；只在换行时重绘这两行并滚动"""
+        if not self.follow_check.isChecked(): return
+        row = self.model.time_index().active(pos)
+        if row == self.model.playing_row: return
+        self.model.set_playing_row(row)
+        if row >= 0 and self.table.state() != QAbstractItemView.State.EditingState:
+            self.table.scrollTo(self.model.index(row, 0), QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def on_follow_toggled(self, checked):
+        if checked: self.follow_playback(self.player.position())
+        else: self.model.set_playing_row(-1)
+
+    def set_position(self, pos):
+        self.player.setPosition(pos)
+        self.lbl_curr.setText(format_ms(pos))
+        self.waveform.set_playhead(pos)
+        self.follow_playback(pos)
+
+    def seek_from_waveform(self, pos):
+        self.slider.setValue(pos)
+        self.set_position(pos)
+
+    def pause_for_seek(self):
+        self.was_playing = (self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState)
+        self.player.pause()
+
+    def resume_after_seek(self):
+        if hasattr(self, 'was_playing') and self.was_playing:
+            self.player.play()
+            self.update_play_icon()
+    
+    def line_range(self, row):
+        """
+        本句的 (开始, 结束) 时间：结束 = 下一个更晚的行首时间，默认为歌曲总时长。
+        本行没有时间戳时以上方最近一个有时间戳的行为起点 (都没有则从 0 开始)。
+        """
+        stamped = self.model.stamped_row(row)
+        start_ms = int(self.model.starts[stamped]) if stamped >= 0 else 0
+        end_ms = self.model.time_index().next_after(start_ms)
+        if end_ms < 0: end_ms = self.player.duration()
+        return start_ms, end_ms
+
+    def shared_clip_player(self):
+        if self.clip_player is None:
+            self.clip_player = QMediaPlayer(self)
+            self.clip_output = QAudioOutput(self)
+            self.clip_player.setAudioOutput(self.clip_output)
+        return self.clip_player
+
+    def prefetch_neighbours(self, row):
+        """后台预先截取前一句和后两句的片段"""
+        if self.clip_cache is None: return
+        for r in (row - 1, row + 1, row + 2):
+            if 0 <= r < self.model.rowCount() and self.model.starts[r] >= 0:
+                start_ms, end_ms = self.line_range(r)
+                if end_ms > start_ms: self.clip_cache.request(start_ms, end_ms)
+
+    def seek_to_row(self, row, col):
+        """
+        双击进入逐字编辑模式
+        """
+        if not 0 <= row < self.model.rowCount(): return
+        start_ms, end_ms = self.line_range(row)
+        row_tokens = self.model.tokens[row]
+        
+        # 暂停主播放器
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.pause()
+            self.update_play_icon()
+        
+        clip = None
+        if self.clip_cache is not None and 0 <= start_ms < end_ms:
+            clip = self.clip_cache.get(start_ms, end_ms)
+        self.prefetch_neighbours(row)
+            
+        # 打开逐字编辑器，传入结束时间；有片段时播放内存中的片段，否则回退到整首
+        editor = WordLevelEditor(self.audio_path, row_tokens, start_ms, end_ms, self,
+                                 player=self.shared_clip_player(), clip=clip)
+        
+        if editor.exec() and hasattr(editor, 'result_times'):
+            self.model.set_start(row, editor.result_start_time)
+            self.model.set_tokens(row, editor.result_times, editor.result_texts)
+    
+    def pause_on_click(self, row, col):
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.pause()
+            self.update_play_icon()
+
+    def stamp_current_time(self):
+        row = self.current_row()
+        if row < 0: return
+        
+        current_pos_ms = self.player.position()
+        old_start_ms = int(self.model.starts[row])
+        translations = self.model.translation_rows(row)
+        
+        delta_ms = 0
+        if old_start_ms >= 0:
+            delta_ms = current_pos_ms - old_start_ms
+
+        # 修复首字异常空隙
+        extra_fix_ms = 0
+        inner_times = self.model.tokens[row][0]
+        if len(inner_times) and old_start_ms >= 0:
+            original_gap = int(inner_times[0]) - old_start_ms
+            if original_gap > 1200:
+                target_gap = 300 
+                extra_fix_ms = -(original_gap - target_gap)
+
+        self.model.set_start(row, current_pos_ms)
+        self.model.shift_row(row, delta_ms + extra_fix_ms)
+        self.model.repair_row(row, current_pos_ms)
+        
+        # 同步更新后续翻译行
+        for t_row in translations:
+            self.model.set_start(t_row, current_pos_ms)
+        
+        if row < self.model.rowCount() - 1:
+            self.table.selectRow(row + 1)
+            self.table.scrollTo(self.model.index(row + 1, 0))
+
+    def save_lrc(self):
+        self.result_lrc = self.model.to_lrc()
+        self.result_timed = self.model.to_timed()
+        self.accept()
+
+    def stop_and_release(self):
+        if self.player.playbackState() != QMediaPlayer.PlaybackState.StoppedState:
+            self.player.stop()
+        if self.clip_player is not None: self.clip_player.stop()
+        if self.clip_cache is not None: self.clip_cache.shutdown()
+
+    def accept(self):
+        self.stop_and_release()
+        super().accept()
+        
+    def reject(self):
+        self.stop_and_release()
+        super().reject()
+
+    def closeEvent(self, event):
+        self.stop_and_release()
+        event.accept()
+
+# ================= 全局序列对齐 =================
+def unique_ngram_anchors(ref_ids, ai_ids, usable, k=ALIGN_ANCHOR_NGRAM):
+    """
+    高置信度锚点：在两个序列中都只出现一次的连续 k 个词 (不含清洗后为空的词)。
+    按参考词顺序取 AI 位置严格递增的最长链，返回 (参考词下标, AI 词下标) 两个数组。
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    n, m = len(ref_ids), len(ai_ids)
+    if n < k or m < k: return empty, empty
+    windows = np.concatenate([np.lib.stride_tricks.sliding_window_view(ref_ids, k),
+                              np.lib.stride_tricks.sliding_window_view(ai_ids, k)])
+    _, inverse, counts = np.unique(windows, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    ref_key, ai_key = inverse[:n - k + 1], inverse[n - k + 1:]
+    in_ref = np.bincount(ref_key, minlength=len(counts))
+    once = (in_ref == 1) & (counts == 2)            # 参考与 AI 各出现一次
+    ok = np.all(usable[windows], axis=1)
+    ref_pos = np.flatnonzero(once[ref_key] & ok[:n - k + 1])
+    ai_of_key = np.zeros(len(counts), dtype=np.int64)
+    ai_of_key[ai_key] = np.arange(len(ai_key))
+    if not len(ref_pos): return empty, empty
+    # 每个 k 元组展开为 k 对词，去重后按 (参考词升序, AI 词降序) 排列，求 AI 位置严格递增的最长链
+    pairs = np.unique(np.stack([(ref_pos[:, None] + np.arange(k)).ravel(),
+                                (ai_of_key[ref_key[ref_pos]][:, None] + np.arange(k)).ravel()], axis=1), axis=0)
+    order = np.lexsort((-pairs[:, 1], pairs[:, 0]))
+    ri, aj = pairs[order, 0].tolist(), pairs[order, 1].tolist()
+    tails, tail_at, prev = [], [], [-1] * len(aj)
+    for t, j in enumerate(aj):
+        pos = bisect.bisect_left(tails, j)
+        if pos: prev[t] = tail_at[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tail_at.append(t)
+        else:
+            tails[pos] = j
+            tail_at[pos] = t
+    chain = []
+    t = tail_at[-1] if tail_at else -1
+    while t >= 0:
+        chain.append(t)
+        t = prev[t]
+    chain.reverse()
+    return np.asarray([ri[t] for t in chain], dtype=np.int64), np.asarray([aj[t] for t in chain], dtype=np.int64)
+
+def anchor_splits(ri, aj, tol):
+    """
+    从锚点链中选出切分点：首尾锚点，以及偏离相邻切分点连线超过 tol 个 AI 词的锚点
+    (Douglas-Peucker 折线化简)。切分点之间的锚点都在带内，交给带状对齐即可。
+    """
+    keep = {0, len(ri) - 1}
+    pending = [(0, len(ri) - 1)]
+    while pending:
+        a, b = pending.pop()
+        if b - a < 2: continue
+        inner = np.arange(a + 1, b)
+        chord = aj[a] + (ri[inner] - ri[a]) * (aj[b] - aj[a]) / max(ri[b] - ri[a], 1)
+        dev = np.abs(aj[inner] - chord)
+        worst = int(np.argmax(dev))
+        if dev[worst] <= tol: continue
+        mid = a + 1 + worst
+        keep.add(mid)
+        pending += [(a, mid), (mid, b)]
+    return np.asarray(sorted(keep), dtype=np.int64)
+
+def align_tokens_banded(ref_ids, ai_ids, vocab, band=ALIGN_BAND, free_ref_tail=False):
+    """
+    参考词序列与 AI 词序列的全局对齐 (AI 序列首尾的多余词不扣分)。
+    ref_ids / ai_ids 为 vocab 中清洗后文本的下标，两词互相包含即视为匹配。
+    带宽覆盖不了整张表时，先用两侧都唯一的 k 元词组作锚点，在路径明显偏离对角线处 (前奏、漏唱、
+    多出的段落) 切分，各段再做带状 Needleman-Wunsch，带始终跟随实际路径。
+    free_ref_tail 为 True 时参考序列末尾的多余词也不扣分 (参考词比 AI 词多出一段前瞻时使用)。
+    返回每个参考词匹配到的 AI 词下标，未匹配为 -1。
+    """
+    ref_ids = np.asarray(ref_ids, dtype=np.int64)
+    ai_ids = np.asarray(ai_ids, dtype=np.int64)
+    n, m = len(ref_ids), len(ai_ids)
+    matched = np.full(n, -1, dtype=np.int64)
+    if n == 0 or m == 0: return matched
+    
+    # 段落：(参考词起止, AI 词起止)；只有第一段的 AI 开头、最后一段的 AI 末尾不扣分
+    segments = [(0, n, 0, m)]
+    if m > 2 * band:
+        usable = np.fromiter((bool(v) for v in vocab), dtype=bool, count=len(vocab))
+        ri, aj = unique_ngram_anchors(ref_ids, ai_ids, usable)
+        if len(ri):
+            split = anchor_splits(ri, aj, band // 2)
+            ri, aj = ri[split], aj[split]
+            matched[ri] = aj
+            segments = list(zip(np.append(0, ri + 1).tolist(), np.append(ri, n).tolist(),
+                                np.append(0, aj + 1).tolist(), np.append(aj, m).tolist()))
+    for r0, r1, a0, a1 in segments:
+        if r1 == r0 or a1 == a0: continue
+        sub = align_band_dp(ref_ids[r0:r1], ai_ids[a0:a1], vocab, band,
+                            free_ref_tail=free_ref_tail and a1 == m, free_ai_head=a0 == 0, free_ai_tail=a1 == m)
+        matched[r0:r1] = np.where(sub >= 0, sub + a0, -1)
+    return matched
+
+def align_band_dp(ref_ids, ai_ids, vocab, band, free_ref_tail=False, free_ai_head=True, free_ai_tail=True):
+    """
+    带状 Needleman-Wunsch：每行只计算对角线附近 2*band+1 个格子，行内用 NumPy 向量化，
+    耗时与序列长度线性相关。free_ai_head / free_ai_tail 为 True 时 AI 序列开头 / 末尾的多余词不扣分。
+    """
+    n, m = len(ref_ids), len(ai_ids)
+    matched = np.full(n, -1, dtype=np.int64)
+    
+    # 带宽至少要覆盖对角线每行的推进量，否则相邻两行的带会断开
+    band = max(int(band), int(np.ceil(m / n)) + 1)
+    width = 2 * band + 1
+    k = np.arange(width)
+    rows = np.arange(1, n + 1)
+    lo = np.clip(np.round(rows * (m / n)).astype(np.int64) - band, 0, max(0, m + 1 - width))
+    cols = lo[:, None] + k[None, :]                    # 第 i 行带内的列 j (0..m)
+    
+    # 带内匹配矩阵：先对 (参考词, AI词) 组合去重，再逐个判断包含关系
+    ai_pos = cols - 1
+    in_range = (ai_pos >= 0) & (ai_pos < m)
+    vocab_size = max(len(vocab), 1)
+    pair_keys = ref_ids[:, None] * vocab_size + ai_ids[np.clip(ai_pos, 0, m - 1)]
+    uniq, inverse = np.unique(pair_keys[in_range], return_inverse=True)
+    pair_ok = np.fromiter(
+        ((bool(vocab[r]) and bool(vocab[a]) and (r == a or vocab[r] in vocab[a] or vocab[a] in vocab[r]))
+         for r, a in zip((uniq // vocab_size).tolist(), (uniq % vocab_size).tolist())),
+        dtype=bool, count=len(uniq))
+    is_match = np.zeros(cols.shape, dtype=bool)
+    is_match[in_range] = pair_ok[inverse.ravel()]
+    
+    neg = -1e18
+    scores = np.where(is_match, ALIGN_MATCH_SCORE, ALIGN_MISMATCH_SCORE)
+    scores[~in_range] = neg
+    gap = ALIGN_GAP_SCORE
+    gap_ramp = gap * k
+    pointers = np.zeros((n, width), dtype=np.int8)    # 0: 对角 1: 上 (参考词未匹配) 2: 左 (跳过AI词)
+    
+    valid_count = np.minimum(m - lo + 1, width)       # 每行带内有效列数 (列号不超过 m)
+    # 上一行结果放在两侧填充 neg 的缓冲区中，按带的平移量切片即可取到 H[i-1][j] 与 H[i-1][j-1]
+    padded = np.full(2 * width + 1, neg)
+    # 第 0 行：AI 序列开头的多余词不扣分时全为 0，否则每跳过一个扣一次空位分
+    padded[1:width + 1] = 0.0 if free_ai_head else gap * (lo[0] + k)
+    row_best = np.full(n, neg)
+    row_arg = np.zeros(n, dtype=np.int64)
+    prev_lo = lo[0]
+    for i in range(n):
+        shift = lo[i] - prev_lo
+        diag_score = padded[shift:shift + width] + scores[i]
+        up_score = padded[shift + 1:shift + 1 + width] + gap
+        best = np.maximum(diag_score, up_score)
+        best[valid_count[i]:] = neg
+        # 行内向左的递推 H[j] = max(best[j], H[j-1] + gap) 用前缀最大值一次算完
+        row = np.maximum.accumulate(best - gap_ramp) + gap_ramp
+        pointers[i] = np.where(row > best, 2, diag_score < up_score)
+        row[valid_count[i]:] = neg
+        if free_ref_tail:
+            row_arg[i] = int(np.argmax(row))
+            row_best[i] = row[row_arg[i]]
+        padded[1:width + 1] = row
+        prev_lo = lo[i]
+    prev = padded[1:width + 1]
+    
+    # 回溯：从最后一行得分最高的位置出发 (AI 序列末尾多余词不扣分，否则从最后一列出发)；
+    # 参考序列末尾也不扣分时，从全表得分最高的行出发，之后的参考词保持未匹配
+    i = n
+    j = int(lo[n - 1] + np.argmax(prev)) if free_ai_tail else m
+    if free_ref_tail:
+        i = int(np.argmax(row_best)) + 1
+        j = int(lo[i - 1] + row_arg[i - 1])
+    while i > 0 and j >= 0:
+        pos = j - lo[i - 1]
+        move = pointers[i - 1, pos] if 0 <= pos < width else 1
+        if move == 0:
+            if j > 0 and is_match[i - 1, pos]: matched[i - 1] = j - 1
+            i -= 1
+            j -= 1
+        elif move == 1:
+            i -= 1
+        else:
+            j -= 1
+    return matched
+
+# ================= 识别结果缓存 =================
+def get_attr(obj, key, default=None):
+    if isinstance(obj, dict): return obj.get(key, default)
+    return getattr(obj, key, default)
+
+CACHE_DIR = os.path.join(os.getcwd(), "cache")
+_digest_memo = {}
+
+def get_cache_dir(sub):
+    path = os.path.join(CACHE_DIR, sub)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+@contextmanager
+def atomic_output(path, ext=""):
+    """
+    产出本进程/线程独有的临时文件名 (以 ext 结尾，供 np.save 等按后缀补全的写入函数使用)，
+    with 块正常结束后 os.replace 到 path，出错时删除临时文件。
+    队列任务和批处理进程可能同时生成同一首歌的缓存，固定的临时文件名会互相覆盖。
+    with 块内自行删除临时文件表示放弃写入。
+    """
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp{ext}"
+    try:
+        yield tmp
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    if not os.path.exists(tmp): return
+    try:
+        os.replace(tmp, path)
+    except PermissionError:
+        # Windows 上目标文件正被其他进程内存映射时无法替换：内容相同，保留已有的文件
+        os.remove(tmp)
+        if not os.path.exists(path): raise
+
+def write_json_atomic(path, data, **dump_options):
+    """JSON 先写临时文件再替换，读取方不会看到写了一半的文件"""
+    with atomic_output(path) as tmp:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_options)
+
+def file_digest(path):
+    """音频文件内容哈希 (同一进程内按 路径/大小/修改时间 记忆，避免重复读取)"""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _digest_memo:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _digest_memo[memo_key] = h.hexdigest()
+    return _digest_memo[memo_key]
+
+def result_cache_key(audio_hash, model_size, language, prompt, mode, ref_text):
+    ref_hash = hashlib.sha1((ref_text or "").strip().encode('utf-8')).hexdigest()
+    payload = json.dumps([audio_hash, model_size, language, (prompt or "").strip(), mode, ref_hash])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def pack_strings(strings):
+    """字符串列表 -> (UTF-8 字节块, 偏移数组)"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded: np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def unpack_strings(blob, offsets):
+    raw = blob.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+def compact_result(result):
+    """把 stable-ts 结果压缩为段/词时间数组，便于缓存与后续处理"""
+    segments = get_attr(result, 'segments', [])
+    if not segments and not isinstance(result, dict):
+        try: segments = list(result)
+        except: segments = []
+    
+    seg_start, seg_end, seg_text = [], [], []
+    word_seg, word_start, word_end, word_prob, word_text = [], [], [], [], []
+    for s_idx, seg in enumerate(segments):
+        seg_start.append(get_attr(seg, 'start', 0.0) or 0.0)
+        seg_end.append(get_attr(seg, 'end', 0.0) or 0.0)
+        seg_text.append(get_attr(seg, 'text', '') or '')
+        for w in get_attr(seg, 'words', None) or []:
+            word_seg.append(s_idx)
+            word_start.append(get_attr(w, 'start', 0.0) or 0.0)
+            word_end.append(get_attr(w, 'end', 0.0) or 0.0)
+            prob = get_attr(w, 'probability', None)
+            word_prob.append(np.nan if prob is None else prob)
+            word_text.append(get_attr(w, 'word', '') or '')
+    
+    seg_blob, seg_offsets = pack_strings(seg_text)
+    word_blob, word_offsets = pack_strings(word_text)
+    return {
+        'seg_start': np.asarray(seg_start, dtype=np.float64),
+        'seg_end': np.asarray(seg_end, dtype=np.float64),
+        'seg_text': seg_blob, 'seg_text_offsets': seg_offsets,
+        'word_seg': np.asarray(word_seg, dtype=np.int32),
+        'word_start': np.asarray(word_start, dtype=np.float64),
+        'word_end': np.asarray(word_end, dtype=np.float64),
+        'word_prob': np.asarray(word_prob, dtype=np.float32),
+        'word_text': word_blob, 'word_text_offsets': word_offsets,
+    }
+
+def save_cached_result(key, compact):
+    path = os.path.join(get_cache_dir("results"), key + ".npz")
+    with atomic_output(path, ".npz") as tmp:
+        np.savez_compressed(tmp, **compact)
+
+def load_cached_result(key):
+    path = os.path.join(CACHE_DIR, "results", key + ".npz")
+    if not os.path.exists(path): return None
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+# ================= 歌词重建 =================
+CLEAN_TOKEN_PATTERN = re.compile(r'[^\w\u4e00-\u9fa5\u3040-\u309f\u30a0-\u30ff]')
+REF_TOKEN_PATTERN = re.compile(r'([a-zA-Z0-9\']+|[\u4e00-\u9fa5\u3040-\u309f\u30a0-\u30ff])')
+CJK_CHAR_PATTERN = re.compile(r'([\u4e00-\u9fa5\u3040-\u309f\u30a0-\u30ff])')
+
+def clean_token(text):
+    return CLEAN_TOKEN_PATTERN.sub('', text).lower()
+
+def preprocess_cjk_spaces(text):
+    if not text: return text
+    spaced = CJK_CHAR_PATTERN.sub(r' \1 ', text)
+    return re.sub(r'\s+', ' ', spaced).strip()
+
+def format_time(seconds, time_offset=0.0):
+    final_sec = max(0, float(seconds) + time_offset)
+    m = int(final_sec // 60)
+    s = int(final_sec % 60)
+    ms = int((final_sec % 1) * 1000)
+    return f"{m:02d}:{s:02d}.{ms:03d}"
+
+class WordPool:
+    """
+    AI 识别结果的结构数组表示：词的起止时间/置信度为 NumPy 数组，
+    清洗后的词文本驻留为整数 id，对齐与插值只访问这些数组。
+    """
+    def __init__(self, compact):
+        self.seg_start = compact['seg_start']
+        self.seg_end = compact['seg_end']
+        self.seg_texts = unpack_strings(compact['seg_text'], compact['seg_text_offsets'])
+        self.start = compact['word_start']
+        self.end = compact['word_end']
+        self.prob = compact['word_prob']
+        self.vocab = {}
+        raw_ids = {}
+        words = unpack_strings(compact['word_text'], compact['word_text_offsets'])
+        # 相同原文只清洗一次
+        self.text_ids = np.fromiter(
+            (raw_ids[w] if w in raw_ids else raw_ids.setdefault(w, self.intern(clean_token(w))) for w in words),
+            dtype=np.int32, count=len(words))
+
+    def intern(self, text):
+        return self.vocab.setdefault(text, len(self.vocab))
+
+    def vocab_list(self):
+        return list(self.vocab)
+
+    def __len__(self):
+        return len(self.start)
+
+class RefTokens:
+    """参考歌词分词结果：所有行的词平铺存放，line_offsets 为每行在平铺数组中的起止位置"""
+    def __init__(self, lines, intern):
+        self.texts = []
+        self.pres = []
+        self.tails = []
+        offsets = [0]
+        for target_line in lines:
+            last_end_idx = 0
+            for match in REF_TOKEN_PATTERN.finditer(target_line):
+                self.pres.append(target_line[last_end_idx:match.start()].replace("\n", ""))
+                self.texts.append(match.group())
+                last_end_idx = match.end()
+            self.tails.append(target_line[last_end_idx:])
+            offsets.append(len(self.texts))
+        self.line_offsets = np.asarray(offsets, dtype=np.int64)
+        self.ids = np.fromiter((intern(clean_token(t)) for t in self.texts), dtype=np.int32, count=len(self.texts))
+
+    def __len__(self):
+        return len(self.texts)
+
+def repair_timestamps(times, start_floor=0.0, min_duration=MIN_DURATION, max_gap=MAX_INTERP_GAP):
+    """
+    整首歌的时间戳修复 (全部向量化)，times 中 NaN 表示未匹配：
+    1. 丢弃早于之前锚点的匹配时间 (时间倒退的锚点不可信)；
+    2. 前向/后向填充得到每个词前后最近的锚点，按锚点间距线性插值，
+       每个词的间隔限制在 [min_duration, max_gap]，没有后续锚点时按 max_gap 递增；
+    3. 累计最大值保证每个词比前一个词至少晚 min_duration (第一个词不早于 start_floor + min_duration)。
+    返回新的 float64 数组。
+    """
+    t = np.array(times, dtype=np.float64)
+    n = len(t)
+    if n == 0: return t
+    idx = np.arange(n)
+    
+    known = ~np.isnan(t)
+    running_max = np.maximum.accumulate(np.where(known, t, -np.inf))
+    prior_max = np.concatenate(([start_floor], np.maximum(running_max[:-1], start_floor)))
+    known &= t >= prior_max
+    
+    # 前后最近锚点 (前面没有锚点时以 start_floor 作为位置 -1 的虚拟锚点)
+    prev_idx = np.maximum.accumulate(np.where(known, idx, -1))
+    next_idx = np.minimum.accumulate(np.where(known, idx, n)[::-1])[::-1]
+    prev_time = np.where(prev_idx >= 0, t[np.maximum(prev_idx, 0)], start_floor)
+    has_next = next_idx < n
+    next_time = t[np.minimum(next_idx, n - 1)]
+    span = np.where(has_next, np.maximum(next_idx - prev_idx, 1), 1)
+    rate = np.where(has_next, (next_time - prev_time) / span, max_gap)
+    rate = np.clip(rate, min_duration, max_gap)
+    filled = np.where(known, t, prev_time + (idx - prev_idx) * rate)
+    
+    # 单调修正：y[i] = max(x[i], y[i-1] + min_duration)
+    ramp = idx * min_duration
+    return np.maximum.accumulate(np.maximum(filled - ramp, start_floor + min_duration)) + ramp
+
+def reconstruct_timed(pool, parser, time_offset=0.0, align_band=ALIGN_BAND,
+                      stop_event=None, channel=None):
+    """识别结果 + 参考歌词 -> TimedTokens；被停止时返回 None"""
+    builder = TimedTokensBuilder()
+    for h in parser.headers: builder.text_line(h)
+    if parser.headers: builder.text_line("")
+    
+    # 无参考文本：直接转录
+    if not parser.lines_text:
+        starts = seconds_to_ms(pool.seg_start, time_offset).tolist()
+        ends = seconds_to_ms(pool.seg_end, time_offset).tolist()
+        for start, end, text in zip(starts, ends, pool.seg_texts):
+            if stop_event is not None and stop_event.is_set(): return None
+            text = text.strip()
+            if text: builder.timed_line(start, text, end)
+        return builder.build()
+    
+    # 有参考文本：双语对齐逻辑
+    if channel is not None: channel.status("正在执行双语防撞对齐...")
+    ref = RefTokens(parser.lines_text, pool.intern)
+    
+    # 整首歌的参考词序列与 AI 词序列做全局对齐
+    matched_idx = align_tokens_banded(ref.ids, pool.text_ids, pool.vocab_list(), align_band)
+    matched_time = np.where(matched_idx >= 0, pool.start[np.maximum(matched_idx, 0)] if len(pool) else 0.0, np.nan)
+    # 整首歌一次性补全未匹配词的时间并保证单调
+    times = repair_timestamps(matched_time)
+    if stop_event is not None and stop_event.is_set(): return None
+    
+    builder.ref_lines(ref, parser.lines_text, seconds_to_ms(times, time_offset).tolist(),
+                      matched_end_ms(matched_idx, pool.end, time_offset).tolist(), parser.translations)
+    return builder.build()
+
+def reconstruct_lrc_smart(pool, parser, time_offset=0.0, align_band=ALIGN_BAND,
+                          stop_event=None, channel=None):
+    timed = reconstruct_timed(pool, parser, time_offset, align_band, stop_event, channel)
+    return "" if timed is None else export_timed(timed, 'lrc')
+
+# ================= 时间轴中间格式 =================
+LINE_LYRIC, LINE_TRANSLATION, LINE_TEXT = 0, 1, 2     # 行类型：歌词行 / 翻译行 / 无时间的文本行 (头信息等)
+TIMED_KIND_NAMES = ("lyric", "translation", "text")
+TIMED_TOKEN_TAIL_MS = 600     # 行末的词没有结束时间可参照时的默认时长
+TIMED_LINE_TAIL_MS = 3000     # 整行没有结束时间可参照时的默认时长
+TIMED_MAGIC = b"AKTT"
+TIMED_VERSION = 1
+TIMED_ALIGN = 64              # 文件中每个数组按 64 字节对齐，可直接内存映射
+TIMED_CACHE_FILES = 256       # cache/timed 中保留的时间轴文件数
+TIMED_ARRAYS = ('line_kind', 'line_start', 'line_end', 'line_parent', 'line_tokens',
+                'line_text', 'line_text_offsets', 'tok_start', 'tok_end',
+                'tok_pre', 'tok_pre_offsets', 'tok_text', 'tok_text_offsets')
+TIMED_STRINGS = ('line_text', 'tok_pre', 'tok_text')
+
+def seconds_to_ms(seconds, time_offset=0.0):
+    """秒 (加偏移，不早于 0) -> 整数毫秒数组，截断方式与 format_time 相同"""
+    sec = np.maximum(np.asarray(seconds, dtype=np.float64) + time_offset, 0.0)
+    return ((sec // 60) * 60000 + (sec % 60 // 1) * 1000 + np.floor(sec % 1 * 1000)).astype(np.int64)
+
+def matched_end_ms(matched, end, time_offset=0.0):
+    """对齐到的 AI 词的结束时间 (ms)，未匹配的参考词为 -1"""
+    if not len(end): return np.full(len(matched), -1, dtype=np.int64)
+    return np.where(matched >= 0, seconds_to_ms(end[np.maximum(matched, 0)], time_offset), -1)
+
+class TimedTokens:
+    """
+    时间轴中间表示：行与词平铺为整数毫秒数组，文本按 pack_strings 打包为 UTF-8 字节块。
+    line_tokens 为每行在词数组中的起止位置；翻译行的 line_parent 指向所属歌词行 (其余为 -1)；
+    line_text 是行内最后一个词之后的文本 (没有词的行即整行文本)，tok_pre 是每个词之前的非词文本。
+    数组可以直接是内存映射的文件内容，各导出格式都只顺序遍历一次，不再解析文本。
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.line_kind = arrays['line_kind']
+        self.line_start = arrays['line_start']
+        self.line_end = arrays['line_end']
+        self.line_parent = arrays['line_parent']
+        self.line_tokens = arrays['line_tokens']
+        self.tok_start = arrays['tok_start']
+        self.tok_end = arrays['tok_end']
+        self.decoded = {}
+
+    def __len__(self):
+        return len(self.line_kind)
+
+    def strings(self, name):
+        """解码一列文本 (只解码一次)"""
+        if name not in self.decoded:
+            self.decoded[name] = unpack_strings(self.arrays[name], self.arrays[name + '_offsets'])
+        return self.decoded[name]
+
+    def columns(self):
+        """导出时顺序遍历的行数据：(类型, 行首, 行尾, 所属行, 词起止位置) 的 Python 列表"""
+        return (self.line_kind.tolist(), self.line_start.tolist(), self.line_end.tolist(),
+                self.line_parent.tolist(), self.line_tokens.tolist())
+
+    def plain(self, i, lo, hi):
+        """第 i 行去掉时间后的文本"""
+        pres, texts = self.strings('tok_pre'), self.strings('tok_text')
+        return "".join(pres[k] + texts[k] for k in range(lo, hi)) + self.strings('line_text')[i]
+
+    @classmethod
+    def concat(cls, parts):
+        """按顺序拼接多段 (流式模式每个窗口确定的行)"""
+        parts = [p for p in parts if len(p)]
+        if not parts: return TimedTokensBuilder().build()
+        if len(parts) == 1: return parts[0]
+        line_base = np.cumsum([0] + [len(p) for p in parts[:-1]])
+        tok_base = np.cumsum([0] + [len(p.tok_start) for p in parts[:-1]])
+        arrays = {name: np.concatenate([p.arrays[name] for p in parts])
+                  for name in ('line_kind', 'line_start', 'line_end', 'tok_start', 'tok_end')}
+        arrays['line_parent'] = np.concatenate([np.where(p.line_parent >= 0, p.line_parent + b, -1).astype(np.int32)
+                                                for p, b in zip(parts, line_base)])
+        arrays['line_tokens'] = np.concatenate([np.zeros(1, dtype=np.int32)] +
+                                               [p.line_tokens[1:] + b for p, b in zip(parts, tok_base)]).astype(np.int32)
+        for name in TIMED_STRINGS:
+            blobs = [p.arrays[name] for p in parts]
+            base = np.cumsum([0] + [len(b) for b in blobs[:-1]])
+            arrays[name] = np.concatenate(blobs)
+            arrays[name + '_offsets'] = np.concatenate(
+                [np.zeros(1, dtype=np.int64)] + [p.arrays[name + '_offsets'][1:] + b for p, b in zip(parts, base)])
+        return cls(arrays)
+
+class TimedTokensBuilder:
+    """逐行追加时间轴数据，build() 时一次性转为数组并补全缺失的结束时间"""
+    def __init__(self):
+        self.kind, self.start, self.end, self.parent, self.text = [], [], [], [], []
+        self.bounds = [0]
+        self.tok_start, self.tok_end, self.tok_pre, self.tok_text = [], [], [], []
+        self.last_lyric = -1
+
+    def line(self, kind, start, end, text, parent=-1):
+        self.kind.append(kind)
+        self.start.append(start)
+        self.end.append(end)
+        self.parent.append(parent)
+        self.text.append(text)
+        self.bounds.append(len(self.tok_start))
+        if kind == LINE_LYRIC: self.last_lyric = len(self.kind) - 1
+
+    def text_line(self, text):
+        self.line(LINE_TEXT, -1, -1, text)
+
+    def timed_line(self, start, text, end=-1):
+        """没有逐字时间的整行 (直接转录的段落)"""
+        self.line(LINE_LYRIC, start, end, text)
+
+    def token_line(self, starts, pres, texts, tail="", ends=None):
+        """逐字行：starts/ends 为各词的起止时间 (ms，结束时间未知为 -1)"""
+        self.tok_start.extend(starts)
+        self.tok_end.extend([-1] * len(starts) if ends is None else ends)
+        self.tok_pre.extend(pres)
+        self.tok_text.extend(texts)
+        self.line(LINE_LYRIC, starts[0], -1, tail)
+
+    def copy_line(self, timed, i):
+        """原样复制另一个 TimedTokens 的第 i 行 (翻译行挂到当前最近的歌词行)"""
+        kind = int(timed.line_kind[i])
+        text = timed.strings('line_text')[i]
+        if kind == LINE_TRANSLATION: return self.translation(text)
+        lo, hi = int(timed.line_tokens[i]), int(timed.line_tokens[i + 1])
+        self.tok_start.extend(timed.tok_start[lo:hi].tolist())
+        self.tok_end.extend(timed.tok_end[lo:hi].tolist())
+        self.tok_pre.extend(timed.strings('tok_pre')[lo:hi])
+        self.tok_text.extend(timed.strings('tok_text')[lo:hi])
+        self.line(kind, int(timed.line_start[i]), int(timed.line_end[i]), text)
+
+    def translation(self, text):
+        """挂在最近一个歌词行之后的翻译行，时间与该行相同"""
+        parent = self.last_lyric
+        if parent < 0: self.text_line(text)
+        else: self.line(LINE_TRANSLATION, self.start[parent], -1, text, parent)
+
+    def ref_lines(self, ref, lines, starts, ends, translations, index_base=0):
+        """按参考歌词的分词结果追加若干行 (starts/ends 与 ref 的平铺下标对应)，翻译行跟在所属行之后"""
+        bounds = ref.line_offsets.tolist()
+        for i, target_line in enumerate(lines):
+            lo, hi = bounds[i], bounds[i + 1]
+            if hi == lo:
+                self.text_line(target_line)
+                continue
+            self.token_line(starts[lo:hi], ref.pres[lo:hi], ref.texts[lo:hi], ref.tails[i], ends[lo:hi])
+            for trans_text in translations.get(index_base + i, []): self.translation(trans_text)
+
+    def build(self):
+        kind = np.asarray(self.kind, dtype=np.int8)
+        start = np.asarray(self.start, dtype=np.int64)
+        parent = np.asarray(self.parent, dtype=np.int32)
+        bounds = np.asarray(self.bounds, dtype=np.int64)
+        tok_start = np.asarray(self.tok_start, dtype=np.int64)
+        
+        # 词的结束时间：不晚于下一个词的开始；行末的词没有结束时间时按默认时长
+        next_start = np.append(tok_start[1:], np.iinfo(np.int32).max)[:len(tok_start)]
+        line_of = np.repeat(np.arange(len(kind)), np.diff(bounds))
+        same_line = np.append(line_of[1:] == line_of[:-1], False)
+        limit = np.where(same_line, next_start, np.minimum(next_start, tok_start + TIMED_TOKEN_TAIL_MS))
+        hint = np.asarray(self.tok_end, dtype=np.int64)
+        tok_end = np.maximum(np.where(hint >= 0, np.minimum(hint, limit), limit), tok_start)
+        
+        # 行的结束时间：最后一个词的结束，或给定的段落结束；不晚于下一个歌词行的开始
+        has_tokens = np.diff(bounds) > 0
+        end = np.where(has_tokens, tok_end[np.maximum(bounds[1:] - 1, 0)] if len(tok_end) else -1,
+                       np.asarray(self.end, dtype=np.int64))
+        lyric = np.flatnonzero(kind == LINE_LYRIC)
+        s = start[lyric]
+        following = np.append(s[1:], np.iinfo(np.int32).max)[:len(s)]
+        cap = np.where(following > s, following, s + TIMED_LINE_TAIL_MS)
+        e = end[lyric]
+        end[lyric] = np.maximum(np.where(e >= 0, np.minimum(e, cap), np.minimum(s + TIMED_LINE_TAIL_MS, cap)), s)
+        translation = np.flatnonzero(kind == LINE_TRANSLATION)
+        end[translation] = end[parent[translation]]
+        
+        arrays = {
+            'line_kind': kind, 'line_start': start.astype(np.int32), 'line_end': end.astype(np.int32),
+            'line_parent': parent, 'line_tokens': bounds.astype(np.int32),
+            'tok_start': tok_start.astype(np.int32), 'tok_end': tok_end.astype(np.int32),
+        }
+        for name, strings in (('line_text', self.text), ('tok_pre', self.tok_pre), ('tok_text', self.tok_text)):
+            arrays[name], arrays[name + '_offsets'] = pack_strings(strings)
+        return TimedTokens(arrays)
+
+def split_row_tokens(texts):
+    """校准表格一行的文本片段 -> (词前文本, 词)：片段末尾的空白归到下一个词之前，与参考歌词的分词一致"""
+    words = [t.rstrip() for t in texts[:-1]] + [texts[-1]]
+    return [""] + [t[len(w):] for t, w in zip(texts[:-1], words)], words
+
+def timed_from_rows(starts, rows, base=None, lines=None):
+    """
+    校准表格的行 (行首时间, (逐字时间, 文本片段)) -> TimedTokens；第一个时间标签前的片段作为行首的词。
+    base/lines 为载入表格时的时间轴与每行对应的行号 (rows_from_timed 的结果)：
+    未修改的行原样复制 (保留行类型、词的结束时间与分词)，修改过的行保留原来的行类型与未移动的词的结束时间。
+    """
+    builder = TimedTokensBuilder()
+    copied = 0
+    for r, (start, (times, texts)) in enumerate(zip(np.asarray(starts).tolist(), rows)):
+        kind = None
+        if base is not None:
+            line = lines[r]
+            # 表格中略过的空文本行
+            for i in range(copied, line): builder.copy_line(base, i)
+            copied = line + 1
+            if row_unchanged(base, line, start, times, texts):
+                builder.copy_line(base, line)
+                continue
+            kind = int(base.line_kind[line])
+        if kind is None:
+            if start < 0: kind = LINE_TEXT
+            elif len(times) or builder.last_lyric < 0 or builder.start[builder.last_lyric] != start: kind = LINE_LYRIC
+            else: kind = LINE_TRANSLATION
+        
+        if kind == LINE_TEXT:
+            builder.text_line((f"[{format_ms(start)}]" if start >= 0 else "") + render_lrc_row(times, texts))
+        elif kind == LINE_TRANSLATION:
+            builder.translation(render_lrc_row(times, texts))
+        elif len(times):
+            tok_starts = [start] + times.tolist()
+            ends = [-1] * len(tok_starts)
+            if base is not None:
+                # 开始时间没有改动的词保留原来的结束时间
+                lo, hi = base.line_tokens[line], base.line_tokens[line + 1]
+                for k, (old_start, old_end) in enumerate(zip(base.tok_start[lo:hi].tolist(), base.tok_end[lo:hi].tolist())):
+                    if k < len(ends) and tok_starts[k] == old_start: ends[k] = old_end
+            builder.token_line(tok_starts, *split_row_tokens(texts), ends=ends)
+        else:
+            end = int(base.line_end[line]) if base is not None and start == base.line_start[line] else -1
+            builder.timed_line(start, texts[0], end)
+    if base is not None:
+        for i in range(copied, len(base)): builder.copy_line(base, i)
+    return builder.build()
+
+def timed_from_lrc(content):
+    """逐字 LRC 文本 -> TimedTokens (用于手动修改过的文本，只解析这一次)"""
+    return timed_from_rows(*parse_lrc_rows(content))
+
+def timed_row(timed, i):
+    """TimedTokens 的第 i 行 -> 校准表格的一行 (行首时间, (逐字时间, 文本片段))；空的文本行返回 None"""
+    lo, hi = int(timed.line_tokens[i]), int(timed.line_tokens[i + 1])
+    tail = timed.strings('line_text')[i]
+    kind = timed.line_kind[i]
+    if kind == LINE_TEXT:
+        line = tail.strip()
+        return parse_lrc_line(line) if line else None
+    if lo == hi:
+        return int(timed.line_start[i]), (np.zeros(0, dtype=np.int64), [tail.rstrip()])
+    pres, texts = timed.strings('tok_pre'), timed.strings('tok_text')
+    tok_start = timed.tok_start[lo:hi].tolist()
+    parts = [(pres[lo] if pres[lo].strip() else "") + texts[lo]]
+    for k in range(lo + 1, hi):
+        parts[-1] += pres[k]
+        parts.append(texts[k])
+    parts[-1] = (parts[-1] + tail).rstrip()
+    return tok_start[0], (np.asarray(tok_start[1:], dtype=np.int64), parts)
+
+def row_unchanged(timed, i, start, times, texts):
+    """表格的一行与时间轴第 i 行载入时的内容是否相同"""
+    row = timed_row(timed, i)
+    return (row is not None and row[0] == start and np.array_equal(row[1][0], times)
+            and row[1][1] == list(texts))
+
+def rows_from_timed(timed):
+    """
+    TimedTokens -> 校准表格的 (各行行首时间, 各行逐字数据, 各行对应的时间轴行号)，
+    前两项与 parse_lrc_rows(逐字 LRC 导出结果) 相同；行号供 timed_from_rows 还原未修改的行
+    """
+    starts, rows, lines = [], [], []
+    for i in range(len(timed)):
+        row = timed_row(timed, i)
+        if row is None: continue
+        starts.append(row[0])
+        rows.append(row[1])
+        lines.append(i)
+    return starts, rows, lines
+
+def save_timed_tokens(path, timed):
+    """
+    写出时间轴文件：魔数 + 版本 + 头长度 (各 4 字节)，JSON 头记录每个数组的 dtype/长度/位置，
+    之后是按 TIMED_ALIGN 对齐的原始数组。
+    """
+    arrays = {name: np.ascontiguousarray(timed.arrays[name]) for name in TIMED_ARRAYS}
+    layout, size = {}, 0
+    for name, arr in arrays.items():
+        layout[name] = [arr.dtype.str, len(arr), size]
+        size += -(-arr.nbytes // TIMED_ALIGN) * TIMED_ALIGN
+    header = json.dumps({'arrays': layout}).encode('utf-8')
+    data_start = -(-(12 + len(header)) // TIMED_ALIGN) * TIMED_ALIGN
+    with atomic_output(path) as tmp, open(tmp, 'wb') as f:
+        f.write(TIMED_MAGIC + TIMED_VERSION.to_bytes(4, 'little') + len(header).to_bytes(4, 'little') + header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name][2])
+            f.write(arr.tobytes())
+        f.truncate(data_start + size)
+
+def load_timed_tokens(path):
+    """以内存映射方式打开时间轴文件，数组直接指向文件内容 (只读)"""
+    mm = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(mm[:4]) != TIMED_MAGIC: raise ValueError(f"不是时间轴文件: {path}")
+    version = int.from_bytes(bytes(mm[4:8]), 'little')
+    if version != TIMED_VERSION: raise ValueError(f"不支持的时间轴文件版本: {version}")
+    header_len = int.from_bytes(bytes(mm[8:12]), 'little')
+    layout = json.loads(bytes(mm[12:12 + header_len]).decode('utf-8'))['arrays']
+    data_start = -(-(12 + header_len) // TIMED_ALIGN) * TIMED_ALIGN
+    arrays = {}
+    for name, (dtype, count, offset) in layout.items():
+        dtype = np.dtype(dtype)
+        begin = data_start + offset
+        arrays[name] = mm[begin:begin + count * dtype.itemsize].view(dtype)
+    return TimedTokens(arrays)
+
+def timed_cache_path(lrc_text):
+    """按逐字 LRC 内容命名的时间轴文件：同名文件内容必然相同，不会覆盖正在被映射的文件"""
+    digest = hashlib.sha1(lrc_text.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(get_cache_dir("timed"), digest + ".tt")
+
+def prune_timed_cache(keep=TIMED_CACHE_FILES):
+    directory = get_cache_dir("timed")
+    paths = sorted((os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(".tt")),
+                   key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try: os.remove(path)
+        except OSError: pass    # 仍被界面映射 (Windows)，下次再清理
+
+# --- 导出：每种格式都是对行/词数组的一次顺序遍历，逐行产出文本 ---
+ASS_HEADER = (
+    "[Script Info]", "ScriptType: v4.00+", "PlayResX: 1920", "PlayResY: 1080", "WrapStyle: 0", "",
+    "[V4+ Styles]",
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+    "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+    "MarginL, MarginR, MarginV, Encoding",
+    "Style: Default,Arial,64,&H0000A0FF,&H00FFFFFF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,3,0,2,60,60,120,1",
+    "Style: Translation,Arial,44,&H00E0E0E0,&H00E0E0E0,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,2,0,2,60,60,50,1",
+    "",
+    "[Events]",
+    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+)
+
+def format_srt_time(ms):
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def format_ass_time(ms):
+    cs = ms // 10
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+def ass_text(text):
+    return text.replace("{", "(").replace("}", ")")
+
+def iter_lrc(timed):
+    """逐字 LRC (本程序的输出格式)：行首标签，行内每个词前一个 [mm:ss.xxx]"""
+    kinds, starts, _, _, bounds = timed.columns()
+    tok_start = timed.tok_start.tolist()
+    pres, texts, tails = timed.strings('tok_pre'), timed.strings('tok_text'), timed.strings('line_text')
+    for i, kind in enumerate(kinds):
+        lo, hi = bounds[i], bounds[i + 1]
+        if kind == LINE_TEXT:
+            yield tails[i]
+        elif lo == hi:
+            yield f"[{format_ms(starts[i])}]{tails[i]}"
+        else:
+            parts = []
+            for k in range(lo, hi):
+                tag = f"[{format_ms(tok_start[k])}]"
+                if k == lo and pres[k].strip(): parts.append(tag + pres[k] + texts[k])
+                else: parts.append(pres[k] + tag + texts[k])
+            parts.append(tails[i])
+            yield "".join(parts)
+
+def iter_enhanced_lrc(timed):
+    """增强 LRC (A2 扩展)：行首 [mm:ss.xxx]，词前 <mm:ss.xxx>，行末附结束时间"""
+    kinds, starts, ends, _, bounds = timed.columns()
+    tok_start = timed.tok_start.tolist()
+    pres, texts, tails = timed.strings('tok_pre'), timed.strings('tok_text'), timed.strings('line_text')
+    for i, kind in enumerate(kinds):
+        lo, hi = bounds[i], bounds[i + 1]
+        if kind == LINE_TEXT:
+            yield tails[i]
+            continue
+        parts = [f"[{format_ms(starts[i])}]"]
+        for k in range(lo, hi):
+            parts.append(f"{pres[k] if k > lo else pres[k].lstrip()}<{format_ms(tok_start[k])}>{texts[k]}")
+        parts.append(tails[i])
+        if hi > lo: parts.append(f"<{format_ms(ends[i])}>")
+        yield "".join(parts)
+
+def iter_srt(timed):
+    """SRT 字幕：每个歌词行一条，翻译行作为同一条字幕的下一行"""
+    kinds, starts, ends, _, bounds = timed.columns()
+    cue, number = None, 0
+    for i, kind in enumerate(kinds):
+        if kind == LINE_TRANSLATION:
+            if cue: cue.append(timed.plain(i, bounds[i], bounds[i + 1]).strip())
+            continue
+        if kind != LINE_LYRIC: continue
+        if cue: yield from cue + [""]
+        number += 1
+        cue = [str(number), f"{format_srt_time(starts[i])} --> {format_srt_time(ends[i])}",
+               timed.plain(i, bounds[i], bounds[i + 1]).strip()]
+    if cue: yield from cue + [""]
+
+def iter_ass(timed):
+    """ASS 卡拉OK：逐字行用 {\\k} 标注每个词的时长 (厘秒)，翻译行使用单独的样式"""
+    yield from ASS_HEADER
+    kinds, starts, ends, _, bounds = timed.columns()
+    tok_start = timed.tok_start.tolist()
+    pres, texts, tails = timed.strings('tok_pre'), timed.strings('tok_text'), timed.strings('line_text')
+    for i, kind in enumerate(kinds):
+        if kind == LINE_TEXT: continue
+        lo, hi = bounds[i], bounds[i + 1]
+        style = "Translation" if kind == LINE_TRANSLATION else "Default"
+        if lo == hi:
+            text = ass_text(tails[i].strip())
+        else:
+            # 按厘秒边界取差，各段时长之和正好等于整行时长
+            marks = [t // 10 for t in tok_start[lo:hi]] + [ends[i] // 10]
+            parts = [f"{{\\k{max(0, marks[k - lo + 1] - marks[k - lo])}}}"
+                     f"{ass_text(pres[k] if k > lo else pres[k].lstrip())}{ass_text(texts[k])}" for k in range(lo, hi)]
+            text = "".join(parts) + ass_text(tails[i].rstrip())
+        yield f"Dialogue: 0,{format_ass_time(starts[i])},{format_ass_time(ends[i])},{style},,0,0,0,,{text}"
+
+def iter_json(timed):
+    """JSON：每行一个对象 (类型、起止时间、文本、逐词时间、翻译所属行)，逐行写出"""
+    yield '{"format": "autokaraoke-timed", "version": %d, "lines": [' % TIMED_VERSION
+    kinds, starts, ends, parents, bounds = timed.columns()
+    tok_start, tok_end = timed.tok_start.tolist(), timed.tok_end.tolist()
+    pres, texts = timed.strings('tok_pre'), timed.strings('tok_text')
+    pending = None
+    for i, kind in enumerate(kinds):
+        lo, hi = bounds[i], bounds[i + 1]
+        obj = {'kind': TIMED_KIND_NAMES[kind], 'text': timed.plain(i, lo, hi)}
+        if kind != LINE_TEXT: obj['start'], obj['end'] = starts[i], ends[i]
+        if kind == LINE_TRANSLATION: obj['parent'] = parents[i]
+        if hi > lo:
+            obj['tokens'] = []
+            for k in range(lo, hi):
+                token = {'start': tok_start[k], 'end': tok_end[k], 'text': texts[k]}
+                if pres[k]: token['pre'] = pres[k]
+                obj['tokens'].append(token)
+        if pending is not None: yield pending + ","
+        pending = "  " + json.dumps(obj, ensure_ascii=False)
+    if pending is not None: yield pending
+    yield "]}"
+
+# 格式名 -> (显示名称, 文件后缀, 导出函数)
+TIMED_FORMATS = {
+    'lrc': ("逐字 LRC", ".lrc", iter_lrc),
+    'elrc': ("增强 LRC", ".enhanced.lrc", iter_enhanced_lrc),
+    'srt': ("SRT 字幕", ".srt", iter_srt),
+    'ass': ("ASS 卡拉OK", ".ass", iter_ass),
+    'json': ("JSON 时间轴", ".json", iter_json),
+}
+
+def export_timed(timed, fmt):
+    return "\n".join(TIMED_FORMATS[fmt][2](timed))
+
+def write_timed(timed, fmt, path, encoding='utf-8'):
+    """边生成边写入文件，不在内存中拼接整个结果"""
+    with open(path, 'w', encoding=encoding) as f:
+        for n, line in enumerate(TIMED_FORMATS[fmt][2](timed)):
+            if n: f.write("\n")
+            f.write(line)
+
+def send_timed_result(channel, kind, timed):
+    """工作进程输出：时间轴写入文件并把路径发给界面，结果文本为由它导出的逐字 LRC"""
+    lrc_content = export_timed(timed, 'lrc')
+    try:
+        path = timed_cache_path(lrc_content)
+        if not os.path.exists(path):
+            save_timed_tokens(path, timed)
+            prune_timed_cache()
+        channel.timed(path)
+    except Exception as timed_error:
+        print(f"写入时间轴文件失败: {timed_error}")
+    channel.result(kind, lrc_content)
+
+# ================= 静音分块并行对齐 =================
+def decode_audio(path, sr=SAMPLE_RATE):
+    """用 FFmpeg 解码为单声道 float32 PCM (与 whisper.load_audio 相同的参数)"""
+    cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+           "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr), "-"]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"FFmpeg 解码失败: {e.stderr.decode(errors='ignore')[-300:]}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+def frame_energy(audio, sr=SAMPLE_RATE, frame_sec=0.05):
+    """逐帧 RMS 能量"""
+    frame = max(1, int(sr * frame_sec))
+    count = len(audio) // frame
+    if count == 0: return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(audio[:count * frame], dtype=np.float32).reshape(count, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+def split_on_silence(audio, sr=SAMPLE_RATE, max_sec=CHUNK_MAX_SEC, min_sec=CHUNK_MIN_SEC, frame_sec=0.05):
+    """
+    在低能量处切分音频：每块长度在 [min_sec, max_sec] 之间，切点取该范围内平滑能量最低的帧。
+    返回 [(起始采样, 结束采样), ...]，覆盖整段音频。
+    """
+    total = len(audio)
+    frame = max(1, int(sr * frame_sec))
+    energy = frame_energy(audio, sr, frame_sec)
+    if len(energy):
+        smooth = max(1, int(0.3 / frame_sec))
+        energy = np.convolve(energy, np.ones(smooth) / smooth, mode='same')
+    
+    chunks = []
+    start = 0
+    max_len, min_len = int(max_sec * sr), int(min_sec * sr)
+    while total - start > max_len:
+        lo_f = (start + min_len) // frame
+        hi_f = min((start + max_len) // frame, len(energy))
+        if hi_f > lo_f:
+            # 切在最安静区间的中间，避免切掉字头/字尾
+            best = lo_f + int(np.argmin(energy[lo_f:hi_f]))
+            run_end = best
+            while run_end + 1 < hi_f and energy[run_end + 1] <= energy[best] + 1e-6: run_end += 1
+            cut = (best + run_end) // 2 * frame
+        else:
+            cut = start + max_len
+        chunks.append((start, cut))
+        start = cut
+    if total > start: chunks.append((start, total))
+    return chunks
+
+def assign_lines_to_chunks(audio, chunks, line_weights, sr=SAMPLE_RATE):
+    """
+    按各块的有声时长比例分配参考歌词行：第 i 行的中点落在哪一块的累计有声区间内就归入该块。
+    返回每块对应的 (起始行, 结束行)。
+    """
+    voiced = []
+    energy = frame_energy(audio, sr)
+    threshold = 0.25 * np.percentile(energy, 90) if len(energy) else 0.0
+    for s, e in chunks:
+        seg = energy[s * len(energy) // max(1, len(audio)): e * len(energy) // max(1, len(audio))]
+        voiced.append(float(np.count_nonzero(seg > threshold)) + 1e-6)
+    chunk_edges = np.cumsum(voiced) / np.sum(voiced)
+    
+    weights = np.maximum(np.asarray(line_weights, dtype=np.float64), 1.0)
+    line_mid = (np.cumsum(weights) - weights / 2) / np.sum(weights)
+    owner = np.minimum(np.searchsorted(chunk_edges, line_mid), len(chunks) - 1)
+    
+    ranges = []
+    for c in range(len(chunks)):
+        idx = np.flatnonzero(owner == c)
+        ranges.append((int(idx[0]), int(idx[-1]) + 1) if len(idx) else (0, 0))
+    return ranges
+
+def concat_compact(parts, offsets):
+    """按各块的时间偏移拼接多个压缩结果"""
+    merged = {key: [] for key in ('seg_start', 'seg_end', 'word_seg', 'word_start', 'word_end', 'word_prob')}
+    seg_texts, word_texts = [], []
+    seg_count = 0
+    for compact, offset in zip(parts, offsets):
+        merged['seg_start'].append(compact['seg_start'] + offset)
+        merged['seg_end'].append(compact['seg_end'] + offset)
+        merged['word_seg'].append(compact['word_seg'] + seg_count)
+        merged['word_start'].append(compact['word_start'] + offset)
+        merged['word_end'].append(compact['word_end'] + offset)
+        merged['word_prob'].append(compact['word_prob'])
+        seg_texts.extend(unpack_strings(compact['seg_text'], compact['seg_text_offsets']))
+        word_texts.extend(unpack_strings(compact['word_text'], compact['word_text_offsets']))
+        seg_count += len(compact['seg_start'])
+    
+    dtypes = {'word_seg': np.int32, 'word_prob': np.float32}
+    result = {key: np.concatenate(arrs).astype(dtypes.get(key, np.float64)) if arrs else np.zeros(0, dtypes.get(key, np.float64))
+              for key, arrs in merged.items()}
+    result['seg_text'], result['seg_text_offsets'] = pack_strings(seg_texts)
+    result['word_text'], result['word_text_offsets'] = pack_strings(word_texts)
+    return result
+
+def audio_cache_path(path, suffix, sr=SAMPLE_RATE):
+    """cache/audio 下与某个音频文件绑定的缓存路径 (按内容哈希+修改时间)"""
+    key = f"{file_digest(path)}-{os.stat(path).st_mtime_ns}-{sr}"
+    return os.path.join(get_cache_dir("audio"), key + suffix)
+
+def load_audio_cached(path, sr=SAMPLE_RATE):
+    """
+    解码缓存：16kHz 单声道 float32 PCM 以 .npy 存放在 cache/audio 下 (按内容哈希+修改时间)，
+    以内存映射方式返回，同一首歌再次处理时不再调用 FFmpeg。
+    """
+    npy_path = audio_cache_path(path, ".npy", sr)
+    if not os.path.exists(npy_path):
+        audio = decode_audio(path, sr)
+        with atomic_output(npy_path, ".npy") as tmp:
+            np.save(tmp, audio)
+    return np.load(npy_path, mmap_mode='r')
+
+# ================= 增量重新对齐 =================
+def last_run_path(audio_hash, model_size, language, prompt, mode):
+    """同一音频/模型/语言/模式下最近一次对齐的记录 (参考歌词行 + 结果缓存键)"""
+    run_key = result_cache_key(audio_hash, model_size, language, prompt, mode, "")
+    return os.path.join(get_cache_dir("results"), f"last-{run_key}.json")
+
+def save_last_run(path, cache_key, lines):
+    write_json_atomic(path, {'key': cache_key, 'lines': lines}, ensure_ascii=False)
+
+def load_last_run(path):
+    """返回 (上次的歌词行, 上次的压缩结果)，记录或缓存缺失时返回 None"""
+    if not os.path.exists(path): return None
+    with open(path, encoding='utf-8') as file:
+        record = json.load(file)
+    compact = load_cached_result(record['key'])
+    if compact is None: return None
+    return record['lines'], compact
+
+def line_time_spans(compact, lines, align_band=ALIGN_BAND):
+    """
+    用与歌词重建相同的全局对齐求出每行在结果中的时间范围：
+    起点取行内匹配词的最早开始，终点取最晚结束；整行都没有匹配时为 NaN。
+    """
+    pool = WordPool(compact)
+    ref = RefTokens(lines, pool.intern)
+    starts = np.full(len(lines), np.nan)
+    ends = np.full(len(lines), np.nan)
+    matched = align_tokens_banded(ref.ids, pool.text_ids, pool.vocab_list(), align_band)
+    hit = matched >= 0
+    if hit.any():
+        rows = np.repeat(np.arange(len(lines)), np.diff(ref.line_offsets))[hit]
+        np.fmin.at(starts, rows, pool.start[matched[hit]])
+        np.fmax.at(ends, rows, pool.end[matched[hit]])
+    return starts, ends
+
+def plan_incremental(old_lines, new_lines, starts, ends, max_ratio=INCREMENTAL_MAX_RATIO):
+    """
+    对比新旧参考歌词：未改动且在旧结果中定位到的行作为锚点，保留原有时间。
+    相邻锚点之间若有新增/修改/删除的行，就形成一个需要重新对齐的区间
+    (前一锚点行的结束, 后一锚点行的开始, 新歌词起始行, 结束行)，首尾分别以 0 和 inf 为界。
+    改动行过多时返回 None，表示应整首重新对齐。
+    """
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    anchors = [(-1, -1)]
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal': continue
+        anchors.extend((i1 + k, j1 + k) for k in range(i2 - i1) if not np.isnan(starts[i1 + k]))
+    anchors.append((len(old_lines), len(new_lines)))
+    
+    spans = []
+    for (ip, jp), (iq, jq) in zip(anchors, anchors[1:]):
+        if iq == ip + 1 and jq == jp + 1: continue
+        t0 = float(ends[ip]) if ip >= 0 else 0.0
+        t1 = float(starts[iq]) if iq < len(old_lines) else float('inf')
+        spans.append((t0, max(t0, t1), jp + 1, jq))
+    changed = sum(b - a for _, _, a, b in spans)
+    if changed > max_ratio * max(1, len(new_lines)): return None
+    return spans
+
+def slice_compact(compact, t0, t1):
+    """取出开始时间落在 [t0, t1) 内的词及其所在段 (段的起止裁剪到区间内)"""
+    words = np.flatnonzero((compact['word_start'] >= t0) & (compact['word_start'] < t1))
+    segs, word_seg = np.unique(compact['word_seg'][words], return_inverse=True)
+    seg_texts = unpack_strings(compact['seg_text'], compact['seg_text_offsets'])
+    word_texts = unpack_strings(compact['word_text'], compact['word_text_offsets'])
+    result = {
+        'seg_start': np.clip(compact['seg_start'][segs], t0, t1),
+        'seg_end': np.clip(compact['seg_end'][segs], t0, t1),
+        'word_seg': word_seg.astype(np.int32),
+        'word_start': compact['word_start'][words],
+        'word_end': compact['word_end'][words],
+        'word_prob': compact['word_prob'][words],
+    }
+    result['seg_text'], result['seg_text_offsets'] = pack_strings([seg_texts[i] for i in segs])
+    result['word_text'], result['word_text_offsets'] = pack_strings([word_texts[i] for i in words])
+    return result
+
+def realign_spans(model, audio, compact, spans, lines, language, channel, stop_event, sr=SAMPLE_RATE):
+    """
+    只把改动区间内的音频与对应的新歌词送入模型强制对齐，
+    区间外沿用旧结果的词时间，按时间顺序拼接为新的压缩结果。
+    """
+    total = len(audio) / sr
+    pieces, offsets = [], []
+    cursor = 0.0
+    for k, (t0, t1, a, b) in enumerate(spans):
+        t0 = min(max(t0, cursor), total)
+        t1 = min(max(t1, t0), total)
+        pieces.append(slice_compact(compact, cursor, t0))
+        offsets.append(0.0)
+        if b > a and t1 - t0 >= INCREMENTAL_MIN_SEC:
+            clip = np.array(audio[int(t0 * sr):int(t1 * sr)], dtype=np.float32)
+            text = preprocess_cjk_spaces("\n".join(lines[a:b]))
+            result = model.align(clip, text, language=language, regroup=False)
+            pieces.append(compact_result(result))
+            offsets.append(t0)
+        cursor = t1
+        channel.progress((k + 1) / len(spans))
+        if stop_event.is_set(): return None
+    pieces.append(slice_compact(compact, cursor, np.inf))
+    offsets.append(0.0)
+    return concat_compact(pieces, offsets)
+
+# ================= 波形峰值金字塔 =================
+def compute_peak_pyramid(audio, block=WAVEFORM_BLOCK, min_peaks=WAVEFORM_MIN_PEAKS):
+    """
+    min/max 峰值金字塔：第 0 层每 block 个采样取一对 min/max，之后每层两两合并，
+    直到峰值数不超过 min_peaks。各层首尾相接存放，offsets 为每层的起止位置。
+    """
+    full = len(audio) // block * block
+    mins = [audio[:full].reshape(-1, block).min(axis=1)]
+    maxs = [audio[:full].reshape(-1, block).max(axis=1)]
+    if full < len(audio):
+        mins[0] = np.append(mins[0], audio[full:].min())
+        maxs[0] = np.append(maxs[0], audio[full:].max())
+    while len(mins[-1]) > min_peaks:
+        lo, hi = mins[-1], maxs[-1]
+        if len(lo) % 2:
+            lo, hi = np.append(lo, lo[-1]), np.append(hi, hi[-1])
+        mins.append(np.minimum(lo[0::2], lo[1::2]))
+        maxs.append(np.maximum(hi[0::2], hi[1::2]))
+    offsets = np.zeros(len(mins) + 1, dtype=np.int64)
+    np.cumsum([len(m) for m in mins], out=offsets[1:])
+    return np.concatenate(mins).astype(np.float16), np.concatenate(maxs).astype(np.float16), offsets
+
+class PeakPyramid:
+    """波形峰值金字塔，按缩放比例选择层级，绘制时不再访问原始采样"""
+    def __init__(self, mins, maxs, offsets, block=WAVEFORM_BLOCK, sr=SAMPLE_RATE):
+        self.mins = mins
+        self.maxs = maxs
+        self.offsets = offsets
+        self.block = int(block)
+        self.sr = int(sr)
+
+    @property
+    def levels(self):
+        return len(self.offsets) - 1
+
+    @property
+    def duration_ms(self):
+        return (self.offsets[1] - self.offsets[0]) * self.block_ms(0)
+
+    def block_ms(self, level):
+        return self.block * (1 << level) * 1000.0 / self.sr
+
+    def level_for(self, ms_per_px):
+        """每像素不少于一个峰值的最粗层级"""
+        level = 0
+        while level + 1 < self.levels and self.block_ms(level + 1) <= ms_per_px: level += 1
+        return level
+
+    def level(self, level):
+        lo, hi = self.offsets[level], self.offsets[level + 1]
+        return self.mins[lo:hi], self.maxs[lo:hi]
+
+    def columns(self, start_ms, ms_per_px, width):
+        """把 [start_ms, start_ms + width * ms_per_px) 聚合为每像素一列的 (min, max)，没有音频的列为 NaN"""
+        level = self.level_for(ms_per_px)
+        mins, maxs = self.level(level)
+        edges = np.floor((start_ms + np.arange(width + 1) * ms_per_px) / self.block_ms(level)).astype(np.int64)
+        col_min = np.full(width, np.nan, dtype=np.float32)
+        col_max = np.full(width, np.nan, dtype=np.float32)
+        valid = np.flatnonzero((edges[:-1] >= 0) & (edges[:-1] < len(mins)))
+        if len(valid):
+            end = min(len(mins), max(edges[valid[-1] + 1], edges[valid[-1]] + 1))
+            col_min[valid] = np.minimum.reduceat(mins[:end], edges[valid])
+            col_max[valid] = np.maximum.reduceat(maxs[:end], edges[valid])
+        return col_min, col_max
+
+def load_peak_pyramid(path, sr=SAMPLE_RATE):
+    """读取 (必要时计算并保存) 与解码缓存放在一起的波形峰值金字塔"""
+    npz_path = audio_cache_path(path, ".peaks.npz", sr)
+    if not os.path.exists(npz_path):
+        mins, maxs, offsets = compute_peak_pyramid(load_audio_cached(path, sr))
+        with atomic_output(npz_path, ".npz") as tmp:
+            np.savez(tmp, mins=mins, maxs=maxs, offsets=offsets, block=WAVEFORM_BLOCK, sr=sr)
+    with np.load(npz_path) as data:
+        return PeakPyramid(data['mins'], data['maxs'], data['offsets'], data['block'], data['sr'])
+
+# ================= 人声分离 (CPU) =================
+def stream_pcm(path, sr=SAMPLE_RATE, channels=2, block=VOCAL_CHUNK):
+    """FFmpeg 流式解码，逐块产出 (采样数, 声道) 的 float32 数组"""
+    cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+           "-f", "s16le", "-ac", str(channels), "-acodec", "pcm_s16le", "-ar", str(sr), "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            raw = proc.stdout.read(block * channels * 2)
+            if not raw: break
+            yield np.frombuffer(raw, np.int16).reshape(-1, channels).astype(np.float32) / 32768.0
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+def stft_frames(x, n_fft, hop, window):
+    """(采样数, 声道) -> (帧, 声道, 频点) 的复数谱"""
+    frames = np.lib.stride_tricks.sliding_window_view(x, n_fft, axis=0)[::hop]
+    return np.fft.rfft(frames * window, axis=-1)
+
+def overlap_add(frames, hop):
+    t, n = frames.shape
+    pieces = frames.reshape(t, n // hop, hop)
+    out = np.zeros((t + n // hop - 1, hop), dtype=np.float64)
+    for k in range(n // hop): out[k:k + t] += pieces[:, k]
+    return out.reshape(-1)
+
+def median_filter(x, size, axis):
+    half = size // 2
+    pad = [(0, 0)] * x.ndim
+    pad[axis] = (half, half)
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(x, pad, mode='edge'), size, axis=axis)
+    return np.median(windows, axis=-1)
+
+def separate_chunk(x, method, n_fft=VOCAL_N_FFT, hop=VOCAL_HOP):
+    """
+    对一段 (采样数, 声道) 的 PCM 估计人声，返回等长单声道。
+    center: 保留左右声道同相同幅的成分 (人声通常居中)；hpss: 谐波/打击乐中值滤波软掩码，去掉鼓点。
+    """
+    n = len(x)
+    total = n + 2 * n_fft
+    total += -(total - n_fft) % hop
+    padded = np.zeros((total, x.shape[1]), dtype=np.float32)
+    padded[n_fft:n_fft + n] = x
+    window = np.sqrt(np.hanning(n_fft + 1)[:-1]).astype(np.float32)
+    spec = stft_frames(padded, n_fft, hop, window)
+    mid = spec.mean(axis=1)
+    if method == 'center' and spec.shape[1] == 2:
+        left, right = spec[:, 0], spec[:, 1]
+        power = np.abs(left) ** 2 + np.abs(right) ** 2 + 1e-10
+        mask = np.clip(2 * np.real(left * np.conj(right)) / power, 0.0, 1.0) ** 2
+    elif method == 'hpss':
+        mag = np.abs(mid)
+        harmonic = median_filter(mag, VOCAL_MEDIAN, axis=0) ** 2
+        percussive = median_filter(mag, VOCAL_MEDIAN, axis=1) ** 2
+        mask = harmonic / (harmonic + percussive + 1e-10)
+    else:
+        mask = 1.0
+    # sqrt-Hann 分析/合成窗在 hop = n_fft/4 时叠加和为 2
+    y = overlap_add(np.fft.irfft(mid * mask, n=n_fft, axis=-1) * window, hop) / (n_fft / (2 * hop))
+    return y[n_fft:n_fft + n].astype(np.float32)
+
+def separate_stream(blocks, out, method, chunk=VOCAL_CHUNK, margin=VOCAL_MARGIN,
+                    stop_event=None, progress=None):
+    """
+    流式人声分离：每次取 [pos - margin, pos + chunk + margin) 计算，只写回中间的 [pos, pos + chunk)，
+    两侧上下文足以覆盖窗长与中值滤波，因此结果与整首一次性处理相同。返回是否完成。
+    """
+    buf, buf_start, pos = None, 0, 0
+    blocks = iter(blocks)
+    finished = False
+    while pos < len(out) and not finished:
+        block = next(blocks, None)
+        if block is None: finished = True
+        else: buf = block if buf is None else np.concatenate([buf, block])
+        if buf is None: break
+        while pos < len(out):
+            if stop_event is not None and stop_event.is_set(): return False
+            available = buf_start + len(buf)
+            if not finished and available < pos + chunk + margin: break
+            if pos >= available: break
+            lo, hi = max(buf_start, pos - margin), min(available, pos + chunk + margin)
+            y = separate_chunk(buf[lo - buf_start:hi - buf_start], method)
+            count = min(chunk, available - pos, len(out) - pos)
+            out[pos:pos + count] = y[pos - lo:pos - lo + count]
+            pos += count
+            if pos - margin > buf_start:
+                buf = buf[pos - margin - buf_start:]
+                buf_start = pos - margin
+            if progress is not None: progress(pos / len(out))
+    return True
+
+def load_vocals_cached(path, method, sr=SAMPLE_RATE, stop_event=None, progress=None):
+    """
+    人声分离缓存：与解码缓存同样按内容哈希存放在 cache/audio 下，以内存映射方式返回。
+    输出边算边写入磁盘上的 .npy，内存占用只与块大小有关。停止时返回 None。
+    """
+    npy_path = audio_cache_path(path, f".vocals-{method}.npy", sr)
+    if not os.path.exists(npy_path):
+        mono = load_audio_cached(path, sr)
+        if method == 'center':
+            blocks = stream_pcm(path, sr, channels=2)
+        else:
+            blocks = (mono[i:i + VOCAL_CHUNK, None] for i in range(0, len(mono), VOCAL_CHUNK))
+        with atomic_output(npy_path, ".npy") as tmp:
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(len(mono),))
+            try:
+                done = separate_stream(blocks, out, method, stop_event=stop_event, progress=progress)
+                out.flush()
+            finally:
+                del out
+            if not done: os.remove(tmp)
+        if not done: return None
+    return np.load(npy_path, mmap_mode='r')
+
+# ================= 语言检测 =================
+def pick_voiced_windows(audio, count=LANG_DETECT_WINDOWS, window_sec=30, sr=SAMPLE_RATE):
+    """
+    把音频等分为 count 段，每段内选有声帧最多的 window_sec 窗口 (避开纯伴奏前奏)。
+    返回各窗口的起始采样位置。
+    """
+    window = int(window_sec * sr)
+    if len(audio) <= window: return [0]
+    energy = frame_energy(audio, sr, 1.0)                   # 每秒一帧
+    voiced = (energy > 0.25 * np.percentile(energy, 90)).astype(np.float64)
+    win_frames = int(window_sec)
+    # 每个候选起点 (按秒) 的窗口内有声秒数
+    csum = np.concatenate(([0.0], np.cumsum(voiced)))
+    n_start = max(1, len(voiced) - win_frames + 1)
+    score = csum[win_frames:win_frames + n_start] - csum[:n_start]
+    starts = []
+    for region in np.array_split(np.arange(n_start), min(count, n_start)):
+        if len(region) == 0: continue
+        best = int(region[np.argmax(score[region])])
+        if not starts or best >= starts[-1] + win_frames // 2:
+            starts.append(best)
+    return [s * sr for s in starts]
+
+def detect_language_batched(model, use_faster, audio, starts=None, sr=SAMPLE_RATE):
+    """
+    多窗口批量语言检测：从有声区域取若干 30 秒窗口，一次性送入编码器，
+    对各窗口的语言概率取平均后投票。返回 (语言代码, 平均概率)。
+    """
+    window = 30 * sr
+    clips = []
+    for s in (starts if starts is not None else pick_voiced_windows(audio, sr=sr)):
+        clip = np.zeros(window, dtype=np.float32)
+        piece = np.asarray(audio[s:s + window], dtype=np.float32)
+        clip[:len(piece)] = piece
+        clips.append(clip)
+    
+    totals = {}
+    if use_faster:
+        features = np.stack([model.feature_extractor(c)[:, :3000] for c in clips]).astype(np.float32)
+        encoder_output = model.encode(features)
+        for item in model.model.detect_language(encoder_output):
+            for token, prob in item:
+                lang = token.strip("<|>")
+                totals[lang] = totals.get(lang, 0.0) + prob
+    else:
+        import whisper
+        mel = torch.stack([whisper.log_mel_spectrogram(torch.from_numpy(c), n_mels=model.dims.n_mels)
+                           for c in clips]).to(model.device)
+        _, probs = model.detect_language(mel)
+        if isinstance(probs, dict): probs = [probs]
+        for item in probs:
+            for lang, prob in item.items():
+                totals[lang] = totals.get(lang, 0.0) + prob
+    
+    lang = max(totals, key=totals.get)
+    return lang, totals[lang] / len(clips)
+
+def detect_language_cached(audio_path, detect):
+    """语言检测结果与解码缓存放在一起，同一首歌只检测一次；detect() 返回 (语言, 概率)"""
+    json_path = audio_cache_path(audio_path, ".lang.json")
+    if os.path.exists(json_path):
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f: info = json.load(f)
+            return info['language'], info.get('probability', 0.0)
+        except Exception: pass
+    lang, prob = detect()
+    # 队列任务/批处理进程可能同时读取同一首歌的结果
+    write_json_atomic(json_path, {'language': lang, 'probability': prob})
+    return lang, prob
+
+_chunk_model = None
+
+def _chunk_init(model_size, threads, compute_type="int8"):
+    """分块进程初始化：每个进程加载自己的 CPU 模型 (默认 int8)，并限制线程数"""
+    global _chunk_model
+    load_ml_stack()
+    torch.set_num_threads(threads)
+    local_model_path = os.path.join(os.getcwd(), "models")
+    if HAS_FASTER_WHISPER:
+        try:
+            _chunk_model = stable_whisper.load_faster_whisper(
+                model_size, download_root=local_model_path, device="cpu",
+                compute_type=compute_type, cpu_threads=threads)
+            return
+        except Exception as fw_error:
+            print(f"Faster-Whisper 加载失败: {fw_error}")
+    _chunk_model = stable_whisper.load_model(model_size, download_root=local_model_path, device="cpu")
+
+def _chunk_detect(windows, starts):
+    use_faster = hasattr(_chunk_model, 'feature_extractor')
+    return detect_language_batched(_chunk_model, use_faster, windows, starts)
+
+def _chunk_run(task):
+    index, audio, text, language, prompt = task
+    if text:
+        result = _chunk_model.align(audio, preprocess_cjk_spaces(text), language=language, regroup=False)
+    else:
+        args = {"language": language, "word_timestamps": True, "vad": True, "regroup": False}
+        if prompt: args["initial_prompt"] = prompt
+        result = _chunk_model.transcribe(audio, **args)
+    return index, compact_result(result)
+
+def run_chunked(audio, model_size, lines_text, language, prompt, workers, channel, stop_event,
+                audio_path=None):
+    """
+    CPU 分块并行：在静音处切分音频，把参考歌词按有声时长分配到各块，
+    多个进程各自加载 int8 模型并行对齐/识别，最后按块偏移拼接时间轴。
+    """
+    channel.status("正在按静音切分音频...")
+    chunks = split_on_silence(audio)
+    
+    if lines_text:
+        ranges = assign_lines_to_chunks(audio, chunks, [len(REF_TOKEN_PATTERN.findall(l)) for l in lines_text])
+        texts = ["\n".join(lines_text[a:b]) for a, b in ranges]
+    else:
+        texts = [""] * len(chunks)
+    tasks = [[i, np.array(audio[s:e]), texts[i], language, prompt] for i, (s, e) in enumerate(chunks)
+             if texts[i] or not lines_text]
+    
+    cores = os.cpu_count() or 1
+    profile = load_hw_profile(model_size)
+    compute_type = "int8"
+    if profile and profile['backend'] == "faster-whisper": compute_type = profile['compute_type']
+    if workers <= 0: workers = profile['workers'] if profile else max(1, min(cores // 4, 8))
+    workers = max(1, min(workers, len(tasks)))
+    threads = max(1, cores // workers)
+    channel.status(f"🧩 分块并行: {len(chunks)} 块, {workers} 进程 × {threads} 线程")
+    
+    parts = {}
+    with Pool(processes=workers, initializer=_chunk_init, initargs=(model_size, threads, compute_type)) as pool:
+        if language is None:
+            # 各块统一使用整首歌的检测结果，避免每块各自判断
+            def detect():
+                pieces = [np.array(audio[s:s + 30 * SAMPLE_RATE]) for s in pick_voiced_windows(audio)]
+                starts = np.cumsum([0] + [len(p) for p in pieces[:-1]]).tolist()
+                return pool.apply(_chunk_detect, (np.concatenate(pieces), starts))
+            try:
+                if audio_path: language, prob = detect_language_cached(audio_path, detect)
+                else: language, prob = detect()
+                channel.status(f"🌐 检测到语言: {language} ({prob:.0%})")
+            except Exception as lang_error:
+                print(f"语言检测失败: {lang_error}")
+                language = "ja" if lines_text else None
+            for task in tasks: task[3] = language
+        for index, compact in pool.imap_unordered(_chunk_run, tasks):
+            parts[index] = compact
+            channel.progress(len(parts) / max(1, len(tasks)))
+            if stop_event.is_set():
+                pool.terminate()
+                return None
+    
+    order = sorted(parts)
+    return concat_compact([parts[i] for i in order], [chunks[i][0] / SAMPLE_RATE for i in order])
+
+# ================= 进程间消息通道 =================
+MSG_STATUS = "status"         # (MSG_STATUS, 文本)
+MSG_PROGRESS = "progress"     # (MSG_PROGRESS, 0~1 进度)
+MSG_PARTIAL = "partial"       # (MSG_PARTIAL, 逐段生成的歌词行)
+MSG_STAGE = "stage"           # (MSG_STAGE, 阶段名, "start"/"end", 耗时秒)
+MSG_STATS = "stats"           # (MSG_STATS, [各阶段统计])
+MSG_TIMED = "timed"           # (MSG_TIMED, 时间轴文件路径)，紧接着发送对应的结果
+MSG_RESULT = "result"         # (MSG_RESULT, success/stopped/error/aborted, 内容)
+MSG_EXIT = "exit"             # 管道关闭 (工作进程退出)，由界面端读取线程产生
+SHM_THRESHOLD = 64 * 1024     # 超过该大小的结果通过共享内存传递
+STAGE_RSS_INTERVAL = 0.05     # 阶段执行期间采样常驻内存的间隔 (秒)
+
+STAGE_NAMES = {
+    "load_model": "模型加载", "decode": "音频解码", "language": "语言检测",
+    "vocals": "人声分离", "inference": "推理", "chunked": "分块推理", "realign": "增量对齐",
+    "streaming": "流式处理", "reconstruct": "歌词重建",
+}
+
+def read_shared(ref):
+    """读取并释放工作进程放在共享内存中的数据"""
+    shm = shared_memory.SharedMemory(name=ref['shm'])
+    try:
+        return bytes(shm.buf[:ref['size']])
+    finally:
+        shm.close()
+        shm.unlink()
+
+class RssSampler:
+    """
+    在后台线程轮询常驻内存，记录一个阶段内的峰值。
+    ru_maxrss 是整个进程生命周期的峰值，在常驻进程/批处理进程中后续阶段只会重复之前的最大值。
+    """
+    def __init__(self, interval=STAGE_RSS_INTERVAL):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = self.rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def rss(self):
+        return self.process.memory_info().rss / 2**20
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def stop(self):
+        """结束采样，返回 (当前常驻内存 MB, 本阶段峰值 MB)"""
+        self.done.set()
+        self.thread.join()
+        rss = self.rss()
+        self.peak = max(self.peak, rss)
+        return rss, self.peak
+
+class WorkerChannel:
+    """工作进程 -> 界面的单向管道，发送带类型的结构化消息"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.stages = []
+        self.job_started = None
+        self.shared_blocks = []
+
+    def send(self, *msg):
+        try: self.conn.send(msg)
+        except (BrokenPipeError, EOFError, OSError): pass    # 界面端已关闭
+
+    def status(self, text):
+        self.send(MSG_STATUS, text)
+
+    def progress(self, fraction):
+        self.send(MSG_PROGRESS, float(fraction))
+
+    def partial(self, line):
+        self.send(MSG_PARTIAL, line)
+
+    def timed(self, path):
+        self.send(MSG_TIMED, path)
+
+    @contextmanager
+    def stage(self, name, audio_sec=None):
+        """记录一个处理阶段的墙钟/CPU 时间、常驻内存 (及阶段内峰值) 与显存峰值；给出音频时长时同时记录实时率 (RTF)"""
+        started, cpu_started = time.perf_counter(), time.process_time()
+        if self.job_started is None: self.job_started = started
+        use_cuda = torch is not None and torch.cuda.is_available()
+        if use_cuda: torch.cuda.reset_peak_memory_stats()
+        self.send(MSG_STAGE, name, "start", 0.0)
+        sampler = RssSampler()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            rss, rss_peak = sampler.stop()
+            self.stages.append({
+                'name': name, 'start': round(started - self.job_started, 6), 'wall': round(elapsed, 6),
+                'cpu': round(time.process_time() - cpu_started, 6),
+                'rss_mb': round(rss, 1), 'rss_peak_mb': round(rss_peak, 1),
+                'cuda_peak_mb': round(torch.cuda.max_memory_allocated() / 2**20, 1) if use_cuda else None,
+            })
+            if audio_sec: self.stages[-1]['rtf'] = round(elapsed / audio_sec, 4)
+            self.send(MSG_STAGE, name, "end", elapsed)
+
+    def take_stages(self):
+        stages, self.stages, self.job_started = self.stages, [], None
+        return stages
+
+    def share(self, data):
+        """大块数据放入共享内存，只通过管道发送名字；由接收方负责 unlink"""
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        if os.name != 'nt':
+            # 所有权交给接收方，避免本进程的 resource_tracker 重复清理
+            resource_tracker.unregister(shm._name, "shared_memory")
+        # Windows 下最后一个句柄关闭即释放，因此保留到下一次发送结果时再关闭
+        self.shared_blocks.append(shm)
+        return {'shm': shm.name, 'size': len(data)}
+
+    def release_shared(self):
+        while self.shared_blocks:
+            self.shared_blocks.pop().close()
+
+    def result(self, kind, payload):
+        self.send(MSG_STATS, self.take_stages())
+        self.release_shared()
+        if isinstance(payload, str) and len(payload) * 4 > SHM_THRESHOLD:
+            data = payload.encode('utf-8')
+            if len(data) > SHM_THRESHOLD: payload = self.share(data)
+        self.send(MSG_RESULT, kind, payload)
+
+    def close(self):
+        self.release_shared()
+        try: self.conn.close()
+        except Exception: pass
+
+# ================= 阶段耗时统计 =================
+STAGE_HIST_BINS = (0.1, 0.5, 1, 5, 10, 30, 60, 300)    # 直方图分桶上界 (秒)
+
+def format_stage_summary(stages):
+    """一行摘要：各阶段墙钟耗时"""
+    return " · ".join(f"{STAGE_NAMES.get(s['name'], s['name'])} {s['wall']:.1f}s"
+                      + (f" (RTF {s['rtf']:.3f})" if s.get('rtf') else "") for s in stages)
+
+def format_stage_table(stages):
+    lines = [f"{'阶段':<8}{'耗时':>9}{'CPU':>9}{'内存':>10}{'内存峰值':>10}{'显存峰值':>10}"]
+    for s in stages:
+        cuda = f"{s['cuda_peak_mb']:.0f}MB" if s.get('cuda_peak_mb') is not None else "-"
+        lines.append(f"{STAGE_NAMES.get(s['name'], s['name']):<8}{s['wall']:>8.2f}s{s['cpu']:>8.2f}s"
+                     f"{s['rss_mb']:>8.0f}MB{s['rss_peak_mb']:>8.0f}MB{cuda:>10}")
+    return "\n".join(lines)
+
+def write_chrome_trace(path, stages, label=""):
+    """把各阶段写成 Chrome trace-event JSON (chrome://tracing 或 Perfetto 打开)"""
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': label or "AutoKaraoke"}}]
+    for s in stages:
+        ts, dur = s['start'] * 1e6, s['wall'] * 1e6
+        events.append({'name': STAGE_NAMES.get(s['name'], s['name']), 'cat': 'stage', 'ph': 'X',
+                       'ts': ts, 'dur': dur, 'pid': 1, 'tid': 1,
+                       'args': {k: v for k, v in s.items() if k not in ('name', 'start')}})
+        memory = {'rss_mb': s['rss_mb']}
+        if s.get('cuda_peak_mb') is not None: memory['cuda_peak_mb'] = s['cuda_peak_mb']
+        events.append({'name': 'memory', 'ph': 'C', 'ts': ts + dur, 'pid': 1, 'args': memory})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+def trace_path(directory, audio_path):
+    name = os.path.splitext(os.path.basename(audio_path))[0]
+    return os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.trace.json")
+
+def stage_histogram(stage_lists):
+    """汇总多次任务的阶段耗时：每个阶段的次数、分位数与分桶计数"""
+    walls, rtfs = {}, {}
+    for stages in stage_lists:
+        for s in stages or []:
+            walls.setdefault(s['name'], []).append(s['wall'])
+            if s.get('rtf'): rtfs.setdefault(s['name'], []).append(s['rtf'])
+    report = {}
+    for name, values in walls.items():
+        v = np.asarray(values, dtype=np.float64)
+        report[name] = {
+            'count': len(v), 'total': round(float(v.sum()), 3), 'mean': round(float(v.mean()), 3),
+            'p50': round(float(np.percentile(v, 50)), 3), 'p90': round(float(np.percentile(v, 90)), 3),
+            'max': round(float(v.max()), 3),
+            'bins': np.bincount(np.searchsorted(STAGE_HIST_BINS, v, side='right'),
+                                minlength=len(STAGE_HIST_BINS) + 1).tolist(),
+        }
+        if name in rtfs: report[name]['rtf_p50'] = round(float(np.median(rtfs[name])), 4)
+    return report
+
+def format_stage_histogram(report):
+    labels = [f"<{b}s" for b in STAGE_HIST_BINS] + [f">={STAGE_HIST_BINS[-1]}s"]
+    lines = []
+    for name, r in report.items():
+        lines.append(f"{STAGE_NAMES.get(name, name)}: {r['count']} 次, 合计 {r['total']:.1f}s, "
+                     f"平均 {r['mean']:.2f}s, p50 {r['p50']:.2f}s, p90 {r['p90']:.2f}s, 最长 {r['max']:.2f}s"
+                     + (f", RTF p50 {r['rtf_p50']:.3f}" if 'rtf_p50' in r else ""))
+        peak = max(r['bins']) or 1
+        for label, count in zip(labels, r['bins']):
+            if count: lines.append(f"  {label:>7} {'█' * max(1, round(count * 30 / peak))} {count}")
+    return "\n".join(lines)
+
+# ================= CPU 推理参数自动调优 =================
+AUTOTUNE_COMPUTE_TYPES = ("int8", "int16", "float32")
+AUTOTUNE_CLIP_SEC = 30        # 编码器固定处理 30 秒窗口
+AUTOTUNE_REPEAT = 2
+
+def machine_id():
+    """本机标识：主机名/架构/逻辑核数/内存，换机器或升级硬件后重新调优"""
+    mem_gb = psutil.virtual_memory().total / 2**30
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}c|{mem_gb:.0f}G"
+
+def hw_profile_path():
+    return os.path.join(CACHE_DIR, "config", "hw_profiles.json")
+
+def load_hw_profile(model_size, path=None):
+    """读取本机该模型的调优结果，没有时返回 None"""
+    path = path or hw_profile_path()
+    if not os.path.exists(path): return None
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file).get(machine_id(), {}).get(model_size)
+    except (OSError, ValueError):
+        return None
+
+def save_hw_profile(model_size, profile, path=None):
+    path = path or hw_profile_path()
+    profiles = {}
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as file: profiles = json.load(file)
+        except (OSError, ValueError): profiles = {}
+    profiles.setdefault(machine_id(), {})[model_size] = profile
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json_atomic(path, profiles, ensure_ascii=False, indent=2)
+
+def format_hw_profile(profile):
+    return (f"{profile['compute_type']} · {profile['cpu_threads']} 线程 × {profile['workers']} 进程"
+            f" · RTF {profile['rtf']:.3f}")
+
+def calibration_clip(sec=AUTOTUNE_CLIP_SEC, sr=SAMPLE_RATE, seed=0):
+    """内置探测片段：带颤音和音节包络的谐波“歌声”加少量噪声，每次生成结果相同"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sec * sr)) / sr
+    pitch = 220.0 * 2 ** (np.round(rng.uniform(0, 12, int(sec * 2))) / 12)
+    f0 = np.repeat(pitch, -(-len(t) // len(pitch)))[:len(t)] * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 - 0.5 * np.cos(2 * np.pi * 4 * t)
+    clip = 0.2 * voice * envelope + 0.01 * rng.standard_normal(len(t))
+    return clip.astype(np.float32)
+
+def thread_candidates():
+    logical = os.cpu_count() or 1
+    physical = psutil.cpu_count(logical=False) or logical
+    return sorted({logical, physical, max(1, physical // 2)}, reverse=True)
+
+def time_encoder(model, use_faster, clip, repeat=AUTOTUNE_REPEAT):
+    """编码器处理一个 30 秒窗口的最短耗时 (先预热一次)"""
+    if use_faster:
+        features = model.feature_extractor(clip)[:, :3000][None].astype(np.float32)
+        run = lambda: model.encode(features)
+    else:
+        import whisper
+        mel = whisper.log_mel_spectrogram(torch.from_numpy(whisper.pad_or_trim(clip)),
+                                          n_mels=model.dims.n_mels)[None].to(model.device)
+        def run():
+            with torch.no_grad(): model.embed_audio(mel)
+    run()
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def autotune_cpu(model_size, channel, stop_event):
+    """
+    在本机 CPU 上测量某个模型的推理参数 (由 `main.py autotune` 显式运行，不阻塞识别任务)：
+    先在物理核数下比较各 compute_type，再只对最快的 compute_type 比较线程数，取编码器最快的组合写入配置文件。
+    CTranslate2 的线程数在加载时固定，因此 Faster-Whisper 每个组合仍需加载一次，但总次数从
+    compute_type × 线程数 降为 compute_type + 线程数 - 1；标准模型只加载一次，用 torch.set_num_threads 切换。
+    并行进程数按所选线程数分配全部逻辑核。
+    """
+    local_model_path = os.path.join(os.getcwd(), "models")
+    clip = calibration_clip()
+    threads = thread_candidates()
+    physical = psutil.cpu_count(logical=False) or threads[0]
+    trials = []
+    if HAS_FASTER_WHISPER:
+        compute_types = AUTOTUNE_COMPUTE_TYPES
+        try:
+            import ctranslate2
+            supported = ctranslate2.get_supported_compute_types("cpu")
+            compute_types = [c for c in compute_types if c in supported] or ["int8"]
+        except Exception:
+            pass
+        
+        def trial(compute_type, n):
+            channel.status(f"🧪 正在测试 CPU 推理参数: {compute_type} · {n} 线程...")
+            model = stable_whisper.load_faster_whisper(
+                model_size, download_root=local_model_path, device="cpu",
+                compute_type=compute_type, cpu_threads=n)
+            trials.append((time_encoder(model, True, clip), "faster-whisper", compute_type, n))
+            model = None
+            gc.collect()
+        
+        for compute_type in compute_types:
+            if stop_event.is_set(): return None
+            trial(compute_type, physical)
+        best_type = min(trials)[2]
+        for n in threads:
+            if n == physical: continue
+            if stop_event.is_set(): return None
+            trial(best_type, n)
+    else:
+        model = stable_whisper.load_model(model_size, download_root=local_model_path, device="cpu")
+        for n in threads:
+            if stop_event.is_set(): return None
+            channel.status(f"🧪 正在测试 CPU 推理参数: {n} 线程...")
+            torch.set_num_threads(n)
+            trials.append((time_encoder(model, False, clip), "whisper", "default", n))
+        model = None
+        gc.collect()
+    
+    elapsed, backend, compute_type, n = min(trials)
+    profile = {
+        'backend': backend, 'compute_type': compute_type, 'cpu_threads': n,
+        'workers': max(1, (os.cpu_count() or 1) // n),
+        'rtf': elapsed / AUTOTUNE_CLIP_SEC,
+        'tuned_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    save_hw_profile(model_size, profile)
+    return profile
+
+def run_autotune(argv):
+    ap = argparse.ArgumentParser(prog="main.py autotune", description="测量本机 CPU 推理的 compute_type / 线程数并保存")
+    ap.add_argument("models", nargs="*", default=["large-v2"], help="要测试的模型 (默认 large-v2)")
+    args = ap.parse_args(argv)
+    load_ml_stack()
+    status = 0
+    for model_size in args.models:
+        profile = autotune_cpu(model_size, ConsoleChannel(model_size), Event())
+        if profile: print(f"✅ {model_size}: {format_hw_profile(profile)}", flush=True)
+        else: status = 1
+    print(f"配置文件: {hw_profile_path()}")
+    return status
+
+# ================= 后台处理进程 =================
+def clear_vram(model):
+    try:
+        if model:
+            if hasattr(model, 'to'): model.to("cpu")
+            del model
+    except: pass
+    gc.collect()
+    if torch.cuda.is_available(): torch.cuda.empty_cache()
+
+def load_whisper_model(model_size, device, channel, stop_event):
+    """加载模型，返回 (model, use_faster, compute_type)"""
+    local_model_path = os.path.join(os.getcwd(), "models")
+    os.makedirs(local_model_path, exist_ok=True)
+    
+    model = None
+    use_faster = False
+    compute_type = "float16" if device == "cuda" else "int8"
+    options = {}
+    # CPU：应用本机调优结果 (由 main.py autotune 生成)
+    if device == "cpu" and not stop_event.is_set():
+        profile = load_hw_profile(model_size)
+        if profile is None:
+            # 调优需要多次加载模型，不在识别任务中进行；未测试时使用默认参数
+            channel.status(f"🧪 {model_size} 的 CPU 参数未测试，使用默认配置 (可运行 main.py autotune {model_size})")
+        else:
+            torch.set_num_threads(profile['cpu_threads'])
+            options['cpu_threads'] = profile['cpu_threads']
+            if profile['backend'] == "faster-whisper": compute_type = profile['compute_type']
+            channel.status(f"🧪 CPU 配置: {format_hw_profile(profile)}")
+    # 优先加载 Faster-Whisper
+    if HAS_FASTER_WHISPER and not stop_event.is_set():
+        channel.status(f"🚀 加载 Faster-Whisper ({model_size})...")
+        try:
+            model = stable_whisper.load_faster_whisper(
+                model_size, download_root=local_model_path, device=device,
+                compute_type=compute_type, **options
+            )
+            use_faster = True
+        except Exception as fw_error:
+            print(f"Faster-Whisper 加载失败: {fw_error}")
+            model = None
+    
+    # 回退标准模型
+    if not model and not stop_event.is_set():
+        channel.status(f"加载标准模型 ({model_size})...")
+        model = stable_whisper.load_model(model_size, download_root=local_model_path, device=device)
+        compute_type = "default"
+    return model, use_faster, compute_type
+
+def planned_compute_type(model_size, device):
+    """load_whisper_model 将要使用的 compute_type (CPU 按本机调优结果)，用于在加载前查找模型缓存"""
+    if not HAS_FASTER_WHISPER: return "default"
+    if device == "cuda": return "float16"
+    profile = load_hw_profile(model_size)
+    if profile and profile['backend'] == "faster-whisper": return profile['compute_type']
+    return "int8"
+
+class ModelCache:
+    """
+    模型 LRU 缓存，键为 (model_size, device, compute_type)。
+    常驻进程中复用已加载的模型，避免每首歌重复加载。
+    """
+    def __init__(self, capacity=MODEL_CACHE_SIZE):
+        self.capacity = max(1, capacity)
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, model_size, device, compute_type):
+        # 标准模型 (Faster-Whisper 加载失败时的回退) 不区分 compute_type
+        for key in self.models:
+            if key[:2] == (model_size, device) and key[2] in (compute_type, "default"):
+                return key
+        return None
+
+    def get(self, model_size, device, channel, stop_event):
+        key = self.find(model_size, device, planned_compute_type(model_size, device))
+        if key is not None:
+            self.hits += 1
+            self.models.move_to_end(key)
+            channel.status(f"♻️ 模型缓存命中: {model_size} ({device}/{key[2]}) | 命中 {self.hits} · 未命中 {self.misses}")
+            return self.models[key]
+        
+        self.misses += 1
+        channel.status(f"📦 模型缓存未命中: {model_size} ({device}) | 命中 {self.hits} · 未命中 {self.misses}")
+        # 先腾出空间再加载，避免显存中同时存在多余的模型；
+        # 同一模型的旧 compute_type 版本 (调优结果已改变) 不会再被使用，直接释放
+        for stale in [k for k in self.models if k[:2] == (model_size, device)]:
+            clear_vram(self.models.pop(stale)[0])
+        while len(self.models) >= self.capacity:
+            _, (old_model, _) = self.models.popitem(last=False)
+            clear_vram(old_model)
+            old_model = None
+        
+        model, use_faster, compute_type = load_whisper_model(model_size, device, channel, stop_event)
+        if model is None:
+            return None, False
+        self.models[(model_size, device, compute_type)] = (model, use_faster)
+        return model, use_faster
+
+    def clear(self):
+        while self.models:
+            _, (model, _) = self.models.popitem(last=False)
+            clear_vram(model)
+            model = None
+
+def report_progress(channel):
+    """stable-ts 的 progress_callback：按 已处理音频秒数 / 总时长 上报进度"""
+    def callback(seek, total):
+        if total: channel.progress(min(1.0, float(seek) / float(total)))
+    return callback
+
+def call_with_progress(fn, *args, progress_callback=None, **kwargs):
+    # 旧版 stable-ts 不支持 progress_callback 时退回普通调用
+    try:
+        return fn(*args, progress_callback=progress_callback, **kwargs)
+    except TypeError as e:
+        if 'progress_callback' not in str(e): raise
+        return fn(*args, **kwargs)
+
+def stream_transcribe(model, audio, language, initial_prompt, time_offset, channel, stop_event, batch_size=0):
+    """
+    流式听写：直接迭代 faster-whisper 的分段生成器，每得到一段就推送到界面。
+    被停止时立即返回已识别的部分。
+    batch_size > 1 时改用批量管线：先按 VAD 切段，再把多段一起送入解码器
+    (各段不再以前文作为提示，精度略降，吞吐更高)。
+    """
+    args = {"language": language, "word_timestamps": True, "vad_filter": True, "beam_size": 5}
+    if initial_prompt: args["initial_prompt"] = initial_prompt
+    if batch_size > 1:
+        pipeline = faster_whisper.BatchedInferencePipeline(model=model)
+        segments, info = pipeline.transcribe(audio, batch_size=batch_size, **args)
+    else:
+        segments, info = model.transcribe_original(audio, **args)
+    duration = getattr(info, 'duration', 0) or 0
+    collected = []
+    for seg in segments:
+        words = [{'word': w.word, 'start': w.start, 'end': w.end, 'probability': w.probability}
+                 for w in (seg.words or [])]
+        collected.append({'start': seg.start, 'end': seg.end, 'text': seg.text, 'words': words})
+        text = seg.text.strip()
+        if text: channel.partial(f"[{format_time(seg.start, time_offset)}]{text}")
+        if duration: channel.progress(min(1.0, seg.end / duration))
+        if stop_event.is_set(): break
+    return {'segments': collected}
+
+# ================= 长录音流式处理 =================
+def probe_duration(path):
+    """用 ffprobe 读取音频时长 (秒)，失败时返回 None"""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path]
+    try:
+        return float(subprocess.run(cmd, capture_output=True, check=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def stream_windows(path, window_sec=STREAM_WINDOW_SEC, overlap_sec=STREAM_OVERLAP_SEC, sr=SAMPLE_RATE):
+    """
+    流式解码并切成固定长度的重叠窗口，产出 (窗口起始秒, 单声道 PCM, 是否最后一个窗口)。
+    每个窗口长 window_sec + overlap_sec，相邻窗口重叠 overlap_sec；内存中只保留一个窗口的采样。
+    """
+    size = int((window_sec + overlap_sec) * sr)
+    step = int(window_sec * sr)
+    buf = np.zeros(0, dtype=np.float32)
+    start = 0
+    for block in stream_pcm(path, sr, channels=1, block=sr * 10):
+        buf = np.concatenate((buf, block[:, 0]))
+        # 多读到一个采样才能确定当前窗口不是最后一个
+        while len(buf) > size:
+            yield start / sr, buf[:size].copy(), False
+            buf = buf[step:]
+            start += step
+    yield start / sr, buf, True
+
+def transcribe_window(model, use_faster, audio, language, prompt):
+    """对一个窗口做带词时间戳的识别，返回压缩结果 (时间相对窗口起点)"""
+    if use_faster and hasattr(model, 'transcribe_original'):
+        args = {"language": language, "word_timestamps": True, "vad_filter": True, "beam_size": 5}
+        if prompt: args["initial_prompt"] = prompt
+        segments, _ = model.transcribe_original(audio, **args)
+        return compact_result({'segments': list(segments)})
+    args = {"language": language, "word_timestamps": True, "vad": True, "regroup": False}
+    if prompt: args["initial_prompt"] = prompt
+    if use_faster: args["beam_size"] = 5
+    return compact_result(model.transcribe(audio, **args))
+
+class StreamAligner:
+    """
+    长录音流式对齐的跨窗口状态：参考歌词游标、最后确定的时间，以及尚未消耗的 AI 词。
+    每喂入一个窗口的词，就用参考歌词的前瞻片段做全局对齐，把已确定的行渲染出来，之后不再改动。
+    """
+    def __init__(self, parser, time_offset=0.0, align_band=ALIGN_BAND, max_pending_sec=2 * STREAM_WINDOW_SEC):
+        self.parser = parser
+        self.lines = parser.lines_text
+        self.time_offset = time_offset
+        self.band = align_band
+        self.max_pending_sec = max_pending_sec
+        self.line_tokens = np.fromiter((len(REF_TOKEN_PATTERN.findall(l)) for l in self.lines),
+                                       dtype=np.int64, count=len(self.lines))
+        self.cursor = 0
+        self.last_time = 0.0
+        self.vocab = {}
+        self.start = np.zeros(0, dtype=np.float64)
+        self.end = np.zeros(0, dtype=np.float64)
+        self.ids = np.zeros(0, dtype=np.int32)
+
+    def intern(self, text):
+        return self.vocab.setdefault(text, len(self.vocab))
+
+    def feed(self, start, word_end, texts, final=False):
+        """加入一个窗口的 AI 词 (绝对起止时间)，返回本次确定的行 (TimedTokens)"""
+        ids = np.fromiter((self.intern(clean_token(t)) for t in texts), dtype=np.int32, count=len(texts))
+        self.start = np.concatenate((self.start, np.asarray(start, dtype=np.float64)))
+        self.end = np.concatenate((self.end, np.asarray(word_end, dtype=np.float64)))
+        self.ids = np.concatenate((self.ids, ids))
+        builder = TimedTokensBuilder()
+        if self.cursor >= len(self.lines): return builder.build()
+        
+        # 参考歌词前瞻：词数覆盖待处理的 AI 词再加一个带宽，最后一个窗口取全部剩余行
+        if final:
+            end = len(self.lines)
+        else:
+            need = len(self.ids) + self.band
+            end = self.cursor + int(np.searchsorted(np.cumsum(self.line_tokens[self.cursor:]), need)) + 1
+            end = min(end, len(self.lines))
+        ref = RefTokens(self.lines[self.cursor:end], self.intern)
+        matched = align_tokens_banded(ref.ids, self.ids, list(self.vocab), self.band, free_ref_tail=not final)
+        matched_time = np.where(matched >= 0, self.start[np.maximum(matched, 0)] if len(self.start) else 0.0, np.nan)
+        times = repair_timestamps(matched_time, start_floor=self.last_time)
+        
+        # 最后一个有匹配的行可能延续到下一个窗口，只确定它之前的行
+        if final:
+            done = end - self.cursor
+        else:
+            line_of = np.repeat(np.arange(end - self.cursor), np.diff(ref.line_offsets))
+            hit_lines = line_of[matched >= 0]
+            done = int(hit_lines.max()) if len(hit_lines) else 0
+        
+        hi = ref.line_offsets[done]
+        builder.ref_lines(ref, self.lines[self.cursor:self.cursor + done],
+                          seconds_to_ms(times[:hi], self.time_offset).tolist(),
+                          matched_end_ms(matched[:hi], self.end, self.time_offset).tolist(),
+                          self.parser.translations, self.cursor)
+        
+        if done:
+            if hi: self.last_time = float(times[hi - 1])
+            used = matched[:hi][matched[:hi] >= 0]
+            drop = max(int(used.max()) + 1 if len(used) else 0,
+                       int(np.searchsorted(self.start, self.last_time)))
+            self.start, self.end, self.ids = self.start[drop:], self.end[drop:], self.ids[drop:]
+            self.cursor += done
+        elif len(self.start) and self.start[-1] - self.start[0] > self.max_pending_sec:
+            # 长时间匹配不到歌词 (说话/间奏)，丢弃较早的词，保持内存有界
+            keep = self.start >= self.start[-1] - self.max_pending_sec / 2
+            self.start, self.end, self.ids = self.start[keep], self.end[keep], self.ids[keep]
+        return builder.build()
+
+def run_streaming(get_model, audio_path, model_size, language, parser, time_offset, prompt,
+                  channel, stop_event, align_band=ALIGN_BAND, stream_path=None,
+                  window_sec=STREAM_WINDOW_SEC, overlap_sec=STREAM_OVERLAP_SEC, pieces=None):
+    """
+    多小时录音的流式处理：按带重叠的固定窗口解码、识别，每个窗口只保留重叠区中线之间的词，
+    有参考歌词时由 StreamAligner 跨窗口对齐。确定的行立即推送到界面并追加写入 stream_path，
+    峰值内存与录音长度无关 (时间轴只保存行/词数组)。返回 (是否被停止, 已输出行的 TimedTokens)。
+    已输出的片段同时追加到调用方传入的 pieces，中途抛出异常时调用方仍能拿到部分结果。
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    channel.status(f"⚙️ 运行设备: {device.upper()}")
+    with channel.stage("load_model"):
+        model, use_faster = get_model(model_size, device, channel, stop_event)
+    
+    lang_param = language if language != "Auto (混合)" else None
+    aligner = StreamAligner(parser, time_offset, align_band, 2 * window_sec) if parser.lines_text else None
+    if pieces is None: pieces = []
+    duration = probe_duration(audio_path)
+    out_file = open(stream_path, 'w', encoding='utf-8') if stream_path else None
+    
+    def emit(piece):
+        pieces.append(piece)
+        lines = list(iter_lrc(piece))
+        for line in lines: channel.partial(line)
+        if out_file and lines:
+            out_file.write("\n".join(lines) + "\n")
+            out_file.flush()
+    
+    try:
+        header = TimedTokensBuilder()
+        for h in parser.headers: header.text_line(h)
+        if parser.headers: header.text_line("")
+        emit(header.build())
+        keep_from = 0.0
+        with channel.stage("streaming", audio_sec=duration):
+            for index, (offset, pcm, final) in enumerate(stream_windows(audio_path, window_sec, overlap_sec)):
+                if stop_event.is_set(): break
+                if lang_param is None:
+                    try:
+                        lang_param, lang_prob = detect_language_batched(model, use_faster, pcm)
+                        channel.status(f"🌐 检测到语言: {lang_param} ({lang_prob:.0%})")
+                    except Exception as lang_error:
+                        print(f"语言检测失败: {lang_error}")
+                        lang_param = "ja" if aligner else None
+                
+                channel.status(f"🎞️ 流式处理第 {index + 1} 个窗口 ({format_time(offset)} 起)...")
+                compact = transcribe_window(model, use_faster, pcm, lang_param, (prompt or "").strip())
+                # 只保留本窗口负责的区间 [上一个窗口的交接点, 与下一个窗口重叠区的中线)
+                keep_to = float('inf') if final else offset + window_sec + overlap_sec / 2
+                word_start = compact['word_start'] + offset
+                keep = (word_start >= keep_from) & (word_start < keep_to)
+                if aligner:
+                    words = unpack_strings(compact['word_text'], compact['word_text_offsets'])
+                    emit(aligner.feed(word_start[keep], compact['word_end'][keep] + offset,
+                                      [w for w, k in zip(words, keep) if k], final))
+                else:
+                    seg_start = compact['seg_start'] + offset
+                    texts = unpack_strings(compact['seg_text'], compact['seg_text_offsets'])
+                    segments = TimedTokensBuilder()
+                    for t, t_end, text in zip(seg_start, compact['seg_end'] + offset, texts):
+                        if keep_from <= t < keep_to and text.strip():
+                            segments.timed_line(int(seconds_to_ms(t, time_offset)), text.strip(),
+                                                int(seconds_to_ms(t_end, time_offset)))
+                    emit(segments.build())
+                keep_from = keep_to
+                compact = pcm = None
+                if duration: channel.progress(min(1.0, keep_from / duration))
+    finally:
+        if out_file: out_file.close()
+    return stop_event.is_set(), TimedTokens.concat(pieces)
+
+def run_job(get_model, audio_path, model_size, language, ref_text,
+            lrc_parser_data, time_offset, initial_prompt_input, 
+            channel, stop_event, align_band=ALIGN_BAND,
+            chunked=False, chunk_workers=0, vocals="off", incremental=False, batch_size=0,
+            streaming=False, stream_path=None):
+    try:
+        parser = LrcParser()
+        parser.headers = lrc_parser_data.get('headers', [])
+        parser.lines_text = lrc_parser_data.get('lines_text', [])
+        parser.translations = lrc_parser_data.get('translations', {})
+        
+        # 长录音流式模式：不整段解码、不写识别缓存，逐窗口输出
+        if streaming:
+            if not parser.lines_text and ref_text and ref_text.strip(): parser.parse(ref_text, ".lrc")
+            # 无论正常结束、被停止还是抛出异常，finally 中都必须给界面发一个结果，否则任务一直停在"运行中"
+            pieces, outcome = [], ("aborted", None)
+            try:
+                stopped, timed = run_streaming(get_model, audio_path, model_size, language, parser,
+                                               time_offset, initial_prompt_input, channel, stop_event,
+                                               align_band, stream_path, pieces=pieces)
+                outcome = ("stopped" if stopped else "success", timed)
+            except torch.cuda.OutOfMemoryError:
+                outcome = ("error", "❌ 显存不足！请尝试更小的模型")
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                # 停止后推理被打断抛出的异常按停止处理，保留已经输出的行
+                outcome = ("stopped", None) if stop_event.is_set() else ("error", f"错误: {str(e)}")
+            finally:
+                kind, payload = outcome
+                if kind == "stopped" and payload is None:
+                    partial = TimedTokens.concat(pieces)
+                    if np.any(partial.line_kind == LINE_LYRIC): payload = partial
+                    else: kind = "aborted"
+                if kind in ("success", "stopped"): send_timed_result(channel, kind, payload)
+                else: channel.result(kind, payload)
+            return
+        
+        # --- 进程主逻辑 ---
+        # 识别结果缓存：仅修改偏移/翻译/头信息时直接复用，跳过模型推理
+        mode = "align" if ref_text and ref_text.strip() else "transcribe"
+        if chunked: mode += "-chunked"
+        if vocals != "off": mode += f"-vocals-{vocals}"
+        if mode.startswith("transcribe") and batch_size > 1: mode += f"-batch{batch_size}"
+        ref_lines = [l.strip() for l in ref_text.splitlines() if l.strip()] if ref_text else []
+        cache_key = None
+        cached = None
+        last_path = None
+        previous = None
+        try:
+            audio_hash = file_digest(audio_path)
+            cache_key = result_cache_key(audio_hash, model_size, language,
+                                         initial_prompt_input, mode, ref_text)
+            cached = load_cached_result(cache_key)
+            if ref_lines:
+                last_path = last_run_path(audio_hash, model_size, language, initial_prompt_input, mode)
+                if cached is None and incremental and not chunked: previous = load_last_run(last_path)
+        except Exception as cache_error:
+            print(f"识别缓存不可用: {cache_error}")
+        
+        # 增量对齐：与上次对齐的参考歌词逐行比较，未改动的行作为锚点，只重新对齐改动处的音频
+        spans = None
+        if previous is not None:
+            old_lines, old_compact = previous
+            spans = plan_incremental(old_lines, ref_lines, *line_time_spans(old_compact, old_lines, align_band))
+            if spans is None:
+                channel.status("参考歌词改动较多，整首重新对齐")
+            elif not spans:
+                cached = old_compact
+        
+        if cached is not None:
+            channel.status("⚡ 命中识别缓存，跳过模型推理")
+            with channel.stage("reconstruct"):
+                timed = reconstruct_timed(WordPool(cached), parser, time_offset, align_band,
+                                          stop_event, channel)
+            if timed is None or stop_event.is_set(): channel.result("aborted", None)
+            else: send_timed_result(channel, "success", timed)
+            return
+        
+        is_cuda = torch.cuda.is_available()
+        device = "cuda" if is_cuda else "cpu"
+        channel.status(f"⚙️ 运行设备: {device.upper()}")
+
+        model = None
+        try:
+            channel.status("正在读取音频...")
+            with channel.stage("decode"):
+                audio = load_audio_cached(audio_path)
+            
+            if vocals != "off":
+                channel.status("正在分离人声 (CPU)...")
+                with channel.stage("vocals"):
+                    audio = load_vocals_cached(audio_path, vocals, stop_event=stop_event,
+                                               progress=channel.progress)
+                if audio is None:
+                    channel.result("aborted", None)
+                    return
+            
+            if chunked and device == "cpu":
+                lang_param = language if language != "Auto (混合)" else None
+                with channel.stage("chunked", audio_sec=len(audio) / SAMPLE_RATE):
+                    compact = run_chunked(audio, model_size, ref_lines, lang_param,
+                                          (initial_prompt_input or "").strip(), chunk_workers,
+                                          channel, stop_event, audio_path=audio_path)
+                if compact is None or stop_event.is_set():
+                    channel.result("aborted", None)
+                    return
+            else:
+                with channel.stage("load_model"):
+                    model, use_faster = get_model(model_size, device, channel, stop_event)
+                
+                lang_param = language if language != "Auto (混合)" else None
+                
+                # 自动检测语言 (多窗口批量投票，结果随音频缓存)
+                if not lang_param and not stop_event.is_set():
+                    channel.status("正在检测语言...")
+                    try:
+                        with channel.stage("language"):
+                            lang_param, lang_prob = detect_language_cached(
+                                audio_path, lambda: detect_language_batched(model, use_faster, audio))
+                        channel.status(f"🌐 检测到语言: {lang_param} ({lang_prob:.0%})")
+                    except Exception as lang_error:
+                        print(f"语言检测失败: {lang_error}")
+                        lang_param = "ja" if ref_text else None
+                
+                if lang_param is None and ref_text: lang_param = "ja"
+                
+                result = None
+                if stop_event.is_set():
+                    channel.result("aborted", None)
+                    return
+                
+                # 传入已解码的 PCM 数组而不是路径，模型内部不再调用 FFmpeg
+                audio_input = np.array(audio, dtype=np.float32)
+                streamed = False
+                if batch_size > 1 and not (ref_text and ref_text.strip()) and not (
+                        use_faster and hasattr(faster_whisper, 'BatchedInferencePipeline')):
+                    channel.status("批量识别需要新版 Faster-Whisper，改用逐段识别")
+                    batch_size = 0
+                with channel.stage("realign" if spans else "inference", audio_sec=len(audio_input) / SAMPLE_RATE):
+                    if spans:
+                        changed = sum(min(t1, len(audio_input) / SAMPLE_RATE) - t0 for t0, t1, _, _ in spans)
+                        channel.status(f"✂️ 增量对齐: {len(spans)} 处改动，"
+                                       f"重新对齐 {changed:.1f}s / {len(audio_input) / SAMPLE_RATE:.1f}s 音频")
+                        compact = realign_spans(model, audio_input, old_compact, spans, ref_lines,
+                                                lang_param, channel, stop_event)
+                    elif ref_text and ref_text.strip():
+                        channel.status("正在进行【结构化强制对齐】...")
+                        spaced_ref_text = preprocess_cjk_spaces(ref_text)
+                        result = call_with_progress(model.align, audio_input, spaced_ref_text, language=lang_param,
+                                                    regroup=False, progress_callback=report_progress(channel))
+                    elif use_faster and (hasattr(model, 'transcribe_original') or batch_size > 1):
+                        channel.status(f"正在进行批量语音识别 (批大小 {batch_size})..." if batch_size > 1
+                                       else "正在进行语音识别 (逐段输出)...")
+                        result = stream_transcribe(model, audio_input, lang_param, (initial_prompt_input or "").strip(),
+                                                   time_offset, channel, stop_event, batch_size)
+                        streamed = True
+                    else:
+                        channel.status("正在进行语音识别...")
+                        transcribe_args = {"language": lang_param, "word_timestamps": True, "vad": True, "regroup": False}
+                        if initial_prompt_input and initial_prompt_input.strip():
+                            transcribe_args["initial_prompt"] = initial_prompt_input.strip()
+                        if use_faster:
+                            transcribe_args["beam_size"] = 5
+                
+                        result = call_with_progress(model.transcribe, audio_input,
+                                                    progress_callback=report_progress(channel), **transcribe_args)
+                
+                if stop_event.is_set():
+                    if streamed and result['segments']:
+                        # 停止时返回已经识别出的部分，而不是全部丢弃 (不写入缓存)
+                        partial = reconstruct_timed(WordPool(compact_result(result)), parser, time_offset)
+                        send_timed_result(channel, "stopped", partial)
+                    else:
+                        channel.result("aborted", None)
+                    return
+                
+                channel.status("正在合成结果...")
+                if not spans: compact = compact_result(result)
+                # 释放模型原始结果 (大量 Python 对象)，后续只使用数组化的词池
+                result = None
+                gc.collect()
+            if cache_key:
+                try:
+                    save_cached_result(cache_key, compact)
+                    if last_path: save_last_run(last_path, cache_key, ref_lines)
+                except Exception as cache_error: print(f"写入识别缓存失败: {cache_error}")
+            with channel.stage("reconstruct"):
+                timed = reconstruct_timed(WordPool(compact), parser, time_offset, align_band,
+                                          stop_event, channel)
+            
+            if timed is None or stop_event.is_set():
+                channel.result("aborted", None)
+            else:
+                send_timed_result(channel, "success", timed)
+        
+        except torch.cuda.OutOfMemoryError:
+            channel.result("error", "❌ 显存不足！请尝试更小的模型")
+            raise
+        except Exception as e:
+            if not stop_event.is_set():
+                traceback.print_exc()
+                channel.result("error", f"错误: {str(e)}")
+        finally:
+            model = None
+            
+    except torch.cuda.OutOfMemoryError:
+        raise
+    except Exception as e:
+        channel.result("error", f"进程错误: {str(e)}")
+
+def worker_process(job, conn, stop_event):
+    """一次性任务进程 (任务队列中的每首歌)：加载模型 -> 推理 -> 释放；job 与常驻进程接收的任务参数相同"""
+    load_ml_stack()
+    cache = ModelCache(capacity=1)
+    channel = WorkerChannel(conn)
+    try:
+        run_job(cache.get, channel=channel, stop_event=stop_event, **job)
+    except torch.cuda.OutOfMemoryError:
+        pass
+    finally:
+        cache.clear()
+        channel.close()
+
+def model_host_process(job_queue, conn, stop_event):
+    """
+    常驻模型进程：模型加载后保留在 LRU 缓存中，循环从 job_queue 接收任务，
+    通过管道 conn 向界面发送结构化消息。收到 HOST_RELEASE 时清空模型缓存，收到 None 时退出。
+    界面显示后立即启动，先在后台导入机器学习依赖，第一个任务无需再等待导入。
+    """
+    channel = WorkerChannel(conn)
+    import_error = None
+    try:
+        channel.status(f"✅ 推理环境已就绪 (torch / stable-ts 导入 {load_ml_stack():.1f}s)")
+    except ImportError as e:
+        import_error = f"❌ 推理环境加载失败: {e}"
+        channel.status(import_error)
+    cache = ModelCache()
+    while True:
+        try:
+            job = job_queue.get()
+        except (EOFError, OSError):
+            break
+        if job is None: break
+        if job == HOST_RELEASE:
+            if not import_error: cache.clear()
+            continue
+        if import_error:
+            channel.result("error", import_error)
+            continue
+        try:
+            run_job(cache.get, channel=channel, stop_event=stop_event, **job)
+        except torch.cuda.OutOfMemoryError:
+            # 显存不足时清空缓存，下次任务重新加载
+            cache.clear()
+    if not import_error: cache.clear()
+    channel.close()
+
+# ================= 主程序界面 =================
+class ChannelReader(QThread):
+    """在后台线程阻塞读取工作进程的管道，消息到达后立即通过信号转交界面线程"""
+    message = pyqtSignal(object)
+
+    def __init__(self, conn, parent=None):
+        super().__init__(parent)
+        self.conn = conn
+
+    def run(self):
+        while True:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                self.message.emit((MSG_EXIT,))
+                break
+            if msg[0] == MSG_RESULT and isinstance(msg[2], dict):
+                try: msg = (MSG_RESULT, msg[1], read_shared(msg[2]).decode('utf-8'))
+                except Exception as e: msg = (MSG_RESULT, "error", f"读取共享内存失败: {e}")
+            self.message.emit(msg)
+        self.conn.close()
+
+# ================= 多任务队列 =================
+# 各模型大小的资源占用估算 (MB)：(内存, 显存)
+MODEL_FOOTPRINT_MB = {
+    "tiny": (800, 1000), "base": (1000, 1200), "small": (1800, 2200),
+    "medium": (3500, 5000), "large-v2": (6000, 6500), "large-v3": (6000, 6500),
+}
+QUEUE_RAM_FRACTION = 0.75     # 队列任务合计最多占用的物理内存比例
+QUEUE_VRAM_FRACTION = 0.9
+JOB_STATES = {
+    "queued": "排队中", "running": "运行中", "done": "✅ 完成", "stopped": "🛑 已停止 (部分)",
+    "failed": "❌ 失败", "cancelled": "已取消",
+}
+RESULT_STATES = {"success": "done", "stopped": "stopped", "error": "failed", "aborted": "cancelled"}
+
+def gpu_memory_mb():
+    """用 nvidia-smi 查询第一块 GPU 的显存总量 (MB)，没有 NVIDIA GPU 时返回 None (界面进程不导入 torch)"""
+    cmd = ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True, text=True, timeout=5).stdout
+        return float(out.splitlines()[0])
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+class QueuedJob:
+    """队列中的一首歌：任务参数快照、优先级、运行状态与结果"""
+    next_id = 1
+
+    def __init__(self, job, priority=0):
+        self.id = QueuedJob.next_id
+        QueuedJob.next_id += 1
+        self.job = job
+        self.name = os.path.basename(job['audio_path'])
+        self.priority = priority
+        self.state = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.timed_path = None
+        self.process = None
+        self.reader = None
+        self.stop_event = None
+
+class JobScheduler:
+    """
+    资源感知调度：按优先级 (高者优先) 与队列顺序决定哪些任务可以开始。
+    有 NVIDIA GPU 时按显存预算并发，否则按 CPU 线程数 (取本机调优结果) 与内存预算并发。
+    排在最前的任务资源不足时，后面的任务也不会抢先开始，避免大模型任务一直等不到资源。
+    """
+    def __init__(self, cores, ram_mb, vram_mb=None):
+        self.cores = max(1, cores)
+        self.ram_mb = ram_mb
+        self.vram_mb = vram_mb
+
+    @classmethod
+    def detect(cls):
+        vram = gpu_memory_mb()
+        return cls(os.cpu_count() or 1, psutil.virtual_memory().total / 2**20 * QUEUE_RAM_FRACTION,
+                   vram * QUEUE_VRAM_FRACTION if vram else None)
+
+    def cost(self, job):
+        """任务占用的 (CPU 线程, 内存 MB, 显存 MB)"""
+        ram, vram = MODEL_FOOTPRINT_MB.get(job['model_size'], MODEL_FOOTPRINT_MB["large-v2"])
+        if self.vram_mb: return 1, ram, vram
+        if job.get('chunked'): return self.cores, ram, 0     # 分块模式自己占满所有核
+        profile = load_hw_profile(job['model_size'])
+        return (profile['cpu_threads'] if profile else min(self.cores, 4)), ram, 0
+
+    def resident(self, model_sizes):
+        """常驻进程缓存中的模型在空闲时也占用内存 / 显存 (不占 CPU 线程)"""
+        used = np.zeros(3)
+        for size in model_sizes:
+            ram, vram = MODEL_FOOTPRINT_MB.get(size, MODEL_FOOTPRINT_MB["large-v2"])
+            used += (0, ram, vram if self.vram_mb else 0)
+        return used
+
+    def pick(self, queued, running, resident=()):
+        """
+        queued 为按队列顺序排列的排队任务，running 为正在运行的任务参数，
+        resident 为常驻进程缓存中、不属于 running 的模型；返回现在可以开始的任务
+        """
+        used = self.resident(resident)
+        for job in running: used += self.cost(job)
+        limit = np.array([self.cores, self.ram_mb, self.vram_mb or np.inf])
+        started = []
+        for item in sorted(queued, key=lambda j: -j.priority):
+            cost = np.asarray(self.cost(item.job), dtype=np.float64)
+            # 没有任何任务在运行且无常驻模型时总是放行，超出预算的单个任务也能执行
+            if (running or started or resident) and np.any(used + cost > limit): break
+            started.append(item)
+            used += cost
+        return started
+
+    def describe(self):
+        if self.vram_mb: return f"GPU 显存预算 {self.vram_mb / 1024:.1f} GB · 内存预算 {self.ram_mb / 1024:.1f} GB"
+        return f"CPU {self.cores} 线程 · 内存预算 {self.ram_mb / 1024:.1f} GB"
+
+class JobQueueModel(QAbstractTableModel):
+    """任务队列表格：优先级 / 歌曲 / 模型 / 语言 / 状态 / 进度"""
+    HEADERS = ["优先级", "歌曲", "模型", "语言", "状态", "进度"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.jobs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        item = self.jobs[index.row()]
+        col = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 0: return f"{item.priority:+d}" if item.priority else "0"
+            if col == 1: return item.name
+            if col == 2: return item.job['model_size']
+            if col == 3: return item.job['language']
+            if col == 4: return JOB_STATES[item.state]
+            if col == 5: return f"{item.progress:.0%}" if item.state == "running" else ""
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"{item.job['audio_path']}\n{item.message}" if item.message else item.job['audio_path']
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def add(self, item):
+        self.beginInsertRows(QModelIndex(), len(self.jobs), len(self.jobs))
+        self.jobs.append(item)
+        self.endInsertRows()
+
+    def remove_where(self, predicate):
+        self.beginResetModel()
+        self.jobs = [item for item in self.jobs if not predicate(item)]
+        self.endResetModel()
+
+    def move(self, row, delta):
+        """把第 row 行上移 (delta=-1) 或下移 (delta=1)，返回新行号"""
+        target = row + delta
+        if not 0 <= row < len(self.jobs) or not 0 <= target < len(self.jobs): return row
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), target + 1 if delta > 0 else target)
+        self.jobs.insert(target, self.jobs.pop(row))
+        self.endMoveRows()
+        return target
+
+    def refresh(self, item):
+        if item in self.jobs:
+            row = self.jobs.index(item)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+
+class LyricsGenApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("AutoKaraoke 0.1")
+        self.resize(1100, 900)
+        self.lrc_parser = LrcParser()
+        self.audio_path = None
+        self.model_host = None
+        self.job_queue = None
+        self.reader = None
+        self.stop_event = None
+        self.job_running = False
+        self.current_job = None
+        self.host_models = []         # 常驻进程缓存中的模型 (按最近使用排序，与 ModelCache 一致)
+        self.scheduler = None
+        self.closing = False
+        self.last_stages = []
+        # 输出框文本与对应的时间轴 (文件路径或 TimedTokens)；文本被手动修改后失效
+        self.timed_source = ("", None)
+        self.pending_timed = None
+        self.setup_ui()
+        # 窗口显示后再启动常驻进程，在后台预热 torch / stable-ts 的导入
+        QTimer.singleShot(0, self.warm_up_worker)
+    
+    def warm_up_worker(self):
+        self.status.setText("⏳ 正在后台加载推理环境...")
+        self.ensure_model_host()
+    
+    def setup_ui(self):
+        self.setStyleSheet("""
+            QMainWindow { background-color: #f5f7fa; }
+            QLabel { font-family: 'Microsoft YaHei'; color: #333; font-size: 13px; }
+            QTextEdit { background: white; border: 1px solid #dcdfe6; border-radius: 6px; padding: 10px; font-family: Consolas; font-size: 14px; }
+            QLineEdit { background: white; border: 1px solid #dcdfe6; border-radius: 4px; padding: 5px; }
+            QPushButton { background-color: #409eff; color: white; border-radius: 6px; padding: 8px 15px; font-weight: bold; }
+            QPushButton:hover { background-color: #66b1ff; }
+            QPushButton:disabled { background-color: #c0c4cc; color: #909399; }
+            QComboBox, QSpinBox { padding: 5px; border: 1px solid #dcdfe6; background: white; border-radius: 4px; }
+            QProgressBar { border: 1px solid #dcdfe6; border-radius: 4px; text-align: center; }
+            QProgressBar::chunk { background-color: #409eff; width: 20px; }
+        """)
+        
+        central = QWidget()
+        self.setCentralWidget(central)
+        layout = QVBoxLayout(central)
+        layout.setSpacing(10)
+        
+        status_text = "<span style='color:green'>⚡ 加速模式</span>" if HAS_FASTER_WHISPER else "<span>标准模式</span>"
+        layout.addWidget(QLabel(f"<h2>AutoKaraoke 0.1 {status_text}</h2>"), alignment=Qt.AlignmentFlag.AlignCenter)
+        
+        # 文件选择
+        file_box = QHBoxLayout()
+        self.path_lbl = QLabel("🚫 尚未选择音频文件")
+        self.path_lbl.setStyleSheet("background: white; padding: 8px; border: 1px dashed #ccc; border-radius: 4px;")
+        btn_aud = QPushButton("📂 选择歌曲")
+        btn_aud.clicked.connect(self.select_audio)
+        file_box.addWidget(self.path_lbl, 4)
+        file_box.addWidget(btn_aud, 1)
+        layout.addLayout(file_box)
+        
+        # 设置区域
+        set_box = QHBoxLayout()
+        self.model_combo = QComboBox()
+        self.model_combo.addItems(["tiny", "base", "small", "medium", "large-v2", "large-v3"])
+        self.model_combo.setCurrentText("large-v2")
+        self.lang_combo = QComboBox()
+        self.lang_combo.addItems(["Auto (混合)", "zh", "en", "ja", "ko", "yue"])
+        self.lang_combo.setCurrentText("ja")
+        self.lang_combo.currentTextChanged.connect(self.update_prompt_defaults)
+        
+        set_box.addWidget(QLabel("AI模型:"))
+        set_box.addWidget(self.model_combo)
+        set_box.addWidget(QLabel("语言:"))
+        set_box.addWidget(self.lang_combo)
+        set_box.addWidget(QLabel("⏱️ 整体偏移:"))
+        self.offset_spin = QSpinBox()
+        self.offset_spin.setRange(-10000, 10000)
+        self.offset_spin.setSuffix(" ms")
+        self.offset_spin.setValue(0)
+        set_box.addWidget(self.offset_spin)
+        self.chunk_check = QCheckBox("🧩 CPU 分块并行")
+        self.chunk_check.setToolTip("无 GPU 时在静音处切分音频，多进程并行对齐 (每个进程单独加载 int8 模型)")
+        set_box.addWidget(self.chunk_check)
+        self.incremental_check = QCheckBox("✂️ 增量对齐")
+        self.incremental_check.setChecked(True)
+        self.incremental_check.setToolTip("只改动了部分歌词时，未改动的行沿用上次的时间，\n"
+                                          "仅重新对齐改动处前后锚点之间的音频")
+        set_box.addWidget(self.incremental_check)
+        set_box.addWidget(QLabel("📦 批量识别:"))
+        self.batch_spin = QSpinBox()
+        self.batch_spin.setRange(1, 64)
+        self.batch_spin.setSpecialValueText("关闭")
+        self.batch_spin.setToolTip("无参考歌词时按 VAD 切段后批量解码 (需要 Faster-Whisper)\n"
+                                   "吞吐更高、精度略降；结束后状态栏显示实时率 RTF")
+        set_box.addWidget(self.batch_spin)
+        self.stream_check = QCheckBox("🎞️ 长录音流式")
+        self.stream_check.setToolTip("数小时的录音按固定窗口边解码边识别，内存占用与时长无关；\n"
+                                     "确定的歌词行会立即显示并写入 cache/streams 下的同名 .lrc")
+        set_box.addWidget(self.stream_check)
+        set_box.addWidget(QLabel("🎤 人声分离:"))
+        self.vocal_combo = QComboBox()
+        for label, method in (("关闭", "off"), ("中置声道", "center"), ("HPSS 去鼓点", "hpss")):
+            self.vocal_combo.addItem(label, method)
+        self.vocal_combo.setToolTip("伴奏较响时先在 CPU 上提取人声再识别 (结果按音频缓存)\n"
+                                    "中置声道: 适合人声居中的立体声混音；HPSS: 去除鼓点等打击乐")
+        set_box.addWidget(self.vocal_combo)
+        self.trace_check = QCheckBox("📈 导出性能追踪")
+        self.trace_check.setToolTip("任务结束后把各阶段耗时/内存写入 cache/traces 下的 Chrome trace JSON")
+        set_box.addWidget(self.trace_check)
+        set_box.addStretch()
+        layout.addLayout(set_box)
+        
+        # Prompt区域
+        prompt_box = QHBoxLayout()
+        prompt_box.addWidget(QLabel("提示词 (Prompt):"))
+        self.prompt_input = QLineEdit()
+        self.prompt_input.setPlaceholderText("可引导模型生成风格 (留空则使用默认)")
+        self.update_prompt_defaults(self.lang_combo.currentText())
+        prompt_box.addWidget(self.prompt_input)
+        layout.addLayout(prompt_box)
+        
+        # 分割区域
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        
+        # 左侧输入
+        left = QWidget()
+        l_lay = QVBoxLayout(left)
+        h_lay = QHBoxLayout()
+        h_lay.addWidget(QLabel("<b>📝 歌词底稿</b>"))
+        btn_imp = QPushButton("📂 导入 LRC/TXT")
+        btn_imp.setStyleSheet("background:#e6a23c; color: white;")
+        btn_imp.clicked.connect(self.import_lrc)
+        btn_clr = QPushButton("🗑️ 清空")
+        btn_clr.setStyleSheet("background:#f56c6c; color: white;")
+        btn_clr.clicked.connect(lambda: self.input_txt.clear())
+        h_lay.addWidget(btn_imp)
+        h_lay.addWidget(btn_clr)
+        h_lay.addStretch()
+        l_lay.addLayout(h_lay)
+        self.input_txt = QTextEdit()
+        self.input_txt.setPlaceholderText("在此粘贴包含时间戳的LRC...\n第一行为原文，后续相同时间戳的行为翻译。")
+        l_lay.addWidget(self.input_txt)
+        splitter.addWidget(left)
+        
+        # 右侧输出
+        right = QWidget()
+        r_lay = QVBoxLayout(right)
+        r_head_lay = QHBoxLayout()
+        r_head_lay.addWidget(QLabel("<b>✅ 生成结果</b>"))
+        self.btn_cali = QPushButton("🛠️ 手动校准/编辑")
+        self.btn_cali.setStyleSheet("background: #909399; color: white;")
+        self.btn_cali.clicked.connect(self.open_calibration)
+        self.btn_cali.setEnabled(False)
+        r_head_lay.addStretch()
+        r_head_lay.addWidget(self.btn_cali)
+        r_lay.addLayout(r_head_lay)
+        self.out_txt = QTextEdit()
+        self.out_txt.setStyleSheet("background:#f0f9eb; color: #333;")
+        self.out_txt.setReadOnly(True)
+        r_lay.addWidget(self.out_txt)
+        splitter.addWidget(right)
+        layout.addWidget(splitter, 1)
+        
+        # 任务队列
+        q_head = QHBoxLayout()
+        q_head.addWidget(QLabel("<b>📋 任务队列</b>"))
+        self.queue_info = QLabel()
+        self.queue_info.setStyleSheet("color: gray;")
+        q_head.addWidget(self.queue_info)
+        q_head.addStretch()
+        for text, slot in (("➕ 加入队列", self.enqueue_job), ("⬆️", lambda: self.move_job(-1)),
+                           ("⬇️", lambda: self.move_job(1)), ("🔺 提高优先级", lambda: self.change_priority(1)),
+                           ("🔻 降低优先级", lambda: self.change_priority(-1)), ("✖ 取消", self.cancel_jobs),
+                           ("🧹 清除已结束", self.clear_finished_jobs), ("💾 保存全部结果", self.save_job_results)):
+            btn = QPushButton(text)
+            btn.clicked.connect(slot)
+            q_head.addWidget(btn)
+        layout.addLayout(q_head)
+        self.queue_model = JobQueueModel(self)
+        self.queue_view = QTableView()
+        self.queue_view.setModel(self.queue_model)
+        self.queue_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.queue_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.queue_view.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.queue_view.verticalHeader().hide()
+        self.queue_view.setMaximumHeight(160)
+        self.queue_view.setToolTip("双击已完成的任务查看结果")
+        self.queue_view.doubleClicked.connect(self.show_job_result)
+        layout.addWidget(self.queue_view)
+        
+        # 底部控制
+        btm = QHBoxLayout()
+        self.btn_run = QPushButton("🚀 开始生成")
+        self.btn_run.clicked.connect(self.start)
+        self.btn_run.setMinimumHeight(35)
+        self.btn_stop = QPushButton("⏹️ 停止")
+        self.btn_stop.setStyleSheet("background:#f56c6c; color: white;")
+        self.btn_stop.clicked.connect(self.stop)
+        self.btn_stop.setEnabled(False)
+        self.btn_stop.setMinimumHeight(35)
+        btm.addWidget(self.btn_run, 2)
+        btm.addWidget(self.btn_stop, 1)
+        layout.addLayout(btm)
+        
+        # 状态栏
+        stat = QHBoxLayout()
+        self.status = QLabel("就绪")
+        self.pbar = QProgressBar()
+        self.pbar.setTextVisible(False)
+        self.pbar.setMaximumHeight(10)
+        self.pbar.hide()
+        stat.addWidget(self.status)
+        stat.addWidget(self.pbar)
+        stat.addStretch()
+        self.profile_lbl = QLabel()
+        self.profile_lbl.setStyleSheet("color: gray;")
+        stat.addWidget(self.profile_lbl)
+        self.model_combo.currentTextChanged.connect(self.update_profile_label)
+        self.update_profile_label()
+        stat.addWidget(QLabel("保存编码:"))
+        self.enc_combo = QComboBox()
+        self.enc_combo.addItems(["utf-8", "gbk", "utf-8-sig"])
+        stat.addWidget(self.enc_combo)
+        btn_save = QPushButton("💾 保存结果")
+        btn_save.clicked.connect(self.save)
+        stat.addWidget(btn_save)
+        layout.addLayout(stat)
+
+    def update_prompt_defaults(self, lang_text):
+        defaults = {
+            "zh": "这是一首语速很快的Vocaloid中文歌曲。",
+            "ja": "这是一首日语歌曲。",
+            "en": "This is a pop song.",
+            "yue": "这是一首粤语歌曲。",
+            "ko": "This is a Korean song."
+        }
+        self.prompt_input.setText(defaults.get(lang_text, ""))
+
+    def update_profile_label(self):
+        """状态栏显示本机当前模型的 CPU 调优结果"""
+        model_size = self.model_combo.currentText()
+        profile = load_hw_profile(model_size)
+        if profile:
+            self.profile_lbl.setText(f"🧪 {format_hw_profile(profile)}")
+            self.profile_lbl.setToolTip(f"{model_size} 的 CPU 推理参数 ({profile['backend']})，"
+                                        f"测试于 {profile['tuned_at']}\n{hw_profile_path()}")
+        else:
+            self.profile_lbl.setText("🧪 CPU 参数: 默认")
+            self.profile_lbl.setToolTip(f"运行 python main.py autotune {model_size} 测量本机最快的 CPU 推理参数")
+
+    def on_worker_message(self, msg):
+        if self.sender() is not self.reader: return    # 已被替换的旧进程残留消息
+        kind = msg[0]
+        if kind == MSG_STATUS:
+            self.status.setText(msg[1])
+        elif kind == MSG_PROGRESS:
+            if self.pbar.maximum() == 0: self.pbar.setRange(0, 1000)
+            self.pbar.setValue(int(msg[1] * 1000))
+        elif kind == MSG_PARTIAL:
+            self.out_txt.append(msg[1])
+        elif kind == MSG_STAGE:
+            _, name, phase, elapsed = msg
+            if phase == "start": self.status.setText(f"⏳ {STAGE_NAMES.get(name, name)}...")
+        elif kind == MSG_STATS:
+            self.last_stages = msg[1]
+        elif kind == MSG_TIMED:
+            self.pending_timed = msg[1]
+        elif kind == MSG_RESULT:
+            _, result_type, result_data = msg
+            self.finish_job()
+            if result_type == "success": self.on_done(result_data)
+            elif result_type == "stopped": self.on_stopped(result_data)
+            elif result_type == "error": self.on_error(result_data)
+            elif result_type == "aborted": self.on_aborted()
+            self.report_stages()
+            self.update_profile_label()
+        elif kind == MSG_EXIT:
+            # 常驻进程意外退出 (崩溃或被强制结束)
+            if self.job_running: self.on_aborted()
+            self.cleanup_worker()
+
+    def report_stages(self):
+        """在状态栏追加各阶段耗时摘要 (悬停显示明细)，按需导出 trace 文件"""
+        stages, self.last_stages = self.last_stages, []
+        if not stages: return
+        self.status.setText(f"{self.status.text()}  |  {format_stage_summary(stages)}")
+        self.status.setToolTip(f"<pre>{format_stage_table(stages)}</pre>")
+        if self.trace_check.isChecked() and self.audio_path:
+            try:
+                path = trace_path(get_cache_dir("traces"), self.audio_path)
+                write_chrome_trace(path, stages, os.path.basename(self.audio_path))
+                self.status.setText(f"{self.status.text()}  |  trace: {os.path.basename(path)}")
+            except Exception as e:
+                self.status.setText(f"{self.status.text()}  |  trace 写入失败: {e}")
+
+    def select_audio(self):
+        f, _ = QFileDialog.getOpenFileName(self, "选择音频", "", "Audio Files (*.mp3 *.wav *.flac *.m4a *.ogg)")
+        if f:
+            self.audio_path = f
+            self.path_lbl.setText(f"🎵 {os.path.basename(f)}")
+            self.status.setText("音频已加载")
+            if self.out_txt.toPlainText().strip(): self.btn_cali.setEnabled(True)
+
+    def import_lrc(self):
+        f, _ = QFileDialog.getOpenFileName(self, "导入歌词", "", "Lrc/Txt/Srt (*.lrc *.txt *.srt)")
+        if not f: return
+        try:
+            raw = read_text_file(f)
+            ext = os.path.splitext(f)[1].lower()
+            clean_text = self.lrc_parser.parse(raw, ext)
+            self.input_txt.setText(clean_text)
+            self.status.setText(f"导入成功: {os.path.basename(f)}")
+        except Exception as e:
+            QMessageBox.warning(self, "导入错误", str(e))
+
+    def collect_job(self):
+        """把当前界面上的音频、歌词与各项设置打包为任务参数 (常驻进程与任务队列共用)"""
+        txt = self.input_txt.toPlainText()
+        prompt_text = self.prompt_input.text()
+        # 导入后手动修改过的歌词以输入框为准
+        self.lrc_parser.update_lines(txt)
+        
+        lrc_parser_data = {'headers': list(self.lrc_parser.headers), 'lines_text': list(self.lrc_parser.lines_text),
+                           'translations': dict(self.lrc_parser.translations)}
+        return {
+            'audio_path': self.audio_path,
+            'model_size': self.model_combo.currentText(),
+            'language': self.lang_combo.currentText(),
+            'ref_text': txt,
+            'lrc_parser_data': lrc_parser_data,
+            'time_offset': self.offset_spin.value()/1000.0,
+            'initial_prompt_input': prompt_text,
+            'chunked': self.chunk_check.isChecked(),
+            'vocals': self.vocal_combo.currentData(),
+            'incremental': self.incremental_check.isChecked(),
+            'batch_size': self.batch_spin.value(),
+            'streaming': self.stream_check.isChecked(),
+            'stream_path': os.path.join(get_cache_dir("streams"),
+                                        os.path.splitext(os.path.basename(self.audio_path))[0] + ".lrc")
+                           if self.stream_check.isChecked() else None,
+        }
+
+    def start(self):
+        if not self.audio_path: return QMessageBox.warning(self, "提示", "请先选择音频文件")
+        self.btn_run.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.model_combo.setEnabled(False)
+        self.btn_cali.setEnabled(False)
+        self.pbar.show()
+        self.pbar.setRange(0, 0)
+        self.out_txt.clear()
+        self.pending_timed = None
+        
+        job = self.collect_job()
+        self.ensure_model_host()
+        self.stop_event.clear()
+        self.current_job = job
+        self.job_queue.put(job)
+        self.job_running = True
+        self.note_host_model(job['model_size'])
+
+    # ---------- 任务队列 ----------
+    def enqueue_job(self):
+        if not self.audio_path: return QMessageBox.warning(self, "提示", "请先选择音频文件")
+        self.queue_model.add(QueuedJob(self.collect_job()))
+        self.schedule_jobs()
+
+    def selected_jobs(self):
+        rows = sorted({index.row() for index in self.queue_view.selectionModel().selectedRows()})
+        return [self.queue_model.jobs[r] for r in rows]
+
+    def move_job(self, delta):
+        rows = self.queue_view.selectionModel().selectedRows()
+        if not rows: return
+        row = self.queue_model.move(rows[0].row(), delta)
+        self.queue_view.selectRow(row)
+
+    def change_priority(self, delta):
+        for item in self.selected_jobs():
+            item.priority += delta
+            self.queue_model.refresh(item)
+        self.schedule_jobs()
+
+    def cancel_jobs(self):
+        for item in self.selected_jobs():
+            if item.state == "queued":
+                item.state = "cancelled"
+            elif item.state == "running":
+                item.stop_event.set()
+                item.message = "正在请求停止..."
+                # 推理过程中无法响应停止信号时，超时后强制结束该任务的进程
+                QTimer.singleShot(HOST_STOP_GRACE_MS, lambda item=item: self.force_cancel(item))
+            self.queue_model.refresh(item)
+        self.schedule_jobs()
+
+    def force_cancel(self, item):
+        if item.state == "running" and item.process is not None and item.process.is_alive():
+            item.process.terminate()
+
+    def clear_finished_jobs(self):
+        self.queue_model.remove_where(lambda item: item.state not in ("queued", "running"))
+        self.update_queue_info()
+
+    def schedule_jobs(self):
+        """按资源预算启动排队任务；任务开始/结束、入队和调整优先级时调用"""
+        if self.closing: return
+        if self.scheduler is None: self.scheduler = JobScheduler.detect()
+        jobs = self.queue_model.jobs
+        running = [item.job for item in jobs if item.state == "running"]
+        resident = list(self.host_models)
+        if self.job_running and self.current_job:
+            running.append(self.current_job)
+            # 正在运行的常驻任务已按其模型计入，不重复计算
+            if self.current_job['model_size'] in resident: resident.remove(self.current_job['model_size'])
+        queued = [item for item in jobs if item.state == "queued"]
+        picked = self.scheduler.pick(queued, running, resident)
+        if queued and not picked and not running and resident:
+            # 常驻进程空闲但缓存的模型挤占了预算：让它释放模型，而不是让队列一直等待或超额启动
+            self.release_host_models()
+            picked = self.scheduler.pick(queued, running)
+        for item in picked:
+            self.launch_job(item)
+        self.update_queue_info()
+
+    def note_host_model(self, model_size):
+        """记录常驻进程缓存中的模型，与 ModelCache 的 LRU 淘汰保持一致"""
+        if model_size in self.host_models: self.host_models.remove(model_size)
+        self.host_models.append(model_size)
+        del self.host_models[:-MODEL_CACHE_SIZE]
+
+    def release_host_models(self):
+        if self.job_queue is not None and self.host_models:
+            self.job_queue.put(HOST_RELEASE)
+        self.host_models = []
+
+    def launch_job(self, item):
+        item.stop_event = Event()
+        recv_conn, send_conn = Pipe(duplex=False)
+        item.process = Process(target=worker_process, args=(item.job, send_conn, item.stop_event))
+        item.process.start()
+        send_conn.close()
+        item.reader = ChannelReader(recv_conn, self)
+        item.reader.message.connect(lambda msg, item=item: self.on_job_message(item, msg))
+        item.reader.start()
+        item.state = "running"
+        item.message = "正在启动..."
+        self.queue_model.refresh(item)
+
+    def on_job_message(self, item, msg):
+        kind = msg[0]
+        if kind == MSG_STATUS:
+            item.message = msg[1]
+        elif kind == MSG_PROGRESS:
+            item.progress = msg[1]
+        elif kind == MSG_TIMED:
+            item.timed_path = msg[1]
+        elif kind == MSG_RESULT:
+            _, result_type, result_data = msg
+            item.state = RESULT_STATES.get(result_type, "failed")
+            if result_type == "error": item.message = result_data
+            else: item.result = result_data
+        elif kind == MSG_EXIT:
+            if item.state == "running":
+                item.state = "cancelled" if item.stop_event.is_set() else "failed"
+                if item.state == "failed": item.message = "任务进程意外退出"
+            self.release_job(item)
+            self.schedule_jobs()
+        self.queue_model.refresh(item)
+
+    def release_job(self, item):
+        if item.process is not None:
+            item.process.join(timeout=0.2)
+            item.process = None
+        if item.reader is not None:
+            item.reader.wait(2000)
+            item.reader = None
+
+    def update_queue_info(self):
+        if self.scheduler is None: return
+        counts = {}
+        for item in self.queue_model.jobs: counts[item.state] = counts.get(item.state, 0) + 1
+        self.queue_info.setText(f"运行 {counts.get('running', 0)} · 排队 {counts.get('queued', 0)} · "
+                                f"完成 {counts.get('done', 0)}  |  {self.scheduler.describe()}")
+
+    def show_job_result(self, index):
+        item = self.queue_model.jobs[index.row()]
+        if not item.result: return
+        self.audio_path = item.job['audio_path']
+        self.path_lbl.setText(f"🎵 {os.path.basename(self.audio_path)}")
+        self.out_txt.setText(item.result)
+        self.set_timed(item.result, item.timed_path)
+        self.btn_cali.setEnabled(not self.job_running)
+        self.status.setText(f"📋 已载入队列结果: {item.name}")
+
+    def save_job_results(self):
+        """把已完成任务的结果保存到各自音频旁边 (同名 .lrc 已存在时保存为 .auto.lrc)"""
+        saved = 0
+        for item in self.queue_model.jobs:
+            if item.state not in ("done", "stopped") or not item.result: continue
+            stem = os.path.splitext(item.job['audio_path'])[0]
+            path = stem + ".lrc" if not os.path.exists(stem + ".lrc") else stem + ".auto.lrc"
+            try:
+                with open(path, 'w', encoding=self.enc_combo.currentText()) as f: f.write(item.result)
+                saved += 1
+            except Exception as e:
+                QMessageBox.critical(self, "保存失败", f"{item.name}: {e}")
+                break
+        self.status.setText(f"💾 已保存 {saved} 个队列结果")
+
+    def cleanup_jobs(self):
+        """退出时结束所有队列任务"""
+        self.closing = True
+        for item in self.queue_model.jobs:
+            if item.state == "queued": item.state = "cancelled"
+            if item.process is not None:
+                item.stop_event.set()
+                if item.process.is_alive(): item.process.terminate()
+                self.release_job(item)
+
+    def ensure_model_host(self):
+        """启动常驻模型进程 (已在运行则直接复用，模型保持热加载)"""
+        if self.model_host and self.model_host.is_alive(): return
+        self.cleanup_worker()
+        self.job_queue = Queue()
+        self.stop_event = Event()
+        recv_conn, send_conn = Pipe(duplex=False)
+        self.model_host = Process(
+            target=model_host_process,
+            args=(self.job_queue, send_conn, self.stop_event)
+        )
+        self.model_host.start()
+        # 关闭本进程持有的发送端，子进程退出时读取线程才能收到 EOF
+        send_conn.close()
+        self.reader = ChannelReader(recv_conn, self)
+        self.reader.message.connect(self.on_worker_message)
+        self.reader.start()
+
+    def stop(self):
+        if self.job_running and self.model_host and self.model_host.is_alive():
+            self.status.setText("正在请求停止...")
+            self.stop_event.set()
+            # 推理过程中无法响应停止信号时，超时后强制结束常驻进程
+            QTimer.singleShot(HOST_STOP_GRACE_MS, self.force_stop)
+
+    def force_stop(self):
+        if self.job_running and self.stop_event is not None and self.stop_event.is_set():
+            self.on_aborted()
+            self.cleanup_worker()
+
+    def finish_job(self):
+        self.job_running = False
+        # 常驻进程的任务结束后释放的资源可以分给队列
+        if self.current_job is not None:
+            self.current_job = None
+            self.schedule_jobs()
+
+    def cleanup_worker(self):
+        self.finish_job()
+        if self.model_host:
+            if self.job_queue is not None:
+                try: self.job_queue.put(None)
+                except: pass
+            self.model_host.join(timeout=1)
+            if self.model_host.is_alive(): self.model_host.terminate()
+            self.model_host.join(timeout=1)
+            self.model_host = None
+        self.host_models = []
+        if self.reader is not None:
+            self.reader.wait(2000)
+            self.reader = None
+        self.job_queue = None
+        self.stop_event = None
+
+    def on_done(self, lrc: str):
+        self.btn_run.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+        self.model_combo.setEnabled(True)
+        self.btn_cali.setEnabled(True)
+        self.pbar.hide()
+        self.out_txt.setText(lrc)
+        self.set_timed(lrc, self.pending_timed)
+        self.status.setText("✅ 任务完成")
+
+    def on_stopped(self, lrc: str):
+        self.on_aborted()
+        self.out_txt.setText(lrc)
+        self.set_timed(lrc, self.pending_timed)
+        self.btn_cali.setEnabled(bool(lrc.strip()))
+        self.status.setText("🛑 任务已停止，已保留识别出的部分")
+
+    def on_aborted(self):
+        self.btn_run.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+        self.model_combo.setEnabled(True)
+        self.btn_cali.setEnabled(bool(self.out_txt.toPlainText().strip()))
+        self.pbar.hide()
+        self.status.setText("🛑 任务已停止")
+
+    def on_error(self, error_msg: str):
+        self.btn_run.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+        self.model_combo.setEnabled(True)
+        self.pbar.hide()
+        self.status.setText("❌ 任务失败")
+        QMessageBox.critical(self, "错误", error_msg)
+
+    def open_calibration(self):
+        if not self.audio_path: return QMessageBox.warning(self, "提示", "没有加载音频文件")
+        content = self.out_txt.toPlainText()
+        if not content: return QMessageBox.warning(self, "提示", "没有歌词内容")
+        
+        dialog = LrcEditorDialog(self.audio_path, content, self, timed=self.current_timed(parse=False))
+        if dialog.exec():
+            if dialog.result_lrc:
+                self.out_txt.setText(dialog.result_lrc)
+                self.set_timed(dialog.result_lrc, dialog.result_timed)
+                self.status.setText("✅ 校准已应用")
+
+    def set_timed(self, text, timed):
+        self.timed_source = (text, timed)
+
+    def current_timed(self, parse=True):
+        """
+        输出框文本对应的 TimedTokens：文本未被修改时直接使用工作进程/校准窗口给出的时间轴
+        (文件以内存映射方式打开)，否则 parse 为真时从文本解析一次，为假时返回 None。
+        """
+        text = self.out_txt.toPlainText()
+        source_text, timed = self.timed_source
+        if timed is not None and text == source_text:
+            try: return load_timed_tokens(timed) if isinstance(timed, str) else timed
+            except Exception as e: print(f"读取时间轴文件失败: {e}")
+        return timed_from_lrc(text) if parse else None
+
+    def save(self):
+        txt = self.out_txt.toPlainText()
+        if not txt: return
+        stem = os.path.splitext(os.path.basename(self.audio_path))[0] if self.audio_path else "out"
+        # 增强 LRC 的后缀为 .enhanced.lrc，对话框中只按最后一段扩展名过滤
+        filters = {f"{label} (*.{suffix.rsplit('.', 1)[1]})": (fmt, "." + suffix.rsplit('.', 1)[1])
+                   for fmt, (label, suffix, _) in TIMED_FORMATS.items()}
+        f, selected = QFileDialog.getSaveFileName(self, "保存歌词", stem + ".lrc", ";;".join(filters))
+        if f:
+            fmt, ext = filters.get(selected, ('lrc', ".lrc"))
+            if not f.lower().endswith(ext): f = os.path.splitext(f)[0] + ext
+            try:
+                if fmt == 'lrc':
+                    # 逐字 LRC 就是输出框里的文本，直接写出
+                    with open(f, 'w', encoding=self.enc_combo.currentText()) as file: file.write(txt)
+                else:
+                    write_timed(self.current_timed(), fmt, f, self.enc_combo.currentText())
+                self.status.setText(f"💾 已保存: {os.path.basename(f)}")
+            except Exception as e:
+                QMessageBox.critical(self, "保存失败", str(e))
+
+    def closeEvent(self, event):
+        host_busy = self.job_running and self.model_host and self.model_host.is_alive()
+        queue_busy = any(item.state in ("queued", "running") for item in self.queue_model.jobs)
+        if host_busy or queue_busy:
+            reply = QMessageBox.question(self, '确认退出', '后台任务正在运行，确定要退出吗？', 
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, 
+                                         QMessageBox.StandardButton.No)
+            if reply == QMessageBox.StandardButton.Yes:
+                self.cleanup_jobs()
+                if host_busy:
+                    self.stop_event.set()
+                    time.sleep(0.5)
+                    self.model_host.terminate()
+                self.cleanup_worker()
+                event.accept()
+            else: event.ignore()
+        else:
+            self.cleanup_jobs()
+            self.cleanup_worker()
+            event.accept()
+
+# ================= 命令行批处理 =================
+AUDIO_EXTS = ('.mp3', '.wav', '.flac', '.m4a', '.ogg')
+LYRICS_EXTS = ('.txt', '.lrc', '.srt')
+MANIFEST_NAME = "autokaraoke_manifest.json"
+
+class ConsoleChannel(WorkerChannel):
+    """批处理中代替管道：状态直接打印到终端，最终结果保存在 value 中"""
+    def __init__(self, tag):
+        super().__init__(None)
+        self.tag = tag
+        self.value = ("error", "未返回结果")
+        self.stats = []
+        self.timed_path = None
+
+    def send(self, *msg):
+        if msg[0] == MSG_STATUS:
+            print(f"[{self.tag}] {msg[1]}", flush=True)
+        elif msg[0] == MSG_TIMED:
+            self.timed_path = msg[1]
+        # 进度百分比/逐段结果只用于界面
+
+    def result(self, kind, payload):
+        self.stats = self.take_stages()
+        self.value = (kind, payload)
+
+    def close(self):
+        pass
+
+_batch_cache = None
+_batch_stop_event = None
+
+def _batch_init(stop_event):
+    global _batch_cache, _batch_stop_event
+    load_ml_stack()
+    _batch_cache = ModelCache()
+    _batch_stop_event = stop_event
+
+def _batch_run_item(task):
+    index, item, options = task
+    started = time.time()
+    name = os.path.basename(item['audio'])
+    stages = []
+    try:
+        parser = LrcParser()
+        ref_text = ""
+        if item.get('lyrics'):
+            ref_text = parser.parse(read_text_file(item['lyrics']), os.path.splitext(item['lyrics'])[1].lower())
+        lrc_parser_data = {'headers': parser.headers, 'lines_text': parser.lines_text, 'translations': parser.translations}
+        
+        channel = ConsoleChannel(name)
+        try:
+            run_job(_batch_cache.get, item['audio'], options['model'], options['language'], ref_text,
+                    lrc_parser_data, options['offset'] / 1000.0, options['prompt'],
+                    channel, _batch_stop_event,
+                    align_band=options.get('align_band', ALIGN_BAND),
+                    chunked=options.get('chunked', False), chunk_workers=options.get('chunk_workers', 0),
+                    vocals=options.get('vocals', "off"), incremental=options.get('incremental', False),
+                    batch_size=options.get('batch_size', 0),
+                    streaming=options.get('streaming', False), stream_path=item['output'] + ".partial")
+        except torch.cuda.OutOfMemoryError:
+            _batch_cache.clear()
+        
+        stages = channel.stats
+        if stages and options.get('trace_dir'):
+            write_chrome_trace(trace_path(options['trace_dir'], item['audio']), stages, name)
+        result_type, result_data = channel.value
+        if result_type != "success":
+            return index, result_type, result_data or "", time.time() - started, stages
+        with open(item['output'], 'w', encoding=options['encoding']) as file:
+            file.write(result_data)
+        extra = [fmt for fmt in options.get('formats', ['lrc']) if fmt != 'lrc']
+        if extra:
+            # 其他格式直接由工作进程写出的时间轴导出，不再解析 LRC 文本
+            timed = load_timed_tokens(channel.timed_path) if channel.timed_path else timed_from_lrc(result_data)
+            for fmt in extra:
+                write_timed(timed, fmt, export_path(item, fmt), options['encoding'])
+            timed = None
+        if os.path.exists(item['output'] + ".partial"): os.remove(item['output'] + ".partial")
+        return index, "done", "", time.time() - started, stages
+    except Exception as e:
+        return index, "error", str(e), time.time() - started, stages
+
+def export_path(item, fmt):
+    """与输出 LRC 同名的其他格式文件；与参考歌词同名时改为 .auto 后缀 (不覆盖参考的 .srt)"""
+    stem = os.path.splitext(item['output'])[0]
+    path = stem + TIMED_FORMATS[fmt][1]
+    if item.get('lyrics') and os.path.abspath(path) == os.path.abspath(item['lyrics']):
+        path = stem + ".auto" + TIMED_FORMATS[fmt][1]
+    return path
+
+def scan_batch_items(directory, recursive=False):
+    """扫描目录，按同名规则配对音频与参考歌词 (xxx.mp3 + xxx.txt/lrc/srt)"""
+    items = []
+    for root, dirs, files in os.walk(directory):
+        if not recursive: dirs[:] = []
+        names = set(files)
+        for fname in sorted(files):
+            stem, ext = os.path.splitext(fname)
+            if ext.lower() not in AUDIO_EXTS: continue
+            lyrics = next((stem + e for e in LYRICS_EXTS if stem + e in names), None)
+            output = stem + ".lrc"
+            if lyrics == output: output = stem + ".auto.lrc"
+            items.append({
+                'audio': os.path.join(root, fname),
+                'lyrics': os.path.join(root, lyrics) if lyrics else None,
+                'output': os.path.join(root, output),
+                'status': "pending", 'error': "", 'elapsed': 0.0,
+            })
+    return items
+
+def load_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list): manifest = {'items': manifest}
+    base = os.path.dirname(os.path.abspath(path))
+    for item in manifest.get('items', []):
+        for key in ('audio', 'lyrics', 'output'):
+            if item.get(key) and not os.path.isabs(item[key]):
+                item[key] = os.path.join(base, item[key])
+        if not item.get('output'):
+            item['output'] = os.path.splitext(item['audio'])[0] + ".lrc"
+        item.setdefault('status', "pending")
+        item.setdefault('error', "")
+        item.setdefault('elapsed', 0.0)
+    return manifest
+
+def save_manifest(path, manifest):
+    # 先写临时文件再替换，避免中断时损坏清单
+    write_json_atomic(path, manifest, ensure_ascii=False, indent=2)
+
+def save_stage_report(manifest_path, manifest):
+    """汇总清单中所有歌曲的阶段耗时，写回清单并打印直方图"""
+    manifest['stage_histogram'] = stage_histogram(item.get('stages') for item in manifest['items'])
+    save_manifest(manifest_path, manifest)
+    print(format_stage_histogram(manifest['stage_histogram']), flush=True)
+
+def run_batch(argv):
+    ap = argparse.ArgumentParser(prog="main.py batch", description="AutoKaraoke 无界面批处理")
+    ap.add_argument("source", help="音频目录，或清单文件 (.json)")
+    ap.add_argument("--manifest", help=f"状态清单路径 (默认: 目录下的 {MANIFEST_NAME})")
+    ap.add_argument("--workers", type=int, default=1, help="并行进程数 (每个进程各自加载模型)")
+    ap.add_argument("--model", default="large-v2")
+    ap.add_argument("--language", default="ja", help="语言代码，auto 表示自动检测")
+    ap.add_argument("--offset", type=int, default=0, help="整体偏移 (ms)")
+    ap.add_argument("--prompt", default="")
+    ap.add_argument("--encoding", default="utf-8")
+    ap.add_argument("--band", type=int, default=ALIGN_BAND, help="歌词全局对齐的带宽 (AI 词数)")
+    ap.add_argument("--chunked", action="store_true", help="CPU 分块并行模式 (逐首处理，每首内部多进程)")
+    ap.add_argument("--chunk-workers", type=int, default=0, help="分块模式的进程数 (0 为自动)")
+    ap.add_argument("--vocals", choices=VOCAL_METHODS, default="off", help="识别前在 CPU 上分离人声")
+    ap.add_argument("--batch-size", type=int, default=0, help="无参考歌词时的批量识别批大小 (0 为逐段识别)")
+    ap.add_argument("--streaming", action="store_true", help="长录音流式模式：按窗口处理，内存占用与时长无关")
+    ap.add_argument("--incremental", action="store_true", help="歌词只改动了部分行时，仅重新对齐改动处的音频")
+    ap.add_argument("--formats", default="lrc",
+                    help=f"输出格式，逗号分隔 ({', '.join(TIMED_FORMATS)})；LRC 之外的格式写到同名文件旁边")
+    ap.add_argument("--recursive", action="store_true", help="递归扫描子目录")
+    ap.add_argument("--retry-errors", action="store_true", help="重新处理上次失败的文件")
+    ap.add_argument("--trace-dir", help="为每首歌写出 Chrome trace JSON 的目录")
+    ap.add_argument("--stage-report", action="store_true", help="结束时汇总清单中所有歌曲的各阶段耗时直方图")
+    args = ap.parse_args(argv)
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in TIMED_FORMATS]
+    if unknown: ap.error(f"未知的输出格式: {', '.join(unknown)}")
+    
+    if os.path.isdir(args.source):
+        manifest_path = args.manifest or os.path.join(args.source, MANIFEST_NAME)
+        manifest = load_manifest(manifest_path) if os.path.exists(manifest_path) else {'items': []}
+        known = {os.path.abspath(item['audio']) for item in manifest['items']}
+        for item in scan_batch_items(args.source, args.recursive):
+            if os.path.abspath(item['audio']) not in known: manifest['items'].append(item)
+    else:
+        manifest_path = args.manifest or args.source
+        manifest = load_manifest(args.source)
+    
+    options = {
+        'model': args.model,
+        'language': "Auto (混合)" if args.language.lower() == "auto" else args.language,
+        'offset': args.offset, 'prompt': args.prompt, 'encoding': args.encoding,
+        'align_band': args.band,
+        'chunked': args.chunked, 'chunk_workers': args.chunk_workers,
+        'vocals': args.vocals, 'incremental': args.incremental, 'batch_size': args.batch_size,
+        'streaming': args.streaming, 'formats': formats,
+        'trace_dir': args.trace_dir,
+    }
+    manifest['options'] = options
+    items = manifest['items']
+    def needs_run(item):
+        if item['status'] == "done": return not os.path.exists(item['output'])
+        if item['status'] == "error": return args.retry_errors
+        return True
+    
+    pending = [i for i, item in enumerate(items) if needs_run(item)]
+    for i in pending: items[i]['status'] = "pending"
+    save_manifest(manifest_path, manifest)
+    print(f"共 {len(items)} 首，待处理 {len(pending)} 首，清单: {manifest_path}", flush=True)
+    if not pending:
+        if args.stage_report: save_stage_report(manifest_path, manifest)
+        return 0
+    
+    stop_event = Event()
+    tasks = [(i, items[i], options) for i in pending]
+    if args.chunked:
+        # 分块模式自己会开进程池 (守护进程内不能再创建子进程)，因此逐首在主进程中处理
+        pool = None
+        _batch_init(stop_event)
+        results = map(_batch_run_item, tasks)
+    else:
+        pool = Pool(processes=max(1, args.workers), initializer=_batch_init, initargs=(stop_event,))
+        results = pool.imap_unordered(_batch_run_item, tasks)
+    finished = 0
+    try:
+        for index, status, error, elapsed, stages in results:
+            items[index].update({'status': status, 'error': error, 'elapsed': round(elapsed, 2), 'stages': stages})
+            save_manifest(manifest_path, manifest)
+            finished += 1
+            mark = "✅" if status == "done" else "❌"
+            rtf = next((f" RTF {s['rtf']:.3f}" for s in stages or [] if s.get('rtf')), "")
+            print(f"{mark} [{finished}/{len(pending)}] {os.path.basename(items[index]['audio'])} ({elapsed:.1f}s{rtf}) {error}", flush=True)
+        if pool: pool.close()
+    except KeyboardInterrupt:
+        print("🛑 已中断，再次运行同一命令即可从断点继续", flush=True)
+        stop_event.set()
+        if pool: pool.terminate()
+        return 130
+    finally:
+        if pool: pool.join()
+    
+    failed = sum(1 for item in items if item['status'] == "error")
+    print(f"完成: {sum(1 for item in items if item['status'] == 'done')} 成功, {failed} 失败", flush=True)
+    if args.stage_report: save_stage_report(manifest_path, manifest)
+    return 1 if failed else 0
+
+# ================= 性能基准 =================
+BENCH_SIZES = (100, 1000, 10000, 50000)
+BENCH_SCRIPTS = ('cjk', 'latin')
+BENCH_TOLERANCE = 0.15        # 相对基线变慢超过该比例视为退化
+BENCH_CJK_CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもらりるれろわをん春夏秋冬花風月雪空海光影夢心歌声愛恋涙笑君僕街夜星雨"
+BENCH_LATIN_WORDS = ("love", "night", "dream", "heart", "light", "dance", "forever", "tonight",
+                     "shine", "baby", "don't", "stay", "run", "sky", "fire", "1999")
+BENCH_TRANSLATIONS = ("我们在夜空下唱歌", "梦想永远不会结束", "请不要离开我", "光芒照亮了街道", "心跳停不下来")
+
+def synth_song(n_lines, script, seed=0):
+    """
+    生成合成歌曲：返回 (逐字 LRC 文本, 模拟的识别结果)。
+    每行带逐字时间标签与一行翻译；识别结果带时间抖动，并随机漏词/错词。
+    行数很多时整体压缩时间轴，保证时间标签不超过 LRC 的两位分钟数。
+    """
+    rng = np.random.default_rng(seed)
+    song = []
+    t = 1.0
+    for i in range(n_lines):
+        if script == 'cjk':
+            tokens = [BENCH_CJK_CHARS[k] for k in rng.integers(0, len(BENCH_CJK_CHARS), rng.integers(6, 15))]
+        else:
+            tokens = [BENCH_LATIN_WORDS[k] for k in rng.integers(0, len(BENCH_LATIN_WORDS), rng.integers(3, 9))]
+        durations = rng.uniform(0.18, 0.42, len(tokens))
+        starts = t + np.concatenate(([0.0], np.cumsum(durations[:-1])))
+        song.append((tokens, starts, durations))
+        t = starts[-1] + durations[-1] + rng.uniform(0.5, 3.0)
+    scale = min(1.0, 5990.0 / t)
+    
+    sep = "" if script == 'cjk' else " "
+    lines = ["[ti:Benchmark]", "[ar:AutoKaraoke]", "[00:00.000]作词：合成数据"]
+    segments = []
+    for i, (tokens, starts, durations) in enumerate(song):
+        starts, durations = starts * scale, durations * scale
+        lines.append(f"[{format_time(starts[0])}]" + sep.join(
+            (f"[{format_time(s)}]" if k else "") + tok for k, (s, tok) in enumerate(zip(starts, tokens))))
+        lines.append(f"[{format_time(starts[0])}]{BENCH_TRANSLATIONS[i % len(BENCH_TRANSLATIONS)]}")
+        
+        words = []
+        jitter = rng.normal(0.0, 0.04 * scale, len(tokens))
+        fate = rng.random(len(tokens))
+        for tok, s, d, j, f in zip(tokens, starts, durations, jitter, fate):
+            if f < 0.05: continue                       # 漏词
+            if f < 0.10: tok = BENCH_LATIN_WORDS[int(f * 1000) % len(BENCH_LATIN_WORDS)] if script == 'cjk' else "uh"
+            words.append({'word': tok if script == 'cjk' else " " + tok, 'start': max(0.0, s + j),
+                          'end': s + j + d, 'probability': float(0.5 + f / 2)})
+        if words:
+            segments.append({'start': words[0]['start'], 'end': words[-1]['end'],
+                             'text': sep.join(w['word'].strip() for w in words), 'words': words})
+    return "\n".join(lines), {'segments': segments}
+
+def bench_time(fn, repeat):
+    """预热一次后重复运行，返回各次耗时 (秒)；计时期间关闭 GC 以减少抖动"""
+    fn()
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return times
+
+def bench_cases(lrc, fake_result):
+    """被测路径：名称 -> 无参函数。编辑器方法与界面无关，直接在未初始化的实例上调用"""
+    parser = LrcParser()
+    parser.parse(lrc, '.lrc')
+    compact = compact_result(fake_result)
+    tags = re.findall(r'\[\d{2}:\d{2}\.\d{2,3}\]', lrc)
+    model = LrcTableModel(lrc)
+    rows = list(model.tokens)
+    timed = timed_from_lrc(lrc)
+    probes = np.linspace(0, max(1, int(model.starts.max(initial=0))), 10 * len(model.starts)).astype(int).tolist()
+    word_editor = WordLevelEditor.__new__(WordLevelEditor)
+    return {
+        'LrcParser.parse': lambda: LrcParser().parse(lrc, '.lrc'),
+        'reconstruct_lrc_smart': lambda: reconstruct_lrc_smart(WordPool(compact), parser),
+        'LrcTableModel.load': lambda: LrcTableModel(lrc),
+        'LrcTableModel.shift_row': lambda: [model.shift_row(r, 250) for r in range(model.rowCount())],
+        'LrcTableModel.to_lrc': lambda: model.to_lrc(),
+        'TimeIndex.active': lambda: [model.time_index().active(p) for p in probes],
+        'parse_time_tag+format_ms': lambda: [format_ms(parse_time_tag(t)) for t in tags],
+        'WordLevelEditor.parse_line': lambda: [word_editor.parse_line(times, texts, 0) for times, texts in rows],
+        'timed_from_lrc': lambda: timed_from_lrc(lrc),
+        'LrcTableModel.load_timed': lambda: model.load_timed(timed),
+        'export_timed.srt': lambda: export_timed(timed, 'srt'),
+        'export_timed.ass': lambda: export_timed(timed, 'ass'),
+    }
+
+def compare_bench(results, baseline, tolerance=BENCH_TOLERANCE):
+    """按 (用例, 文字, 行数) 对比最小耗时，返回退化列表"""
+    base = {(r['case'], r['script'], r['lines']): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        b = base.get((r['case'], r['script'], r['lines']))
+        if not b or b['min_ms'] <= 0: continue
+        r['baseline_ms'] = b['min_ms']
+        r['ratio'] = round(r['min_ms'] / b['min_ms'], 3)
+        if r['ratio'] > 1 + tolerance: regressions.append(r)
+    return regressions
+
+def run_bench(argv):
+    ap = argparse.ArgumentParser(prog="main.py bench", description="AutoKaraoke 歌词解析/打轴热点路径的性能基准 (无需模型与显卡)")
+    ap.add_argument("--sizes", default=",".join(map(str, BENCH_SIZES)), help="歌曲行数，逗号分隔")
+    ap.add_argument("--scripts", default=",".join(BENCH_SCRIPTS), help="cjk,latin")
+    ap.add_argument("--cases", default="", help="只运行名称包含这些关键字的用例，逗号分隔")
+    ap.add_argument("--repeat", type=int, default=3, help="每个用例的重复次数 (取最小值)")
+    ap.add_argument("--output", default="bench_results.json", help="结果 JSON 路径")
+    ap.add_argument("--baseline", help="对比的基线 JSON (之前某次的 --output)")
+    ap.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE, help="允许的相对变慢比例")
+    args = ap.parse_args(argv)
+    
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    scripts = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    filters = [c.strip() for c in args.cases.split(",") if c.strip()]
+    results = []
+    for script in scripts:
+        for size in sizes:
+            lrc, fake_result = synth_song(size, script, seed=size)
+            for case, fn in bench_cases(lrc, fake_result).items():
+                if filters and not any(f in case for f in filters): continue
+                times = bench_time(fn, max(1, args.repeat))
+                results.append({
+                    'case': case, 'script': script, 'lines': size, 'repeat': len(times),
+                    'min_ms': round(min(times) * 1000, 3),
+                    'median_ms': round(float(np.median(times)) * 1000, 3),
+                    'us_per_line': round(min(times) * 1e6 / size, 3),
+                })
+                r = results[-1]
+                print(f"{case:<28} {script:<6} {size:>6} 行  min {r['min_ms']:>10.2f} ms  "
+                      f"median {r['median_ms']:>10.2f} ms  {r['us_per_line']:>8.2f} us/行", flush=True)
+    
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_bench(results, json.load(f), args.tolerance)
+        for r in results:
+            if 'ratio' in r:
+                mark = "❌" if r in regressions else "  "
+                print(f"{mark} {r['case']:<28} {r['script']:<6} {r['lines']:>6} 行  x{r['ratio']:.2f} (基线 {r['baseline_ms']:.2f} ms)")
+    
+    report = {
+        'meta': {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': sys.platform,
+                 'cpu_count': os.cpu_count(), 'time': time.strftime("%Y-%m-%d %H:%M:%S")},
+        'results': results,
+    }
+    if args.output:
+        write_json_atomic(args.output, report, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+    if regressions:
+        print(f"共 {len(regressions)} 项相对基线变慢超过 {args.tolerance:.0%}", flush=True)
+        return 1
+    return 0
+
+# ================= 启动耗时 =================
+ML_MODULES = ("torch", "stable_whisper", "faster_whisper")
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 [(模块名, 自身耗时 us, 累计耗时 us, 层级)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line: continue
+        head, cumulative, name = line.split("|", 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(head.split(":")[1]), int(cumulative), depth))
+    return rows
+
+def measure_imports(code, cwd):
+    """在新解释器中用 -X importtime 执行 code，返回 (墙钟秒数, 导入明细, 退出码, stderr 末尾)"""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=cwd, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    tail = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))[-300:]
+    return wall, parse_importtime(proc.stderr), proc.returncode, tail
+
+def run_startup_report(argv):
+    ap = argparse.ArgumentParser(prog="main.py startup", description="AutoKaraoke 启动耗时报告 (基于 -X importtime)")
+    ap.add_argument("--top", type=int, default=15, help="列出累计耗时最长的前 N 个顶层模块")
+    ap.add_argument("--with-ml", action="store_true", help="同时测量工作进程导入 torch / stable-ts 的耗时")
+    ap.add_argument("--output", help="把报告写入 JSON 文件")
+    args = ap.parse_args(argv)
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    targets = [("gui", f"import {module}")]
+    if args.with_ml: targets.append(("worker", "import " + ", ".join(ML_MODULES[:2])))
+    
+    report = {'meta': {'python': sys.version.split()[0], 'platform': sys.platform,
+                       'time': time.strftime("%Y-%m-%d %H:%M:%S")}}
+    status = 0
+    for label, code in targets:
+        wall, rows, returncode, tail = measure_imports(code, here)
+        top = sorted((r for r in rows if r[3] == 0), key=lambda r: r[2], reverse=True)
+        loaded = [name for name in ML_MODULES if any(r[0] == name for r in rows)]
+        report[label] = {
+            'code': code, 'returncode': returncode, 'wall_sec': round(wall, 3),
+            'import_sec': round(sum(r[2] for r in top) / 1e6, 3), 'ml_modules': loaded,
+            'top': [{'module': r[0], 'self_ms': round(r[1] / 1000, 1), 'cumulative_ms': round(r[2] / 1000, 1)}
+                    for r in top[:args.top]],
+        }
+        print(f"[{label}] {code}: 解释器总耗时 {wall:.2f}s, 导入 {report[label]['import_sec']:.2f}s")
+        for item in report[label]['top']:
+            print(f"  {item['cumulative_ms']:>9.1f} ms  {item['module']}")
+        if returncode != 0:
+            print(f"  ❌ 退出码 {returncode}: {tail}")
+            status = 1
+        if label == "gui" and loaded:
+            print(f"  ⚠️ 界面进程导入了机器学习依赖: {', '.join(loaded)}")
+            status = 1
+    
+    if args.output:
+        write_json_atomic(args.output, report, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+    return status
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(run_batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        sys.exit(run_bench(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "startup":
+        sys.exit(run_startup_report(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "autotune":
+        sys.exit(run_autotune(sys.argv[2:]))
+    app = QApplication(sys.argv)
+    try: app.setAttribute(Qt.ApplicationAttribute.AA_UseHighDpiPixmaps)
+    except: pass
+    window = LyricsGenApp()
+    window.show()
     sys.exit(app.exec())
\ No newline at end of file
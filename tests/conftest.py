@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入仓库根目录下的 main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
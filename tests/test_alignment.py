@@ -0,0 +1,92 @@
+"""参考歌词与识别结果的全局序列对齐 (align_tokens_banded)"""
+import numpy as np
+import pytest
+
+try:
+    import main
+except SystemExit:
+    pytest.skip("缺少 PyQt6", allow_module_level=True)
+
+
+def full_dp_alignment(ref_ids, ai_ids, vocab):
+    """不限带宽的 Needleman-Wunsch (AI 序列首尾的多余词不扣分)，平局规则与 align_tokens_banded 相同"""
+    def is_match(r, a):
+        return bool(vocab[r]) and bool(vocab[a]) and (r == a or vocab[r] in vocab[a] or vocab[a] in vocab[r])
+
+    n, m = len(ref_ids), len(ai_ids)
+    gap = main.ALIGN_GAP_SCORE
+    score = np.zeros((n + 1, m + 1))
+    pointer = np.zeros((n + 1, m + 1), dtype=np.int8)
+    score[1:, 0] = gap * np.arange(1, n + 1)
+    pointer[1:, 0] = 1
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            pair = main.ALIGN_MATCH_SCORE if is_match(ref_ids[i - 1], ai_ids[j - 1]) else main.ALIGN_MISMATCH_SCORE
+            diag, up, left = score[i - 1, j - 1] + pair, score[i - 1, j] + gap, score[i, j - 1] + gap
+            best = max(diag, up)
+            score[i, j] = max(best, left)
+            pointer[i, j] = 2 if left > best else int(up > diag)
+
+    matched = np.full(n, -1, dtype=np.int64)
+    i, j = n, int(np.argmax(score[n]))
+    while i > 0:
+        if pointer[i, j] == 0:
+            if is_match(ref_ids[i - 1], ai_ids[j - 1]): matched[i - 1] = j - 1
+            i, j = i - 1, j - 1
+        elif pointer[i, j] == 1:
+            i -= 1
+        else:
+            j -= 1
+    return matched
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_banded_alignment_matches_full_dp(seed):
+    rng = np.random.default_rng(seed)
+    vocab = ["", "a", "b", "ab", "c", "cd", "d", "e"]
+    ref_ids = rng.integers(0, len(vocab), rng.integers(1, 25))
+    ai_ids = rng.integers(0, len(vocab), rng.integers(1, 30))
+    expected = full_dp_alignment(ref_ids.tolist(), ai_ids.tolist(), vocab)
+    # 小规模输入整张表都在默认带宽内，结果应与完整 DP 完全一致
+    matched = main.align_tokens_banded(ref_ids, ai_ids, vocab)
+    np.testing.assert_array_equal(matched, expected)
+
+
+def test_banded_alignment_with_narrow_band():
+    vocab = ["", "x"] + [f"w{k}" for k in range(100)]
+    ref_ids = np.arange(2, 102)
+    # AI 序列开头多了几个词，其余一一对应
+    ai_ids = np.concatenate([[1, 1, 1], ref_ids])
+    matched = main.align_tokens_banded(ref_ids, ai_ids, vocab, band=4)
+    np.testing.assert_array_equal(matched, np.arange(3, 103))
+
+
+def drifted_song(seed, intro=0, skipped=0, inserted=0, n=2000):
+    """
+    合成一对序列：识别结果有 5% 错词，可在开头加前奏、在中间漏掉一段参考词或多出一段噪声。
+    返回 (参考 id, 识别 id, 词表, 每个参考词在识别结果中的真实位置 (漏掉的为 -1))。
+    """
+    rng = np.random.default_rng(seed)
+    vocab = ["", "noise"] + [f"w{k}" for k in range(60)]
+    ref_ids = rng.integers(2, len(vocab), n)
+    ai, truth = [1] * intro, np.full(n, -1)
+    cut = n // 2
+    for i, token in enumerate(ref_ids.tolist()):
+        if i == cut: ai += [1] * inserted
+        if cut <= i < cut + skipped: continue
+        truth[i] = len(ai)
+        ai.append(token if rng.random() > 0.05 else 1)
+    return ref_ids, np.asarray(ai), vocab, truth
+
+
+@pytest.mark.parametrize("case", [dict(intro=300), dict(skipped=300), dict(inserted=300),
+                                  dict(intro=150, skipped=200, inserted=250)])
+def test_banded_alignment_follows_drift_larger_than_band(case):
+    assert main.ALIGN_BAND < 150                   # 偏移量都大于带宽
+    ref_ids, ai_ids, vocab, truth = drifted_song(0, **case)
+    matched = main.align_tokens_banded(ref_ids, ai_ids, vocab)
+    hit = matched >= 0
+    # 匹配到的都是正确位置，可匹配的词 (真实位置上不是错词) 几乎全部找到
+    np.testing.assert_array_equal(matched[hit], truth[hit])
+    matchable = (truth >= 0) & (ai_ids[np.maximum(truth, 0)] == ref_ids)
+    assert hit.sum() >= 0.98 * matchable.sum()
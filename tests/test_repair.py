@@ -0,0 +1,38 @@
+"""整首歌的时间戳修复 (repair_timestamps)"""
+import numpy as np
+import pytest
+
+try:
+    import main
+except SystemExit:
+    pytest.skip("缺少 PyQt6", allow_module_level=True)
+
+
+def test_repair_interpolates_gaps_between_anchors():
+    repaired = main.repair_timestamps([1.0, np.nan, np.nan, 1.3])
+    np.testing.assert_allclose(repaired, [1.0, 1.1, 1.2, 1.3])
+
+
+def test_repair_limits_interpolated_gap():
+    repaired = main.repair_timestamps([1.0, np.nan, np.nan, 9.0, np.nan])
+    step = main.MAX_INTERP_GAP
+    np.testing.assert_allclose(repaired, [1.0, 1.0 + step, 1.0 + 2 * step, 9.0, 9.0 + step])
+
+
+def test_repair_enforces_min_duration():
+    repaired = main.repair_timestamps([1.0, 1.01, 1.02, 5.0])
+    d = main.MIN_DURATION
+    np.testing.assert_allclose(repaired, [1.0, 1.0 + d, 1.0 + 2 * d, 5.0])
+    # 第一个词不早于 start_floor + min_duration
+    np.testing.assert_allclose(main.repair_timestamps([2.01], start_floor=2.0), [2.0 + d])
+
+
+def test_repair_output_is_monotonic():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        times = np.sort(rng.uniform(0, 60, 200)) + rng.normal(0, 2, 200)
+        times[rng.random(200) < 0.3] = np.nan
+        repaired = main.repair_timestamps(times, start_floor=1.0)
+        assert not np.isnan(repaired).any()
+        assert repaired[0] >= 1.0 + main.MIN_DURATION - 1e-9
+        assert np.all(np.diff(repaired) >= main.MIN_DURATION - 1e-9)
@@ -0,0 +1,57 @@
+"""流式模式 (run_job streaming 分支)：异常与停止时也必须给界面发送结果"""
+import threading
+import types
+
+import pytest
+
+try:
+    import main
+except SystemExit:
+    pytest.skip("缺少 PyQt6", allow_module_level=True)
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.results = []
+
+    def result(self, kind, payload): self.results.append((kind, payload))
+    def timed(self, path): pass
+    def partial(self, line): pass
+    def status(self, message): pass
+
+
+@pytest.fixture
+def run_failing_stream(monkeypatch):
+    """把 run_streaming 替换为先输出一段、再 (可选地请求停止后) 抛出异常的版本，返回界面收到的结果"""
+    class FakeOutOfMemory(Exception): pass
+    torch = types.SimpleNamespace(cuda=types.SimpleNamespace(OutOfMemoryError=FakeOutOfMemory))
+    monkeypatch.setattr(main, "torch", torch, raising=False)
+    monkeypatch.setattr(main, "send_timed_result",
+                        lambda channel, kind, timed: channel.result(kind, main.export_timed(timed, 'lrc')))
+
+    def run(lyric, stop):
+        def failing(*args, pieces=None, **kwargs):
+            builder = main.TimedTokensBuilder()
+            if lyric: builder.timed_line(1000, "line one", 2000)
+            else: builder.text_line("[ti:Demo]")
+            pieces.append(builder.build())
+            if stop: stop_event.set()
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(main, "run_streaming", failing)
+        channel, stop_event = RecordingChannel(), threading.Event()
+        main.run_job(None, "song.wav", "small", "ja", "", {}, 0.0, "", channel, stop_event, streaming=True)
+        return channel.results
+    return run
+
+
+def test_exception_after_stop_sends_partial_result(run_failing_stream):
+    assert run_failing_stream(lyric=True, stop=True) == [("stopped", "[00:01.000]line one")]
+
+
+def test_exception_after_stop_without_lyrics_is_aborted(run_failing_stream):
+    assert run_failing_stream(lyric=False, stop=True) == [("aborted", None)]
+
+
+def test_exception_without_stop_is_error(run_failing_stream):
+    assert run_failing_stream(lyric=True, stop=False) == [("error", "错误: boom")]
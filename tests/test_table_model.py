@@ -0,0 +1,18 @@
+"""校准表格的数据模型 (LrcTableModel)"""
+import numpy as np
+import pytest
+
+try:
+    import main
+except SystemExit:
+    pytest.skip("缺少 PyQt6", allow_module_level=True)
+
+
+def test_stamped_row_finds_nearest_timed_row_above():
+    model = main.LrcTableModel()
+    model.set_rows([-1, -1, 500, -1, 900, -1], [(np.zeros(0, dtype=np.int64), ["x"])] * 6)
+    assert [model.stamped_row(r) for r in range(6)] == [-1, -1, 2, 2, 4, 4]
+    # 修改行首时间后重新建立索引
+    model.set_start(1, 100)
+    model.set_start(4, -1)
+    assert [model.stamped_row(r) for r in range(6)] == [-1, 1, 2, 2, 2, 2]
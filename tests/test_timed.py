@@ -0,0 +1,113 @@
+"""时间轴中间格式：校准表格往返与各导出格式"""
+import json
+
+import numpy as np
+import pytest
+
+try:
+    import main
+except SystemExit:
+    pytest.skip("缺少 PyQt6", allow_module_level=True)
+
+
+def sample_timed():
+    """覆盖各种行：带时间标签的头信息、空行、拉丁文词间空白、词的结束时间、翻译行、整行时间、词前标点"""
+    builder = main.TimedTokensBuilder()
+    builder.text_line("[00:00.000]作词：某人")
+    builder.text_line("")
+    builder.text_line("[ti:Song]")
+    builder.token_line([1000, 1400, 1900], ["", "  ", ", "], ["Hello", "big", "world"], "!", [1300, 1800, 2500])
+    builder.translation("你好 世界")
+    builder.timed_line(3000, "plain line", 4200)
+    builder.token_line([5000, 5300], ["(", ""], ["你", "好"], ")", [5200, -1])
+    return builder.build()
+
+
+def table_round_trip(timed):
+    model = main.LrcTableModel()
+    model.load_timed(timed)
+    return model.to_timed()
+
+
+def test_round_trip_keeps_arrays():
+    timed = sample_timed()
+    restored = table_round_trip(timed)
+    assert restored.arrays.keys() == timed.arrays.keys()
+    for name, array in timed.arrays.items():
+        np.testing.assert_array_equal(restored.arrays[name], array, err_msg=name)
+
+
+@pytest.mark.parametrize("fmt", list(main.TIMED_FORMATS))
+def test_round_trip_is_identity_for_every_exporter(fmt):
+    timed = sample_timed()
+    assert main.export_timed(table_round_trip(timed), fmt) == main.export_timed(timed, fmt)
+
+
+def test_edited_row_keeps_line_kinds_and_unmoved_ends():
+    timed = sample_timed()
+    model = main.LrcTableModel()
+    model.load_timed(timed)
+    times, texts = model.tokens[2]
+    model.set_tokens(2, np.array([1500, 1900]), texts)
+    edited = model.to_timed()
+    np.testing.assert_array_equal(edited.line_kind, timed.line_kind)
+    assert edited.tok_start[:3].tolist() == [1000, 1500, 1900]
+    assert edited.tok_end[:3].tolist() == [1300, 1900, 2500]
+    # 头信息仍是文本行，不会变成字幕
+    assert "作词" not in main.export_timed(edited, 'srt')
+
+
+def fixture_timed():
+    """导出格式的固定样例：头信息、逐字行 (带词的结束时间)、翻译行、整行时间"""
+    builder = main.TimedTokensBuilder()
+    builder.text_line("[ti:Demo]")
+    builder.token_line([1000, 1500], ["", " "], ["Hello", "world"], "", [1400, 2000])
+    builder.translation("你好世界")
+    builder.timed_line(3000, "plain", 4000)
+    return builder.build()
+
+
+def test_export_lrc():
+    assert main.export_timed(fixture_timed(), 'lrc').splitlines() == [
+        "[ti:Demo]",
+        "[00:01.000]Hello [00:01.500]world",
+        "[00:01.000]你好世界",
+        "[00:03.000]plain",
+    ]
+
+
+def test_export_enhanced_lrc():
+    assert main.export_timed(fixture_timed(), 'elrc').splitlines() == [
+        "[ti:Demo]",
+        "[00:01.000]<00:01.000>Hello <00:01.500>world<00:02.000>",
+        "[00:01.000]你好世界",
+        "[00:03.000]plain",
+    ]
+
+
+def test_export_srt():
+    assert main.export_timed(fixture_timed(), 'srt').splitlines() == [
+        "1", "00:00:01,000 --> 00:00:02,000", "Hello world", "你好世界", "",
+        "2", "00:00:03,000 --> 00:00:04,000", "plain",
+    ]
+
+
+def test_export_ass():
+    dialogues = [line for line in main.export_timed(fixture_timed(), 'ass').splitlines()
+                 if line.startswith("Dialogue:")]
+    assert dialogues == [
+        "Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,{\\k50}Hello{\\k50} world",
+        "Dialogue: 0,0:00:01.00,0:00:02.00,Translation,,0,0,0,,你好世界",
+        "Dialogue: 0,0:00:03.00,0:00:04.00,Default,,0,0,0,,plain",
+    ]
+
+
+def test_export_json():
+    assert json.loads(main.export_timed(fixture_timed(), 'json'))['lines'] == [
+        {'kind': 'text', 'text': "[ti:Demo]"},
+        {'kind': 'lyric', 'text': "Hello world", 'start': 1000, 'end': 2000,
+         'tokens': [{'start': 1000, 'end': 1400, 'text': "Hello"},
+                    {'start': 1500, 'end': 2000, 'text': "world", 'pre': " "}]},
+        {'kind': 'translation', 'text': "你好世界", 'start': 1000, 'end': 2000, 'parent': 1},
+        {'kind': 'lyric', 'text': "plain", 'start': 3000, 'end': 4000},
+    ]